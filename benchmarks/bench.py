@@ -0,0 +1,300 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+# Benchmark pyhegp commands and core functions on synthetic cohorts,
+# and compare results against a baseline.
+#
+# Usage:
+#   python3 benchmarks/bench.py run --samples 1000 --snps 10000 -o results.json
+#   python3 benchmarks/bench.py compare baseline.json results.json
+#
+# Every benchmark runs in a fresh process so that its peak resident
+# set size (RSS) may be measured on its own. Command timings include
+# interpreter startup.
+
+import json
+import math
+import os
+from pathlib import Path
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from pyhegp.parallel import parallelism
+from pyhegp.pyhegp import Stats, hegp_encrypt, pool_stats, random_key
+from pyhegp.serialization import read_genotype
+
+from synthetic import Cohort, write_synthetic_cohort
+
+# Benchmarks write their results to the file descriptor given in this
+# environment variable.
+RESULT_FD_VARIABLE = "PYHEGP_BENCHMARK_RESULT_FD"
+
+def key_blocks(number_of_samples):
+    return math.ceil(number_of_samples / 1500)
+
+def command_benchmarks(cohorts, directory, chunk_size):
+    # Map benchmark names to pyhegp command lines.
+    return {"summary": ["summary", "--chunk-size", str(chunk_size),
+                        "-o", str(directory / "summary"),
+                        str(cohorts[0].genotype)],
+            "pool": ["pool", "--chunk-size", str(chunk_size),
+                     "-o", str(directory / "complete-summary"),
+                     *(str(cohort.summary) for cohort in cohorts)],
+            "encrypt": ["encrypt", "--force",
+                        "--chunk-size", str(chunk_size),
+                        "-s", str(cohorts[0].summary),
+                        str(cohorts[0].genotype),
+                        str(cohorts[0].phenotype)],
+            "cat-genotype": ["cat-genotype", "--chunk-size", str(chunk_size),
+                             "-o", str(directory / "complete-genotype"),
+                             *(str(cohort.genotype) for cohort in cohorts)]}
+
+def plaintext_chunks(rng, number_of_samples, number_of_snps, chunk_size):
+    # Yield plaintext matrices of samples × at most chunk_size SNPs.
+    # Like synthetic cohorts, plaintexts are generated a chunk at a
+    # time so that any number of SNPs fits in memory.
+    for start in range(0, number_of_snps, chunk_size):
+        yield rng.standard_normal((number_of_samples,
+                                   min(chunk_size, number_of_snps - start)))
+
+def function_benchmark(name, cohort, number_of_samples, number_of_snps,
+                       chunk_size):
+    # Set up the benchmark, and return a function that runs it. If the
+    # function does more than the benchmark—say, generate its
+    # input—it returns the time spent on the benchmark alone.
+    rng = np.random.default_rng(0)
+    match name:
+        case "hegp_encrypt":
+            key = random_key(rng, number_of_samples,
+                             key_blocks(number_of_samples), sampler="qr")
+            def run():
+                seconds = 0
+                for plaintext in plaintext_chunks(rng, number_of_samples,
+                                                  number_of_snps, chunk_size):
+                    start = time.perf_counter()
+                    hegp_encrypt(plaintext, key)
+                    seconds += time.perf_counter() - start
+                return seconds
+            return run
+        case "pool_stats":
+            list_of_stats = [Stats(number_of_samples,
+                                   rng.uniform(0, 2, number_of_snps),
+                                   rng.uniform(0, 1, number_of_snps))
+                             for _ in range(10)]
+            def run():
+                pool_stats(list_of_stats)
+            return run
+        case "read_genotype":
+            def run():
+                with cohort.genotype.open("rb") as file:
+                    read_genotype(file)
+            return run
+        case "random_key":
+            def run():
+                random_key(rng, number_of_samples,
+                           key_blocks(number_of_samples), sampler="qr")
+            return run
+        case _:
+            raise ValueError(f"Unknown benchmark {name}")
+
+FUNCTION_BENCHMARKS = ["hegp_encrypt", "pool_stats", "read_genotype",
+                       "random_key"]
+
+def peak_rss_bytes(rusage):
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+    return rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+def run_process(args, environment):
+    # Run a process, and return its wall time in seconds, its peak RSS
+    # in bytes and whatever it reports on the result file descriptor.
+    read_fd, write_fd = os.pipe()
+    start = time.perf_counter()
+    process = subprocess.Popen(args,
+                               stdout=subprocess.DEVNULL,
+                               pass_fds=(write_fd,),
+                               env=environment | {RESULT_FD_VARIABLE: str(write_fd)})
+    os.close(write_fd)
+    with os.fdopen(read_fd) as result_file:
+        result = result_file.read()
+    # Wait with wait4 to get the resource usage of this process alone.
+    _, status, rusage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark failed: {' '.join(args)}")
+    return seconds, peak_rss_bytes(rusage), result
+
+def environment():
+    # Let subprocesses import pyhegp from this source tree.
+    root = str(Path(__file__).resolve().parent.parent)
+    return os.environ | {"PYTHONPATH": os.pathsep.join(
+        [root] + ([os.environ["PYTHONPATH"]]
+                  if "PYTHONPATH" in os.environ
+                  else []))}
+
+def metadata():
+    return {"python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count()}
+
+def result_key(result):
+    return (result["benchmark"], result["samples"], result["snps"],
+            result["jobs"])
+
+@click.group()
+def main():
+    pass
+
+@main.command("run")
+@click.option("--samples", "sample_sizes", type=click.IntRange(min=2),
+              multiple=True, default=[1000], show_default=True,
+              help="Number of samples (may be repeated)")
+@click.option("--snps", "snp_sizes", type=click.IntRange(min=1),
+              multiple=True, default=[10000], show_default=True,
+              help="Number of SNPs (may be repeated)")
+@click.option("--jobs", "jobs_list", type=click.IntRange(min=1),
+              multiple=True, default=[1], show_default=True,
+              help="Number of parallel workers (may be repeated)")
+@click.option("--cohorts", "number_of_cohorts", type=click.IntRange(min=1),
+              default=2, show_default=True,
+              help="Number of cohorts to pool and concatenate")
+@click.option("--format", type=click.Choice(["tsv", "binary"]), default="tsv",
+              show_default=True, help="Genotype file format")
+@click.option("--chunk-size", type=click.IntRange(min=1), default=10000,
+              show_default=True, help="Chunk size passed to commands")
+@click.option("--benchmark", "benchmarks", multiple=True,
+              help="Run only this benchmark (may be repeated)")
+@click.option("--repeat", "repetitions", type=click.IntRange(min=1), default=1,
+              show_default=True,
+              help="Report the best of this many runs")
+@click.option("--output", "-o", "output_file", type=click.File("w"),
+              default="-", help="Output JSON file")
+def run_command(sample_sizes, snp_sizes, jobs_list, number_of_cohorts, format,
+                chunk_size, benchmarks, repetitions, output_file):
+    results = []
+    for number_of_samples in sample_sizes:
+        for number_of_snps in snp_sizes:
+            with tempfile.TemporaryDirectory() as directory:
+                directory = Path(directory)
+                cohorts = [write_synthetic_cohort(directory / f"cohort{seed}",
+                                                  seed,
+                                                  number_of_samples,
+                                                  number_of_snps,
+                                                  format)
+                           for seed in range(number_of_cohorts)]
+                commands = command_benchmarks(cohorts, directory, chunk_size)
+                for jobs in jobs_list:
+                    for name in commands | dict.fromkeys(FUNCTION_BENCHMARKS):
+                        if benchmarks and name not in benchmarks:
+                            continue
+                        if name in commands:
+                            kind = "command"
+                            args = [sys.executable, "-m", "pyhegp.pyhegp",
+                                    "--jobs", str(jobs), *commands[name]]
+                        else:
+                            kind = "function"
+                            args = [sys.executable, __file__, "function", name,
+                                    "--samples", str(number_of_samples),
+                                    "--snps", str(number_of_snps),
+                                    "--jobs", str(jobs),
+                                    "--chunk-size", str(chunk_size),
+                                    "--genotype", str(cohorts[0].genotype)]
+                        runs = [run_process(args, environment())
+                                for _ in range(repetitions)]
+                        # Functions report their own time, excluding
+                        # setup.
+                        seconds = min(float(result) if result else seconds
+                                      for seconds, _, result in runs)
+                        results.append(
+                            {"benchmark": name,
+                             "kind": kind,
+                             "samples": number_of_samples,
+                             "snps": number_of_snps,
+                             "jobs": jobs,
+                             "seconds": seconds,
+                             "snps_per_second": (None
+                                                 if name == "random_key"
+                                                 else number_of_snps / seconds),
+                             "peak_rss_bytes": max(rss for _, rss, _ in runs)})
+                        print(f"{name}\t{number_of_samples}\t{number_of_snps}"
+                              f"\t{jobs}\t{seconds:.3f}",
+                              file=sys.stderr)
+    json.dump({"metadata": metadata(), "results": results},
+              output_file, indent=2)
+    output_file.write("\n")
+
+@main.command("function", hidden=True)
+@click.argument("name")
+@click.option("--samples", "number_of_samples", type=click.INT, required=True)
+@click.option("--snps", "number_of_snps", type=click.INT, required=True)
+@click.option("--jobs", type=click.INT, required=True)
+@click.option("--chunk-size", type=click.INT, required=True)
+@click.option("--genotype", type=click.Path(path_type=Path), required=True)
+def function_command(name, number_of_samples, number_of_snps, jobs, chunk_size,
+                     genotype):
+    # Run one function benchmark, and report its time on the result
+    # file descriptor.
+    run = function_benchmark(name, Cohort(genotype, None, None),
+                             number_of_samples, number_of_snps, chunk_size)
+    with parallelism(jobs):
+        start = time.perf_counter()
+        seconds = run()
+        if seconds is None:
+            seconds = time.perf_counter() - start
+    with os.fdopen(int(os.environ[RESULT_FD_VARIABLE]), "w") as result_file:
+        result_file.write(str(seconds))
+
+@main.command("compare")
+@click.option("--tolerance", type=click.FloatRange(min=0), default=0.1,
+              show_default=True,
+              help="Allowed relative increase in time and peak memory")
+@click.argument("baseline-file", type=click.File("r"))
+@click.argument("results-file", type=click.File("r"))
+def compare_command(tolerance, baseline_file, results_file):
+    # Print how results compare to the baseline, and exit with a
+    # non-zero status if any benchmark regressed.
+    baseline = {result_key(result): result
+                for result in json.load(baseline_file)["results"]}
+    regressed = False
+    print("benchmark\tsamples\tsnps\tjobs\ttime ratio\tmemory ratio")
+    for result in json.load(results_file)["results"]:
+        if result_key(result) not in baseline:
+            continue
+        expected = baseline[result_key(result)]
+        time_ratio = result["seconds"] / expected["seconds"]
+        memory_ratio = result["peak_rss_bytes"] / expected["peak_rss_bytes"]
+        flag = ""
+        if time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance:
+            regressed = True
+            flag = "\tREGRESSED"
+        print(f"{result['benchmark']}\t{result['samples']}\t{result['snps']}"
+              f"\t{result['jobs']}\t{time_ratio:.2f}\t{memory_ratio:.2f}{flag}")
+    if regressed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+# Compare the rotation samplers used to generate random keys.
+#
+# Usage: python3 benchmarks/random_key.py --size 10000 --workers 4
+
+import time
+
+import click
+import numpy as np
+
+from pyhegp.pyhegp import random_key, rotation_samplers
+
+@click.command()
+@click.option("--size", "sizes", type=click.IntRange(min=2), multiple=True,
+              default=[1500, 6000, 15000], show_default=True,
+              help="Number of samples (may be repeated)")
+@click.option("--block-size", type=click.IntRange(min=2), default=1500,
+              show_default=True,
+              help="Target size of key blocks")
+@click.option("--workers", "workers_list", type=click.IntRange(min=1),
+              multiple=True, default=[1], show_default=True,
+              help="Number of worker processes (may be repeated)")
+@click.option("--repeat", "repetitions", type=click.IntRange(min=1), default=3,
+              show_default=True,
+              help="Report the best of this many runs")
+def main(sizes, block_size, workers_list, repetitions):
+    print("sampler\tsize\tblocks\tworkers\tseconds")
+    for size in sizes:
+        number_of_blocks = max(1, -(-size // block_size))
+        for number_of_workers in workers_list:
+            for sampler in rotation_samplers:
+                def run():
+                    start = time.perf_counter()
+                    random_key(np.random.default_rng(0), size, number_of_blocks,
+                               sampler=sampler,
+                               number_of_workers=number_of_workers)
+                    return time.perf_counter() - start
+                seconds = min(run() for _ in range(repetitions))
+                print(f"{sampler}\t{size}\t{number_of_blocks}\t{number_of_workers}\t{seconds:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+# Generate deterministic synthetic cohorts—genotype, phenotype and
+# summary files—for benchmarks. The same seed and sizes always
+# produce the same files. Genotypes are generated and written a chunk
+# at a time, so cohorts of any number of SNPs may be generated in
+# constant memory.
+#
+# Usage: python3 benchmarks/synthetic.py --samples 1000 --snps 10000 -o cohort
+
+from collections import namedtuple
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+
+from pyhegp.pyhegp import genotype_summary
+from pyhegp.serialization import write_genotype_chunks, write_phenotype, write_summary_chunks
+
+# Chromosomes are in natural order, as in most real genotype files.
+CHROMOSOMES = np.array([f"chr{i}" for i in range(1, 23)])
+REFERENCES = np.array(["A", "C", "G", "T"])
+
+Cohort = namedtuple("Cohort", "genotype phenotype summary")
+
+def sample_names(seed, number_of_samples):
+    # Sample names differ between cohorts so that their ciphertexts
+    # may be concatenated.
+    return [f"cohort{seed}-sample{i}" for i in range(number_of_samples)]
+
+def synthetic_genotype_chunks(seed, number_of_samples, number_of_snps,
+                              chunk_size=10000, reference_present=True):
+    # SNPs are spread evenly over the chromosomes, and positions are
+    # the same in all cohorts so that cohorts share all their
+    # SNPs. Dosages are drawn from a binomial distribution with a
+    # random allele frequency for each SNP.
+    rng = np.random.default_rng(seed)
+    names = sample_names(seed, number_of_samples)
+    for start in range(0, max(number_of_snps, 1), chunk_size):
+        snps = np.arange(start, min(start + chunk_size, number_of_snps))
+        frequencies = rng.uniform(0.05, 0.5, size=len(snps))
+        dosages = rng.binomial(2, frequencies[:, np.newaxis],
+                               size=(len(snps), number_of_samples))
+        yield pd.concat((pd.DataFrame(
+                             {"chromosome": pd.Series(
+                                 CHROMOSOMES[snps*len(CHROMOSOMES)
+                                             // max(number_of_snps, 1)],
+                                 dtype="str"),
+                              "position": 100*snps + 1}
+                             | ({"reference": pd.Series(
+                                     REFERENCES[snps % len(REFERENCES)],
+                                     dtype="str")}
+                                if reference_present
+                                else {})),
+                         pd.DataFrame(dosages.astype("float64"),
+                                      columns=names)),
+                        axis="columns")
+
+def synthetic_phenotype(seed, number_of_samples, number_of_phenotypes=2):
+    rng = np.random.default_rng(seed)
+    return pd.concat((pd.DataFrame({"sample-id": pd.Series(
+                                        sample_names(seed, number_of_samples),
+                                        dtype="str")}),
+                      pd.DataFrame(rng.standard_normal((number_of_samples,
+                                                        number_of_phenotypes)),
+                                   columns=[f"phenotype{i}"
+                                            for i in range(number_of_phenotypes)])),
+                     axis="columns")
+
+def write_synthetic_cohort(directory, seed, number_of_samples, number_of_snps,
+                           format="tsv"):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    cohort = Cohort(directory / ("genotype.hgb" if format == "binary"
+                                 else "genotype.tsv"),
+                    directory / "phenotype.tsv",
+                    directory / "summary")
+    with cohort.genotype.open("wb") as file:
+        write_genotype_chunks(file,
+                              synthetic_genotype_chunks(seed,
+                                                        number_of_samples,
+                                                        number_of_snps),
+                              format)
+    with cohort.summary.open("wb") as file:
+        write_summary_chunks(file,
+                             number_of_samples,
+                             (genotype_summary(chunk).data
+                              for chunk in synthetic_genotype_chunks(
+                                      seed, number_of_samples, number_of_snps)))
+    with cohort.phenotype.open("wb") as file:
+        write_phenotype(file, synthetic_phenotype(seed, number_of_samples))
+    return cohort
+
+@click.command()
+@click.option("--samples", "number_of_samples", type=click.IntRange(min=1),
+              default=1000, show_default=True, help="Number of samples")
+@click.option("--snps", "number_of_snps", type=click.IntRange(min=0),
+              default=10000, show_default=True, help="Number of SNPs")
+@click.option("--seed", type=click.INT, default=0, show_default=True,
+              help="Random seed")
+@click.option("--format", type=click.Choice(["tsv", "binary"]), default="tsv",
+              show_default=True, help="Genotype file format")
+@click.option("--output", "-o", "directory", type=click.Path(file_okay=False),
+              required=True, help="Output directory")
+def main(number_of_samples, number_of_snps, seed, format, directory):
+    write_synthetic_cohort(directory, seed, number_of_samples, number_of_snps,
+                           format)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+# Blocked gzip (BGZF), as used by htslib. A BGZF file is a series of
+# independently compressed gzip members, called blocks, of at most
+# 64 KiB each. Any gzip reader can read it. But, because blocks are
+# independent, they may be compressed in parallel, and reading may
+# start at any block. A position in the uncompressed data is given
+# by a virtual offset—the offset of its block in the compressed file
+# shifted left by 16 bits, plus its offset within the uncompressed
+# block.
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import struct
+import zlib
+
+from pyhegp.parallel import workers
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Uncompressed bytes per block. This is what htslib uses; it leaves
+# room for incompressible data to still fit in a block.
+BLOCK_DATA_SIZE = 0xff00
+
+COMPRESSION_LEVEL = 6
+
+# Gzip member header with a BC extra subfield holding the total block
+# size minus 1
+BLOCK_HEADER = struct.Struct("<4BI2BH2BHH")
+
+# The empty block that marks the end of a BGZF file
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+def compress_block(data):
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    block_size = BLOCK_HEADER.size + len(deflated) + 8
+    return (BLOCK_HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6,
+                              ord("B"), ord("C"), 2, block_size - 1)
+            + deflated
+            + struct.pack("<II", zlib.crc32(data), len(data)))
+
+def blocks(data_chunks):
+    # Cut a stream of byte strings into blocks of exactly
+    # BLOCK_DATA_SIZE bytes, except for the last one. Since all but
+    # the last block are the same size, the block of any uncompressed
+    # offset is easy to find.
+    pending = b""
+    for data in data_chunks:
+        data = pending + data
+        end = len(data) - len(data) % BLOCK_DATA_SIZE
+        for start in range(0, end, BLOCK_DATA_SIZE):
+            yield data[start:start+BLOCK_DATA_SIZE]
+        pending = data[end:]
+    if pending:
+        yield pending
+
+def write_bgzf(file, data_chunks, number_of_workers=None):
+    # Write the concatenation of data_chunks to file as BGZF, and
+    # return the offset in file of every block. zlib releases the GIL.
+    # So, with many workers, compress blocks in parallel threads, a
+    # bounded batch at a time.
+    number_of_workers = number_of_workers or workers()
+    block_offsets = []
+    offset = 0
+    def write_blocks(compressed_blocks):
+        nonlocal offset
+        for compressed_block in compressed_blocks:
+            block_offsets.append(offset)
+            offset += file.write(compressed_block)
+
+    uncompressed_blocks = blocks(data_chunks)
+    if number_of_workers > 1:
+        with ThreadPoolExecutor(number_of_workers) as executor:
+            while batch := list(islice(uncompressed_blocks,
+                                       4*number_of_workers)):
+                write_blocks(executor.map(compress_block, batch))
+    else:
+        write_blocks(map(compress_block, uncompressed_blocks))
+    file.write(EOF_BLOCK)
+    return block_offsets
+
+def virtual_offset(block_offsets, uncompressed_offset):
+    # Virtual offset of an offset in the uncompressed data written by
+    # write_bgzf
+    block, within_block = divmod(uncompressed_offset, BLOCK_DATA_SIZE)
+    return (block_offsets[block] << 16) | within_block
+
+def read_block(file, offset):
+    # Read the block at offset in file. Return its uncompressed data
+    # and the offset of the next block, or None at the end of file.
+    file.seek(offset)
+    header = file.read(BLOCK_HEADER.size)
+    if len(header) < BLOCK_HEADER.size:
+        return None
+    *_, block_size = BLOCK_HEADER.unpack(header)
+    deflated = file.read(block_size + 1 - BLOCK_HEADER.size - 8)
+    return (zlib.decompress(deflated, -15),
+            offset + block_size + 1)
+
+def read_lines(file, start):
+    # Yield lines of the uncompressed data of file starting from the
+    # virtual offset start. Only the blocks that are needed are read.
+    offset, within_block = start >> 16, start & 0xffff
+    pending = b""
+    while (block := read_block(file, offset)) is not None:
+        data, offset = block
+        lines = (pending + data[within_block:]).split(b"\n")
+        within_block = 0
+        pending = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+    if pending:
+        yield pending
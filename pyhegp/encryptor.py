@@ -0,0 +1,120 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+# An encryptor encrypts genotypes in memory with a key and a summary
+# that are fixed when it is made. Everything that depends only on the
+# key and the summary—the index of SNPs in the summary, their means and
+# inverse standard deviations, and the blocks of the key—is computed
+# then, and never again. So, a program may encrypt any number of
+# batches, however small, with no setup cost per batch. Encryptors
+# need no files, and match SNPs by looking them up in an index rather
+# than by merging data frames.
+
+from collections import namedtuple
+
+from pyhegp.linalg import BlockDiagonalMatrix, to_block_diagonal_matrix
+from pyhegp.pyhegp import dosage_blocks, drop_metadata_columns, drop_zero_stddev_snps, materialize_key, snp_key_index, summary_index
+from pyhegp.utils import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# Result of encrypting a chunk of dosages. selected is a boolean array
+# of which SNPs (rows) of the chunk were encrypted, and dosages are
+# their encrypted dosages.
+EncryptedChunk = namedtuple("EncryptedChunk", "selected dosages")
+
+class Encryptor:
+    def __init__(self, key, summary, only_center=False):
+        # key may be a matrix, a block diagonal matrix or a key
+        # seed. As with the encrypt command, SNPs with a zero standard
+        # deviation are dropped from summary, unless only centering.
+        # Dense keys are split into their blocks, as when read from a
+        # key file, so that only the blocks are multiplied.
+        key = materialize_key(key)
+        self.key = (key
+                    if isinstance(key, BlockDiagonalMatrix)
+                    else to_block_diagonal_matrix(np.asarray(key)))
+        self.only_center = only_center
+        self.summary = summary if only_center else drop_zero_stddev_snps(summary)
+        data = self.summary.data
+        self.snp_index = summary_index(self.summary)
+        self.mean = data["mean"].to_numpy(dtype="float64")
+        # Multiply by the inverse, rather than divide by the standard
+        # deviation, in every batch. Only centering, the inverse of a
+        # zero standard deviation is never used.
+        with np.errstate(divide="ignore"):
+            self.inverse_std = 1 / data["std"].to_numpy(dtype="float64")
+
+    def __repr__(self):
+        return (f"Encryptor({len(self.key)} samples,"
+                f" {len(self.snp_index)} SNPs)")
+
+    def snp_indices(self, snp_keys):
+        # Return the index in the summary of each SNP in snp_keys, or
+        # -1 for SNPs not in the summary. snp_keys is a data frame
+        # with chromosome and position columns, or a sequence of
+        # (chromosome, position) pairs.
+        if isinstance(snp_keys, pd.DataFrame):
+            return self.snp_index.get_indexer(snp_key_index(snp_keys))
+        snp_keys = list(snp_keys)
+        chromosomes = np.array([chromosome for chromosome, _ in snp_keys],
+                               dtype="object")
+        positions = np.array([position for _, position in snp_keys],
+                             dtype="int64")
+        return self.snp_index.get_indexer(
+            pd.MultiIndex.from_arrays([chromosomes, positions]))
+
+    def encrypt_chunk(self, dosages, snp_keys):
+        # Encrypt a matrix of dosages of SNPs (rows) by samples
+        # (columns), with samples in the order of the key. snp_keys
+        # identifies the SNP of each row, as for snp_indices. SNPs not
+        # in the summary are dropped. Return an EncryptedChunk. dosages
+        # is left as it is.
+        dosages = np.asarray(dosages)
+        if dosages.ndim != 2 or dosages.shape[1] != len(self.key):
+            raise ValueError(f"Dosages must be of {len(self.key)} samples")
+        indices = self.snp_indices(snp_keys)
+        if len(indices) != len(dosages):
+            raise ValueError("There must be one SNP key per row of dosages")
+        selected = indices >= 0
+        indices = indices[selected]
+        # Indexing with a boolean array copies. So, blocks widened
+        # from float64 dosages may be standardized in place.
+        dosages = dosages[selected]
+        ciphertext = np.empty(dosages.shape)
+        for rows, block in dosage_blocks(dosages):
+            np.subtract(block, self.mean[indices[rows], np.newaxis], out=block)
+            if not self.only_center:
+                np.multiply(block, self.inverse_std[indices[rows], np.newaxis],
+                            out=block)
+            self.key.matmul(block.T, out=ciphertext[rows].T)
+        return EncryptedChunk(selected, ciphertext)
+
+    def encrypt_frame(self, genotype):
+        # Encrypt a genotype data frame like the encrypt command
+        # does. Return the ciphertext data frame.
+        sample_names = drop_metadata_columns(genotype).columns
+        selected, ciphertext = self.encrypt_chunk(
+            genotype[sample_names].to_numpy(), genotype)
+        return pd.concat((genotype.loc[selected, ["chromosome", "position"]]
+                          .reset_index(drop=True),
+                          pd.DataFrame(ciphertext,
+                                       columns=sample_names,
+                                       copy=False)),
+                         axis="columns")
@@ -0,0 +1,168 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+from pyhegp.utils import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+def inner_join(frames, keys):
+    # Restrict frames to the rows whose keys are present in all
+    # frames, and align them to the order of the first frame. Unlike a
+    # chain of pairwise merges, this hashes the keys of each frame only
+    # once and never copies a growing intermediate. Keys need not be
+    # unique, but keys present in all frames must be unique in all but
+    # the first frame.
+    indexes = [pd.MultiIndex.from_frame(frame[keys]) for frame in frames]
+    common = np.ones(len(indexes[0]), dtype=bool)
+    for index in indexes[1:]:
+        common &= indexes[0].isin(index)
+    common_keys = indexes[0][common]
+    def align(frame, index):
+        in_common = index.isin(common_keys)
+        if index[in_common].has_duplicates:
+            raise ValueError("Duplicate keys in input")
+        return (frame[in_common]
+                .iloc[index[in_common].get_indexer(common_keys)]
+                .reset_index(drop=True))
+    return ([frames[0][common].reset_index(drop=True)]
+            + [align(frame, index)
+               for frame, index in zip(frames[1:], indexes[1:])])
+
+# Streaming joins require inputs sorted by chromosome and then by
+# position, compared as numbers. Chromosomes may be in any order—say,
+# natural (chr1, chr2, ..., chr10) or as strings (chr1, chr10, chr2,
+# ...)—so long as every input lists them in the same order, and lists
+# all SNPs of a chromosome together. Chromosomes are ranked in the
+# order they first appear in the first input. Rows of chromosomes
+# missing from the first input cannot join, and are dropped. Finding
+# them missing reads the rest of the first input into memory, so the
+# first input should have every chromosome.
+
+def chromosome_ranks(ranks, chromosomes):
+    # Return the ranks of chromosomes in ranks, a dictionary mapping
+    # chromosomes to ranks. Rank chromosomes not in ranks after all
+    # others, and add them to ranks.
+    for chromosome in pd.unique(chromosomes):
+        ranks.setdefault(chromosome, len(ranks))
+    return pd.Index(list(ranks), dtype=object).get_indexer(chromosomes)
+
+def precedes(ranks1, positions1, rank2, position2):
+    # Element-wise, does (rank1, position1) come strictly before
+    # (rank2, position2)?
+    return ((ranks1 < rank2)
+            | ((ranks1 == rank2) & (positions1 < position2)))
+
+def is_sorted(ranks, positions):
+    # Are (rank, position) keys in order? SNPs with several
+    # alternative alleles may share a chromosome and position.
+    return not np.any(precedes(ranks[1:], positions[1:],
+                               ranks[:-1], positions[:-1]))
+
+def merge_join_chunks(inputs, keys):
+    # Inner join inputs, each an iterator over data frame chunks
+    # sorted by (chromosome, position), and yield lists of aligned
+    # chunks, one chunk from each input. If every input has at least
+    # one chunk, at least one list is yielded so that callers can see
+    # the columns of every input; if the join is empty, that list is
+    # of empty chunks. Only a little more
+    # than one chunk of each input is held in memory at a time.
+    #
+    # Every input has all its rows before the last key in its buffer.
+    # So, rows up to the smallest of these last keys may be joined
+    # right away, once we have read ahead past any rows that share
+    # that key. The buffer that supplied the smallest last key is
+    # then exhausted, and we read the next chunk into it.
+    inputs = [iter(input) for input in inputs]
+    buffers = [None] * len(inputs)
+    # Ranks of the chromosomes of each buffer
+    buffer_ranks = [None] * len(inputs)
+    exhausted = [False] * len(inputs)
+    ranks = {}
+    # Rank and position of the last row read from each input, as
+    # arrays of at most one element
+    last_keys = [(np.empty(0, dtype=np.intp), np.empty(0, dtype="int64"))
+                 for input in inputs]
+    def last_key(i):
+        return (buffer_ranks[i][-1], buffers[i].position.iloc[-1])
+    def extend(i):
+        # Read the next chunk of input i into its buffer. Return False
+        # if there are no more chunks.
+        chunk = next(inputs[i], None)
+        if chunk is None:
+            exhausted[i] = True
+            return False
+        chromosomes = chunk.chromosome.to_numpy(dtype=object)
+        # Read the first input ahead until it ranks the chromosomes of
+        # this chunk, or runs out.
+        while (i > 0
+               and not exhausted[0]
+               and not ranks.keys() >= set(pd.unique(chromosomes))):
+            extend(0)
+        if i > 0 and exhausted[0]:
+            chunk = (chunk[chunk.chromosome.isin(list(ranks))]
+                     .reset_index(drop=True))
+            chromosomes = chunk.chromosome.to_numpy(dtype=object)
+        chunk_ranks = chromosome_ranks(ranks, chromosomes)
+        chunk_positions = chunk.position.to_numpy()
+        # Compare with the last row read too, so that no chromosome
+        # reappears after the rows before it have been joined.
+        if not is_sorted(np.concatenate((last_keys[i][0], chunk_ranks)),
+                         np.concatenate((last_keys[i][1], chunk_positions))):
+            raise ValueError("Input is not sorted by chromosome and position,"
+                             " or its chromosomes are in a different order")
+        if len(chunk) > 0:
+            last_keys[i] = (chunk_ranks[-1:], chunk_positions[-1:])
+        if buffers[i] is None:
+            buffers[i] = chunk
+            buffer_ranks[i] = chunk_ranks
+        else:
+            buffers[i] = pd.concat((buffers[i], chunk), ignore_index=True)
+            buffer_ranks[i] = np.concatenate((buffer_ranks[i], chunk_ranks))
+        return True
+
+    empty = True
+    while True:
+        for i in range(len(inputs)):
+            while buffers[i] is None or len(buffers[i]) == 0:
+                if not extend(i):
+                    if empty:
+                        # Inputs after this one may not have been read
+                        # yet. Read their first chunk for their
+                        # columns.
+                        for j in range(len(inputs)):
+                            if buffers[j] is None:
+                                extend(j)
+                        if all(buffer is not None for buffer in buffers):
+                            yield [buffer.iloc[:0] for buffer in buffers]
+                    return
+        key = min(last_key(i) for i in range(len(inputs)))
+        for i in range(len(inputs)):
+            while not exhausted[i] and last_key(i) == key:
+                extend(i)
+        heads = []
+        for i, buffer in enumerate(buffers):
+            # Sorted rows up to key form a prefix of the buffer.
+            head_length = int(np.sum(~precedes(key[0], key[1],
+                                               buffer_ranks[i],
+                                               buffer.position.to_numpy())))
+            heads.append(buffer.iloc[:head_length])
+            buffers[i] = buffer.iloc[head_length:].reset_index(drop=True)
+            buffer_ranks[i] = buffer_ranks[i][head_length:]
+        empty = False
+        yield inner_join(heads, keys)
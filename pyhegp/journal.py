@@ -0,0 +1,197 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+# Encryption journals record the progress of encrypting a genotype a
+# chunk at a time, so that an interrupted encryption may be resumed
+# from its last complete chunk. A journal sits next to its ciphertext.
+# Its header identifies the encryption—the key, the summary, the
+# genotype and the options it was run with—and holds a checkpoint
+# that is rewritten in place after every chunk. Its body lists the
+# chromosome and position of every SNP written so far; binary
+# ciphertexts write these only at the end. Once the ciphertext is
+# complete, the journal is marked complete and its body dropped. It
+# is kept so that resuming can tell what the ciphertext was encrypted
+# with.
+
+from collections import namedtuple
+import hashlib
+import io
+from pathlib import Path
+
+from pyhegp.serialization import finish_binary_genotype, is_genotype_metadata_column, open_binary_genotype, read_headers, start_binary_genotype, text_array, write_binary_genotype_dosages, write_headers, write_tsv
+from pyhegp.utils import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+JOURNAL_HEADER = b"# pyhegp encryption journal version 1\n"
+
+JOURNAL_EXTENSION = ".journal"
+
+# Ciphertext formats that may be resumed. Compressed ciphertexts
+# cannot be, since a chunk may end in the middle of a compressed
+# block.
+RESUMABLE_FORMATS = ["tsv", "binary"]
+
+# Progress of an encryption after some number of complete chunks.
+# snps_read is the number of SNPs read from the genotype, and
+# snps_written the number of those written to the ciphertext.
+# ciphertext_bytes and journal_bytes are the sizes of the ciphertext
+# and the journal; anything after them is from an incomplete chunk.
+Checkpoint = namedtuple("Checkpoint",
+                        "chunks snps_read snps_written ciphertext_bytes journal_bytes")
+
+CHECKPOINT_KEYS = [field.replace("_", "-") for field in Checkpoint._fields]
+
+def journal_path(path):
+    return Path(str(path) + JOURNAL_EXTENSION)
+
+def fingerprint(arrays):
+    hash = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        hash.update(f"{array.dtype.str} {array.shape}\n".encode("ascii"))
+        hash.update(array)
+    return hash.hexdigest()
+
+def encryption_identity(key, summary, only_center, chunk_size, sharded):
+    # Identify an encryption by everything that determines its
+    # ciphertexts and the chunks they are written in. A journal may
+    # only be resumed by an encryption of the same identity. Only a
+    # fingerprint of the key is recorded, never the key itself.
+    return {"key-fingerprint": fingerprint(key.blocks),
+            "summary-fingerprint": fingerprint(
+                [np.array([summary.n]),
+                 pd.util.hash_pandas_object(summary.data,
+                                            index=False).to_numpy()]),
+            "only-center": str(int(only_center)),
+            "chunk-size": str(chunk_size),
+            "sharded": str(int(sharded))}
+
+def genotype_identity(identity, path, format):
+    # Identify the encryption of the genotype at path to a ciphertext
+    # of format. The genotype is identified by its size and
+    # modification time rather than by a hash of its contents, which
+    # would mean reading all of it.
+    stat = Path(path).stat()
+    return identity | {"genotype-fingerprint": f"{stat.st_size}:{stat.st_mtime_ns}",
+                       "format": format}
+
+def write_journal_headers(file, identity, checkpoint, complete=False):
+    # Checkpoint numbers are padded to a fixed width so that the
+    # header may be rewritten in place. Return the size of the header.
+    file.seek(0)
+    size = write_headers(file, JOURNAL_HEADER,
+                         identity
+                         | {key: f"{value:20d}"
+                            for key, value in zip(CHECKPOINT_KEYS, checkpoint)}
+                         | {"complete": str(int(complete))})
+    file.seek(0, io.SEEK_END)
+    return size
+
+def read_journal(file):
+    # Return the identity and the checkpoint of a journal, and whether
+    # its ciphertext is complete.
+    properties = read_headers(file, JOURNAL_HEADER)
+    complete = properties.pop("complete") == "1"
+    checkpoint = Checkpoint(*(int(properties.pop(key))
+                              for key in CHECKPOINT_KEYS))
+    return properties, checkpoint, complete
+
+def read_journal_snps(file, checkpoint):
+    # Read the SNPs written before checkpoint.
+    file.seek(0)
+    read_journal(file)
+    data = file.read(checkpoint.journal_bytes - file.tell())
+    if not data:
+        return pd.DataFrame({"chromosome": pd.Series([], dtype="str"),
+                             "position": pd.Series([], dtype="int64")})
+    return pd.read_csv(io.BytesIO(data), sep="\t", header=None,
+                       names=["chromosome", "position"],
+                       dtype={"chromosome": "str", "position": "int64"})
+
+def write_journaled_genotype_chunks(file, journal, counted_chunks, format,
+                                    identity, checkpoint=None):
+    # Write encrypted chunks from (number of SNPs read, encrypted
+    # chunk) pairs to file, and record progress in journal after
+    # every chunk. If checkpoint is given, the chunks continue an
+    # encryption interrupted after checkpoint; discard anything
+    # written after it, and append to the rest. Return the number of
+    # SNPs read and the number of SNPs written, including those before
+    # checkpoint.
+    if format not in RESUMABLE_FORMATS:
+        raise ValueError(f"Cannot journal {format} genotype files")
+    if checkpoint is None or checkpoint.chunks == 0:
+        file.seek(0)
+        journal.seek(0)
+        journal.truncate()
+        checkpoint = Checkpoint(0, 0, 0, 0,
+                                write_journal_headers(journal, identity,
+                                                      Checkpoint(0, 0, 0, 0, 0)))
+        sample_names = None
+        positions = []
+        chromosomes = []
+    else:
+        if format == "binary":
+            # Binary ciphertexts need the metadata of all SNPs at the
+            # end, including those written before checkpoint.
+            written_snps = read_journal_snps(journal, checkpoint)
+            positions = [written_snps.position.to_numpy(dtype="int64")]
+            chromosomes = [text_array(written_snps.chromosome)]
+            file.seek(0)
+            sample_names = open_binary_genotype(file).sample_names
+        journal.seek(checkpoint.journal_bytes)
+        journal.truncate()
+        file.seek(checkpoint.ciphertext_bytes)
+    file.truncate()
+    for snps, chunk in counted_chunks:
+        if format == "tsv":
+            write_tsv(file, chunk, header=(checkpoint.chunks == 0))
+        else:
+            if checkpoint.chunks == 0:
+                sample_names = [column
+                                for column in chunk.columns
+                                if not is_genotype_metadata_column(column)]
+                start_binary_genotype(file, sample_names, False)
+            write_binary_genotype_dosages(file, chunk, sample_names)
+            positions.append(chunk.position.to_numpy(dtype="int64"))
+            chromosomes.append(text_array(chunk.chromosome))
+        # Only record a chunk once it is out of our buffers, and
+        # record its SNPs before the checkpoint that counts them.
+        file.flush()
+        chunk[["chromosome", "position"]].to_csv(journal, sep="\t",
+                                                 header=False, index=False)
+        checkpoint = Checkpoint(checkpoint.chunks + 1,
+                                checkpoint.snps_read + snps,
+                                checkpoint.snps_written + len(chunk),
+                                file.tell(),
+                                journal.tell())
+        write_journal_headers(journal, identity, checkpoint)
+        journal.flush()
+    if format == "binary":
+        finish_binary_genotype(file, file.tell(), sample_names,
+                               np.concatenate(positions),
+                               np.concatenate(chromosomes),
+                               None)
+    # The ciphertext is complete. Its SNPs are no longer needed, but
+    # its identity is.
+    file.flush()
+    journal.seek(0)
+    journal.truncate()
+    write_journal_headers(journal, identity, checkpoint, complete=True)
+    return checkpoint.snps_read, checkpoint.snps_written
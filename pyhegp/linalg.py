@@ -16,15 +16,22 @@
 ### You should have received a copy of the GNU General Public License
 ### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
 
-import numpy as np
-
+from concurrent.futures import ThreadPoolExecutor
 from itertools import accumulate, pairwise
-from scipy.linalg import block_diag
+
+from pyhegp.parallel import blas_threads, workers
+from pyhegp.utils import lazy_import
+
+np = lazy_import("numpy")
 
 class BlockDiagonalMatrix:
     def __init__(self, _blocks):
         self.blocks = _blocks
         self.shape = (sum(len(block) for block in self.blocks),) * 2
+        # Every multiplication needs these. So, compute them only once.
+        self._block_offsets = list(pairwise(accumulate(
+            (len(block) for block in self.blocks),
+            initial=0)))
 
     def __len__(self):
         return self.shape[0]
@@ -41,16 +48,60 @@ class BlockDiagonalMatrix:
         else:
             return NotImplemented
 
-    def __array__(self):
-        return block_diag(*self.blocks)
+    def __array__(self, dtype=None, copy=None):
+        from scipy.linalg import block_diag
+        return block_diag(*self.blocks).astype(dtype, copy=False)
+
+    def block_offsets(self):
+        return self._block_offsets
+
+    def matmul(self, multiplier, out=None, number_of_workers=None):
+        # Multiply each block with its slice of multiplier, and write
+        # the product directly into its slice of out. Blocks are
+        # independent. So, when there are many workers, multiply
+        # blocks in parallel threads. BLAS releases the GIL.
+        if out is None:
+            out = np.empty((len(self), *np.shape(multiplier)[1:]),
+                           dtype=np.result_type(*self.blocks, multiplier))
+        def multiply_block(block, start, stop):
+            np.matmul(block, multiplier[start:stop, ...],
+                      out=out[start:stop, ...])
+
+        number_of_workers = min(number_of_workers or workers(),
+                                len(self.blocks))
+        if number_of_workers > 1:
+            with (blas_threads(number_of_workers),
+                  ThreadPoolExecutor(number_of_workers) as executor):
+                # Consume the iterator so that exceptions are raised.
+                list(executor.map(multiply_block,
+                                  self.blocks,
+                                  *zip(*self.block_offsets())))
+        else:
+            for block, (start, stop) in zip(self.blocks, self.block_offsets()):
+                multiply_block(block, start, stop)
+        return out
 
     def __matmul__(self, multiplier):
-        return np.concatenate(
-            [block @ multiplier[start:stop, ...]
-             for (start, stop), block
-             in zip(pairwise(accumulate((len(block) for block in self.blocks),
-                                        initial=0)),
-                    self.blocks)])
+        return self.matmul(multiplier)
 
     def savetxt(self, file, *args, **kwargs):
         return np.savetxt(file, self.to_ndarray(), *args, **kwargs)
+
+def to_block_diagonal_matrix(matrix):
+    # Find the finest block diagonal structure of a dense square
+    # matrix. A block ends at index i if no non-zero element links a
+    # row or column at or before i with a row or column after i.
+    n = len(matrix)
+    nonzero = np.asarray(matrix) != 0
+    indices = np.arange(n)
+    def last_nonzero(axis):
+        return np.where(nonzero.any(axis=axis),
+                        n - 1 - np.argmax(np.flip(nonzero, axis=axis),
+                                          axis=axis),
+                        indices)
+    reach = np.maximum.accumulate(np.maximum(last_nonzero(1),
+                                             last_nonzero(0)))
+    return BlockDiagonalMatrix(
+        [matrix[start:stop, start:stop]
+         for start, stop
+         in pairwise([0, *(np.flatnonzero(reach == indices) + 1)])])
@@ -0,0 +1,183 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar, copy_context
+from multiprocessing.shared_memory import SharedMemory
+import os
+import queue
+import threading
+
+from pyhegp.utils import lazy_import
+
+np = lazy_import("numpy")
+
+# Number of workers to use for parallel operations. The default of 1
+# leaves all parallelism to the BLAS library.
+_workers = ContextVar("workers", default=1)
+
+def workers():
+    return _workers.get()
+
+@contextmanager
+def parallelism(number_of_workers):
+    token = _workers.set(number_of_workers)
+    try:
+        yield
+    finally:
+        _workers.reset(token)
+
+def blas_threads(number_of_workers):
+    # Each of our workers may call into a multithreaded BLAS. Share the
+    # available cores between them so that we do not run more threads
+    # than there are cores. This needs threadpoolctl. If it is not
+    # available, leave BLAS alone.
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return nullcontext()
+    return threadpool_limits(
+        limits=max(1, (os.cpu_count() or 1) // number_of_workers),
+        user_api="blas")
+
+def parallel_map(function, iterable, number_of_workers=None,
+                 initializer=None, initargs=()):
+    # Like map, but call function in worker processes. Results are
+    # yielded in order. Unlike Executor.map, do not submit the whole
+    # of iterable at once; keep only a couple of tasks per worker in
+    # flight so that memory stays bounded however long iterable
+    # is. initializer is called with initargs once in each worker,
+    # or once in this process if there is only one worker.
+    number_of_workers = number_of_workers or workers()
+    if number_of_workers == 1:
+        if initializer:
+            initializer(*initargs)
+        yield from map(function, iterable)
+        return
+    with ProcessPoolExecutor(number_of_workers,
+                             initializer=initializer,
+                             initargs=initargs) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2*number_of_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# How often, in seconds, a blocked prefetch thread checks whether it
+# should stop
+PREFETCH_POLL_INTERVAL = 0.1
+
+def prefetch(iterable, depth):
+    # Like iter, but produce items of iterable in a background thread,
+    # up to depth items ahead of the consumer. NumPy, BLAS and file
+    # I/O release the GIL. So, producing items overlaps with consuming
+    # them, and a chain of prefetches is a pipeline that runs about as
+    # fast as its slowest stage. Exceptions are raised in the
+    # consumer. If depth is 0, produce items in the consumer's thread
+    # as needed, like iter.
+    if depth == 0:
+        yield from iterable
+        return
+    items = queue.Queue(depth)
+    stop = threading.Event()
+    def put(item):
+        # Give up if the consumer has gone away.
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=PREFETCH_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as error:
+            put((False, error))
+        finally:
+            # Let generators up the pipeline clean up in the thread
+            # that runs them.
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    # Run the thread in a copy of our context so that it sees the same
+    # number of workers and the same profile.
+    thread = threading.Thread(target=copy_context().run, args=(produce,),
+                              daemon=True)
+    thread.start()
+    try:
+        while True:
+            more, item = items.get()
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+# Arrays copied into a block of shared memory. name identifies the
+# block, and specs lists the offset, dtype and shape of each array in
+# it. This is all a worker process needs to attach to the arrays, and
+# is cheap to pickle.
+SharedArrays = namedtuple("SharedArrays", "name specs")
+
+# Offsets of arrays in shared memory are aligned to this many bytes.
+SHARED_ALIGNMENT = 64
+
+@contextmanager
+def shared_arrays(arrays):
+    # Copy arrays into a new block of shared memory, and yield a
+    # SharedArrays handle to it. The block is freed when the context
+    # exits. Worker processes must be done with it by then.
+    specs = []
+    size = 0
+    for array in arrays:
+        array = np.asarray(array)
+        specs.append((size, array.dtype.str, array.shape))
+        size += -(-array.nbytes // SHARED_ALIGNMENT) * SHARED_ALIGNMENT
+    shared_memory = SharedMemory(create=True, size=max(size, 1))
+    try:
+        for array, (offset, dtype, shape) in zip(arrays, specs):
+            np.ndarray(shape, dtype, buffer=shared_memory.buf,
+                       offset=offset)[...] = array
+        yield SharedArrays(shared_memory.name, specs)
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
+
+def attach_arrays(handle):
+    # Attach to arrays shared by shared_arrays, without copying
+    # them. Return the shared memory block along with the arrays; it
+    # must be kept alive as long as the arrays are in use. The arrays
+    # are read-only.
+    shared_memory = SharedMemory(handle.name)
+    arrays = [np.ndarray(shape, dtype, buffer=shared_memory.buf, offset=offset)
+              for offset, dtype, shape in handle.specs]
+    for array in arrays:
+        array.flags.writeable = False
+    return shared_memory, arrays
@@ -0,0 +1,117 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+
+# PLINK 1 binary genotypes. A .bed file holds genotype calls packed
+# two bits per sample, a SNP at a time, after a 3-byte header. SNP
+# metadata is in a .bim file, and sample IDs are in a .fam file, both
+# next to the .bed file and of the same name.
+
+from functools import lru_cache
+
+from pyhegp.utils import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+BED_MAGIC = b"\x6c\x1b"
+
+# The third byte of the header. Only SNP-major .bed files, where the
+# calls of each SNP are stored together, are supported. The ancient
+# sample-major files are not.
+SNP_MAJOR_MODE = 1
+
+BED_HEADER_SIZE = 3
+
+@lru_cache(maxsize=None)
+def dosage_table():
+    # Map every byte to the dosages of the 4 samples packed into it,
+    # lowest bits first. Dosages count copies of the first allele in
+    # the .bim file, as plink --recode A does. Missing calls are NaN.
+    # The table is built on first use, not when this module is loaded.
+    calls = np.array([2, np.nan, 1, 0])
+    return calls[(np.arange(256)[:, np.newaxis] >> np.arange(0, 8, 2)) & 3]
+
+def bytes_per_snp(number_of_samples):
+    return -(-number_of_samples // 4)
+
+def impute_missing(dosages):
+    # Replace missing dosages, in place, with the mean of the other
+    # dosages of the same SNP. SNPs with no calls at all are set to
+    # zero. Imputing the mean leaves the mean unchanged, and adds
+    # nothing to the variance.
+    missing = np.isnan(dosages)
+    if missing.any():
+        called = np.sum(~missing, axis=1)
+        means = (np.sum(np.where(missing, 0, dosages), axis=1)
+                 / np.maximum(called, 1))
+        rows, columns = np.nonzero(missing)
+        dosages[rows, columns] = means[rows]
+    return dosages
+
+def decode_dosages(packed, number_of_samples):
+    # Decode a matrix of packed SNPs, one per row, with a lookup
+    # rather than bit twiddling on every call.
+    return impute_missing(
+        np.ascontiguousarray(dosage_table()[packed]
+                             .reshape(len(packed), 4*packed.shape[1])
+                             [:, :number_of_samples]))
+
+class PackedDosages:
+    # The dosage matrix of a .bed file. Rows, selected by a slice or
+    # an index array, are decoded only when asked for. packed is
+    # usually memory-mapped. So, only the bytes of those rows are
+    # ever read.
+    def __init__(self, packed, number_of_samples):
+        self.packed = packed
+        self.number_of_samples = number_of_samples
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, rows):
+        return decode_dosages(self.packed[rows], self.number_of_samples)
+
+def read_bim(path):
+    # Return the chromosome, position, first allele and second allele
+    # columns of a .bim file.
+    if path.stat().st_size == 0:
+        return pd.DataFrame({"chromosome": pd.Series(dtype="str"),
+                             "position": pd.Series(dtype="int64"),
+                             "allele1": pd.Series(dtype="str"),
+                             "allele2": pd.Series(dtype="str")})
+    return pd.read_csv(path,
+                       sep=r"\s+",
+                       header=None,
+                       usecols=[0, 3, 4, 5],
+                       names=["chromosome", "id", "cm", "position",
+                              "allele1", "allele2"],
+                       dtype={"chromosome": "str",
+                              "position": "int64",
+                              "allele1": "str",
+                              "allele2": "str"},
+                       na_filter=False)
+
+def read_fam(path):
+    # Return the within-family sample IDs of a .fam file.
+    return pd.read_csv(path,
+                       sep=r"\s+",
+                       header=None,
+                       usecols=[1],
+                       dtype="str",
+                       na_filter=False)[1].tolist()
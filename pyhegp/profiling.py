@@ -0,0 +1,229 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
+import resource
+import sys
+import time
+
+# Resource counters at some instant. Counters that the operating
+# system does not provide are None.
+Counters = namedtuple("Counters", "wall cpu read_bytes write_bytes")
+
+# The profile being recorded, or None if profiling is disabled.
+_profile = ContextVar("profile", default=None)
+
+# Time that is not spent in any stage is charged to this stage.
+OTHER_STAGE = "other"
+
+# Minimum interval in seconds between updates of the progress line
+PROGRESS_INTERVAL = 0.5
+
+def io_bytes():
+    # Bytes read and written by this process, including from pipes and
+    # the page cache. This is only available on Linux.
+    try:
+        with open("/proc/self/io", "rb") as file:
+            counters = dict(line.split(b":") for line in file)
+        return int(counters[b"rchar"]), int(counters[b"wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def counters():
+    # CPU time includes worker processes that have exited.
+    times = os.times()
+    return Counters(time.perf_counter(),
+                    times.user + times.system
+                    + times.children_user + times.children_system,
+                    *io_bytes())
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            * (1 if sys.platform == "darwin" else 1024))
+
+def new_stage_metrics():
+    return {"wall_seconds": 0.0,
+            "cpu_seconds": 0.0,
+            "read_bytes": 0,
+            "write_bytes": 0,
+            "process_peak_rss_bytes": 0,
+            "rss_growth_bytes": 0,
+            "snps": 0}
+
+def charge(profile):
+    # Charge resources used since the last charge to the current
+    # stage. Only one stage is current at any time. So, a stage that
+    # runs inside another is charged exclusively, and is not counted
+    # again in the outer stage.
+    now = counters()
+    rss = peak_rss_bytes()
+    metrics = profile["stages"].setdefault(profile["current"],
+                                           new_stage_metrics())
+    metrics["wall_seconds"] += now.wall - profile["last"].wall
+    metrics["cpu_seconds"] += now.cpu - profile["last"].cpu
+    for key in ["read_bytes", "write_bytes"]:
+        if getattr(now, key) is None:
+            metrics[key] = None
+        else:
+            metrics[key] += getattr(now, key) - getattr(profile["last"], key)
+    # The peak RSS is that of the whole process so far, not of this
+    # stage alone. How much the peak grew during the stage is
+    # rss_growth_bytes.
+    metrics["process_peak_rss_bytes"] = max(metrics["process_peak_rss_bytes"],
+                                            rss)
+    metrics["rss_growth_bytes"] += rss - profile["last_rss"]
+    profile["last"] = now
+    profile["last_rss"] = rss
+
+def switch(profile, stage_name):
+    # Make stage_name the current stage, and return the previous one.
+    charge(profile)
+    previous = profile["current"]
+    profile["current"] = stage_name
+    return previous
+
+@contextmanager
+def profiling(enabled, progress=False):
+    # Record a profile in this context, and yield it. Yield None if
+    # profiling is disabled. If only progress is enabled, count SNPs,
+    # but do not record stages.
+    if not (enabled or progress):
+        yield None
+        return
+    profile = {"enabled": enabled,
+               "stages": {},
+               "current": OTHER_STAGE,
+               "start": counters(),
+               "last": counters(),
+               "last_rss": peak_rss_bytes(),
+               "snps": 0,
+               "progress": progress,
+               "last_progress": 0.0}
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        charge(profile)
+        if progress:
+            # Finish the progress line.
+            show_progress(profile, force=True)
+            print(file=sys.stderr)
+        _profile.reset(token)
+
+@contextmanager
+def unprofiled():
+    # Record nothing in this context. Worker processes forked from a
+    # profiled process inherit its profile. They use this so that
+    # they do not print progress lines of their own.
+    token = _profile.set(None)
+    try:
+        yield
+    finally:
+        _profile.reset(token)
+
+@contextmanager
+def stage(name):
+    # Charge everything done in this context to stage name.
+    profile = _profile.get()
+    if not recording_stages():
+        yield
+        return
+    previous = switch(profile, name)
+    try:
+        yield
+    finally:
+        switch(profile, previous)
+
+def recording_stages():
+    # Only one stage is current at any time. So, stages that overlap,
+    # say in different threads, cannot be told apart. Code that
+    # overlaps stages should run them one after another while stages
+    # are being recorded.
+    profile = _profile.get()
+    return profile is not None and profile["enabled"]
+
+def staged(name, chunks, count=False):
+    # Charge the work of producing each chunk to stage name. If count
+    # is true, count the SNPs (rows) in chunks toward the stage and
+    # toward overall progress. count may also be a function that
+    # returns the number of SNPs in a chunk.
+    profile = _profile.get()
+    if profile is None:
+        yield from chunks
+        return
+    chunks = iter(chunks)
+    while True:
+        with stage(name):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        if count:
+            snps = count(chunk) if callable(count) else len(chunk)
+            if recording_stages():
+                profile["stages"][name]["snps"] += snps
+            advance(snps)
+        yield chunk
+
+def advance(snps):
+    # Count snps toward overall progress.
+    profile = _profile.get()
+    if profile is not None:
+        profile["snps"] += snps
+        if profile["progress"]:
+            show_progress(profile)
+
+def show_progress(profile, force=False):
+    now = time.perf_counter()
+    if not force and now - profile["last_progress"] < PROGRESS_INTERVAL:
+        return
+    profile["last_progress"] = now
+    elapsed = now - profile["start"].wall
+    print(f"\r{profile['snps']} SNPs in {elapsed:.1f} s"
+          f" ({profile['snps'] / max(elapsed, 1e-9):.0f} SNPs/s),"
+          f" peak memory {peak_rss_bytes() / 2**20:.0f} MiB",
+          end="", file=sys.stderr, flush=True)
+
+def metrics(profile, command):
+    # Return the profile as a JSON-serializable dictionary.
+    end = counters()
+    return {"command": command,
+            "wall_seconds": end.wall - profile["start"].wall,
+            "cpu_seconds": end.cpu - profile["start"].cpu,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "snps": profile["snps"],
+            "stages": [{"stage": name} | stage_metrics
+                       for name, stage_metrics in profile["stages"].items()]}
+
+def format_metrics(metrics):
+    # Format metrics as a human-readable table.
+    def megabytes(n):
+        return "-" if n is None else f"{n / 2**20:.1f}"
+    return "\n".join(
+        ["stage\twall (s)\tcpu (s)\tread (MiB)\twritten (MiB)"
+         "\tpeak memory growth (MiB)\tprocess peak memory (MiB)\tSNPs"]
+        + [f"{stage['stage']}\t{stage['wall_seconds']:.3f}\t{stage['cpu_seconds']:.3f}"
+           f"\t{megabytes(stage['read_bytes'])}\t{megabytes(stage['write_bytes'])}"
+           f"\t{megabytes(stage['rss_growth_bytes'])}"
+           f"\t{megabytes(stage['process_peak_rss_bytes'])}\t{stage['snps']}"
+           for stage in metrics["stages"]]
+        + [f"total\t{metrics['wall_seconds']:.3f}\t{metrics['cpu_seconds']:.3f}"
+           f"\t\t\t\t{megabytes(metrics['peak_rss_bytes'])}\t{metrics['snps']}"])
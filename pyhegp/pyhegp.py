@@ -17,46 +17,142 @@
 ### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
 
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from functools import reduce
+import io
+from itertools import chain, islice, repeat
+import json
 import math
+import os
 from pathlib import Path
 import sys
 
 import click
-import numpy as np
-import pandas as pd
-from scipy.stats import special_ortho_group
 
+from pyhegp.join import inner_join, merge_join_chunks
+from pyhegp.journal import RESUMABLE_FORMATS, encryption_identity, genotype_identity, journal_path, read_journal, write_journaled_genotype_chunks
 from pyhegp.linalg import BlockDiagonalMatrix
-from pyhegp.serialization import Summary, read_summary, write_summary, read_genotype, read_phenotype, write_genotype, write_phenotype, read_key, write_key, is_genotype_metadata_column
+from pyhegp.parallel import attach_arrays, blas_threads, parallel_map, parallelism, prefetch, shared_arrays, workers
+from pyhegp.profiling import advance, format_metrics, metrics, profiling, recording_stages, stage, staged, unprofiled
+from pyhegp.utils import lazy_import
+from pyhegp.serialization import BINARY_GENOTYPE_EXTENSION, COMPRESSED_GENOTYPE_EXTENSION, KeySeed, compact_genotype, dosage_block_size, Summary, read_summary, read_summary_chunks, write_summary, write_summary_chunks, read_genotype, read_genotype_chunks, genotype_slices, read_genotype_slice, read_selected_genotype_chunks, read_selected_genotype_slice, is_sliceable, parse_region, in_region, read_phenotype, read_tsv_header, cat_tsv_data, genotype_sample_names, is_phenotype_file, write_genotype, write_genotype_chunks, write_phenotype, read_key, write_key, is_genotype_metadata_column, genotype_file_format, genotype_content_format
+
+# numpy and pandas are loaded only when first used, and scipy only by
+# the functions that use it. So, commands that do not need them start
+# up without loading them.
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 Stats = namedtuple("Stats", "n mean std")
 
-def random_key(rng, size, number_of_blocks=1):
-    def random_key_block(n):
-        return special_ortho_group.rvs(n, random_state=rng)
+def scipy_rotation(rng, n):
+    from scipy.stats import special_ortho_group
+    return special_ortho_group.rvs(n, random_state=rng)
+
+def qr_rotation(rng, n):
+    # The Q factor of the QR decomposition of a matrix of standard
+    # normal variates, with the signs of its columns corrected so that
+    # the diagonal of R is positive, is a Haar-distributed orthogonal
+    # matrix. See Mezzadri, How to generate random matrices from the
+    # classical compact groups, 2007. Flipping one column when the
+    # determinant is negative makes it a Haar-distributed rotation.
+    q, r = np.linalg.qr(rng.standard_normal((n, n)))
+    q *= np.where(np.diag(r) < 0, -1, 1)
+    if np.linalg.slogdet(q).sign < 0:
+        q[:, 0] = -q[:, 0]
+    return q
+
+rotation_samplers = {"scipy": scipy_rotation,
+                     "qr": qr_rotation}
 
+key_bit_generators = {"PCG64": lambda seed_sequence: np.random.PCG64(seed_sequence)}
+
+def random_key_block(rng, n, sampler, number_of_workers):
+    # This runs in a worker process. Share cores with the other
+    # workers.
+    with blas_threads(number_of_workers):
+        return rotation_samplers[sampler](rng, n)
+
+def key_block_sizes(size, number_of_blocks):
     block_size = size // number_of_blocks
     # A rotation matrix must be at least 2×2.
     assert block_size >= 2
-    return BlockDiagonalMatrix(
-        [random_key_block(block_size)
-         for i in range(number_of_blocks - 1)]
-        + [random_key_block(size - block_size*(number_of_blocks - 1))])
+    return ([block_size] * (number_of_blocks - 1)
+            + [size - block_size*(number_of_blocks - 1)])
+
+def random_block_diagonal_key(rng, block_sizes, sampler="scipy",
+                              number_of_workers=None):
+    # Each block is generated from its own independent random stream
+    # spawned from rng. So, the key depends only on rng, not on the
+    # number of workers or the order in which blocks are generated.
+    rngs = rng.spawn(len(block_sizes))
+    number_of_workers = min(number_of_workers or workers(),
+                            len(block_sizes))
+    if number_of_workers > 1:
+        with ProcessPoolExecutor(number_of_workers) as executor:
+            blocks = list(executor.map(random_key_block,
+                                       rngs,
+                                       block_sizes,
+                                       repeat(sampler),
+                                       repeat(number_of_workers)))
+    else:
+        blocks = [rotation_samplers[sampler](rng, n)
+                  for rng, n in zip(rngs, block_sizes)]
+    return BlockDiagonalMatrix(blocks)
+
+def random_key(rng, size, number_of_blocks=1, sampler="scipy",
+               number_of_workers=None):
+    return random_block_diagonal_key(rng,
+                                     key_block_sizes(size, number_of_blocks),
+                                     sampler,
+                                     number_of_workers)
+
+def random_key_seed(size, number_of_blocks=1, sampler="scipy"):
+    # Draw fresh secret seed material from the operating system.
+    return KeySeed("PCG64",
+                   sampler,
+                   np.random.SeedSequence().entropy,
+                   key_block_sizes(size, number_of_blocks))
+
+def key_from_seed(seed, number_of_workers=None):
+    if seed.bit_generator not in key_bit_generators:
+        raise ValueError(f"Unknown bit generator {seed.bit_generator}")
+    if seed.sampler not in rotation_samplers:
+        raise ValueError(f"Unknown rotation sampler {seed.sampler}")
+    return random_block_diagonal_key(
+        np.random.Generator(
+            key_bit_generators[seed.bit_generator](
+                np.random.SeedSequence(seed.entropy))),
+        seed.block_sizes,
+        seed.sampler,
+        number_of_workers)
+
+def materialize_key(key):
+    # Regenerate the key if it is only a seed.
+    return key_from_seed(key) if isinstance(key, KeySeed) else key
+
+# center, uncenter, standardize and unstandardize broadcast mean and
+# standard deviation (one value per column) over the rows of
+# matrix. They never materialize a matrix-sized copy of the mean or a
+# columns×columns diagonal matrix. When out is given, the result is
+# written into it, and out may be matrix itself. So, they need at most
+# one matrix-sized allocation for the result, and none at all when
+# working in place.
 
-def center(matrix, mean):
-    m, _ = matrix.shape
-    return matrix - np.tile(mean, (m, 1))
+def center(matrix, mean, out=None):
+    return np.subtract(matrix, mean, out=out)
 
-def uncenter(matrix, mean):
-    return center(matrix, -mean)
+def uncenter(matrix, mean, out=None):
+    return np.add(matrix, mean, out=out)
 
-def standardize(matrix, mean, standard_deviation):
-    return center(matrix, mean) @ np.diag(1 / standard_deviation)
+def standardize(matrix, mean, standard_deviation, out=None):
+    centered = center(matrix, mean, out=out)
+    return np.divide(centered, standard_deviation, out=centered)
 
-def unstandardize(matrix, mean, standard_deviation):
-    return uncenter(matrix @ np.diag(standard_deviation),
-                    mean)
+def unstandardize(matrix, mean, standard_deviation, out=None):
+    scaled = np.multiply(matrix, standard_deviation, out=out)
+    return uncenter(scaled, mean, out=scaled)
 
 def hegp_encrypt(plaintext, key):
     return key @ plaintext
@@ -70,82 +166,240 @@ def drop_metadata_columns(genotype):
             # does not exist.
             .drop(columns=["reference"], errors="ignore"))
 
+def dosage_blocks(matrix):
+    # Yield slices of blocks of SNPs (rows) of a dosage matrix and
+    # those blocks widened to float64. Dosages may be stored compact,
+    # but are only ever widened a block at a time.
+    for start in range(0, len(matrix), dosage_block_size(matrix.shape[1])):
+        rows = slice(start, start + dosage_block_size(matrix.shape[1]))
+        yield rows, np.asarray(matrix[rows], dtype="float64")
+
 def genotype_summary(genotype):
     matrix = drop_metadata_columns(genotype).to_numpy()
-    return Summary(genotype.shape[0],
+    mean = np.empty(len(matrix))
+    std = np.empty(len(matrix))
+    for rows, block in dosage_blocks(matrix):
+        mean[rows] = np.mean(block, axis=1)
+        std[rows] = np.std(block, axis=1)
+    return Summary(matrix.shape[1],
                    pd.DataFrame({"chromosome": genotype.chromosome,
                                  "position": genotype.position}
                                 | ({"reference": genotype.reference}
                                    if "reference" in genotype.columns
                                    else {})
-                                | {"mean": np.mean(matrix, axis=1),
-                                   "std": np.std(matrix, axis=1)}))
+                                | {"mean": mean,
+                                   "std": std}))
+
+def genotype_slice_summary(slice):
+    # This runs in a worker process. Reading the slice here, rather
+    # than in the parent, parallelizes parsing too.
+    return genotype_summary(read_genotype_slice(slice))
+
+def genotype_summary_chunks(file, chunk_size, region=None):
+    # Yield summaries of successive chunks of the genotype in
+    # file. Every SNP lies entirely within one chunk, and its
+    # statistics depend only on its own row. So, chunk summaries
+    # never need to be merged; the summary of the complete genotype
+    # is simply their concatenation. If file can be opened again by
+    # name and split, workers read and summarize chunks in
+    # parallel. Else, read it sequentially. If region is given,
+    # summarize only SNPs in it.
+    if region is None and is_sliceable(file):
+        return parallel_map(genotype_slice_summary,
+                            genotype_slices(file, chunk_size))
+    else:
+        return (genotype_summary(chunk)
+                for _, chunk in read_selected_genotype_chunks(file, chunk_size,
+                                                              region=region))
+
+def read_region_genotype(file, region=None, compact=False):
+    # Read the whole genotype, or only the SNPs in region. See
+    # read_genotype for compact.
+    if region is None:
+        return read_genotype(file, compact)
+    _, genotype = next(read_selected_genotype_chunks(file, None,
+                                                     region=region))
+    return genotype
+
+def concat_summaries(summaries):
+    # Concatenate summaries of disjoint sets of SNPs of the same
+    # samples.
+    summaries = list(summaries)
+    data = pd.concat([summary.data for summary in summaries],
+                     ignore_index=True)
+    if duplicates := duplicate_snps(snp_key_index(data)):
+        raise ValueError(f"Genotypes share SNPs {duplicates}")
+    return Summary(summaries[0].n, data)
 
 def pool_stats(list_of_stats):
-    sums = [stats.n*stats.mean for stats in list_of_stats]
-    sums_of_squares = [(stats.n-1)*stats.std**2 + stats.n*stats.mean**2
-                       for stats in list_of_stats]
-    n = np.sum([stats.n for stats in list_of_stats])
-    mean = np.sum(sums, axis=0) / n
-    std = np.sqrt((np.sum(sums_of_squares, axis=0) - n*mean**2)
+    # Stack the statistics of the k pools into k×SNPs arrays and pool
+    # them all at once. Sum squared deviations about the pooled mean
+    # (the k-way form of the pairwise update of Chan et al.) instead
+    # of raw sums of squares. Raw sums of squares lose precision to
+    # cancellation when the mean is large compared to the standard
+    # deviation.
+    ns = np.array([stats.n for stats in list_of_stats])
+    means = np.stack([stats.mean for stats in list_of_stats])
+    stds = np.stack([stats.std for stats in list_of_stats])
+    weights = ns.reshape((-1,) + (1,)*(means.ndim - 1))
+    n = np.sum(ns)
+    mean = np.sum(weights*means, axis=0) / n
+    std = np.sqrt(np.sum((weights-1)*stds**2 + weights*(means-mean)**2,
+                         axis=0)
                   / (n - 1))
     return Stats(n, mean, std)
 
+def summary_join_keys(frames):
+    # Match SNPs on the reference allele too, but only if all
+    # summaries have it.
+    return (["chromosome", "position"]
+            + (["reference"]
+               if all("reference" in frame.columns for frame in frames)
+               else []))
+
+def pool_aligned_summary_data(ns, frames):
+    # Pool summary data frames that have the same SNPs in the same
+    # order. The reference column is optional, and is dropped.
+    pooled_stats = pool_stats([Stats(n,
+                                     frame["mean"].to_numpy(),
+                                     frame["std"].to_numpy())
+                               for n, frame in zip(ns, frames)])
+    return pd.concat((frames[0][["chromosome", "position"]],
+                      pd.DataFrame({"mean": pooled_stats.mean,
+                                    "std": pooled_stats.std})),
+                     axis="columns")
+
 def pool_summaries(summaries):
-    def pool_summaries2(summary1, summary2):
-        metadata_columns = (["chromosome", "position"]
-                            + (["reference"]
-                               if "reference" in summary1.data.columns
-                               else []))
-        # Drop any SNPs that are not in both summaries.
-        data = pd.merge(summary1.data.rename(columns={"mean": "mean1",
-                                                      "std": "std1"}),
-                        summary2.data.rename(columns={"mean": "mean2",
-                                                      "std": "std2"}),
-                        how="inner",
-                        on=metadata_columns)
-        pooled_stats = pool_stats([Stats(summary1.n,
-                                         data.mean1.to_numpy(),
-                                         data.std2.to_numpy()),
-                                   Stats(summary2.n,
-                                         data.mean2.to_numpy(),
-                                         data.std2.to_numpy())])
-        return Summary(pooled_stats.n,
-                       pd.concat((data[metadata_columns],
-                                  pd.DataFrame({"mean": pooled_stats.mean,
-                                                "std": pooled_stats.std})),
-                                 axis="columns"))
-    pooled_summary = reduce(pool_summaries2, summaries)
-    return Summary(pooled_summary.n,
-                   # The reference column is optional. Do not raise an
-                   # error if it is absent.
-                   pooled_summary.data.drop(columns=["reference"],
-                                            errors="ignore"))
+    # Drop any SNPs that are not in all summaries.
+    frames = [summary.data for summary in summaries]
+    ns = [summary.n for summary in summaries]
+    return Summary(sum(ns),
+                   pool_aligned_summary_data(
+                       ns, inner_join(frames, summary_join_keys(frames))))
+
+def pool_summary_chunks(summaries):
+    # Pool summaries whose data are iterators over chunks sorted by
+    # chromosome and position, and yield chunks of pooled data.
+    ns = [summary.n for summary in summaries]
+    data = [iter(summary.data) for summary in summaries]
+    first_chunks = [next(chunks) for chunks in data]
+    for frames in merge_join_chunks([chain([first_chunk], chunks)
+                                     for first_chunk, chunks
+                                     in zip(first_chunks, data)],
+                                    summary_join_keys(first_chunks)):
+        yield pool_aligned_summary_data(ns, frames)
+
+def region_summary(summary, region):
+    # Keep only the SNPs of summary in region.
+    if region is None:
+        return summary
+    return Summary(summary.n,
+                   summary.data[np.array([in_region(region, key)
+                                          for key in zip(summary.data.chromosome,
+                                                         summary.data.position)],
+                                         dtype=bool)]
+                   .reset_index(drop=True))
 
 def drop_zero_stddev_snps(summary):
     return summary._replace(
         data=summary.data[~np.isclose(summary.data["std"], 0)])
 
+def summary_snps(summary):
+    # Return the set of (chromosome, position) keys of the SNPs in
+    # summary. These are the keys drop_uncommon_snps matches SNPs by.
+    return set(zip(summary.data.chromosome, summary.data.position.tolist()))
+
 def drop_uncommon_snps(genotype, summary):
     return pd.merge(genotype,
                     summary.data[["chromosome", "position"]],
                     on=("chromosome", "position"))
 
+def align_summary(summary, genotype):
+    # Reorder the rows of summary to match the SNPs of genotype.
+    return summary._replace(
+        data=pd.merge(genotype[["chromosome", "position"]],
+                      summary.data,
+                      on=("chromosome", "position")))
+
+def snp_key_index(frame):
+    return pd.MultiIndex.from_arrays([frame.chromosome.to_numpy(),
+                                      frame.position.to_numpy(dtype="int64")])
+
+def duplicate_snps(index, limit=5):
+    # Describe the SNPs that occur more than once in index, a
+    # snp_key_index, listing no more than limit of them. Return the
+    # empty string if there are none.
+    if index.is_unique:
+        return ""
+    duplicates = index[index.duplicated()].unique()
+    return (", ".join(f"{chromosome}:{position}"
+                      for chromosome, position in duplicates[:limit])
+            + (f" and {len(duplicates) - limit} more"
+               if len(duplicates) > limit
+               else ""))
+
+def summary_index(summary):
+    # Index the SNPs of summary by (chromosome, position). Looking up
+    # the SNPs of a chunk in the index costs only as much as the
+    # chunk, whereas merging the chunk with the summary costs as much
+    # as the whole summary. So, build the index once, and use it for
+    # every chunk.
+    index = snp_key_index(summary.data)
+    if duplicates := duplicate_snps(index):
+        raise ValueError(f"Summary has duplicate SNPs {duplicates}")
+    return index
+
+def select_common_snps(genotype, summary, index):
+    # Like drop_uncommon_snps followed by align_summary, but look up
+    # SNPs in index, the summary_index of summary.
+    indices = index.get_indexer(snp_key_index(genotype))
+    selected = indices >= 0
+    return (genotype[selected].reset_index(drop=True),
+            summary._replace(data=(summary.data
+                                   .iloc[indices[selected]]
+                                   .reset_index(drop=True))))
+
 def encrypt_genotype(genotype, key, summary, only_center):
+    # Peak memory, over and above the genotype data frame and the
+    # encrypted result, is one float64 block of the genotype
+    # matrix. Each block is widened from however the dosages are
+    # stored, standardized in place and encrypted in turn.
     sample_names = drop_metadata_columns(genotype).columns
-    genotype_matrix = genotype[sample_names].to_numpy().T
-    encrypted_genotype_matrix = hegp_encrypt(
-        center(genotype_matrix, summary.data["mean"].to_numpy())
-        if only_center
-        else standardize(genotype_matrix,
-                         summary.data["mean"].to_numpy(),
-                         summary.data["std"].to_numpy()),
-        key)
+    genotype_matrix = genotype[sample_names].to_numpy()
+    mean = summary.data["mean"].to_numpy()
+    std = summary.data["std"].to_numpy()
+    encrypted_genotype_matrix = np.empty(genotype_matrix.shape)
+    for rows, block in dosage_blocks(genotype_matrix):
+        block = np.array(block, copy=True).T
+        if only_center:
+            center(block, mean[rows], out=block)
+        else:
+            standardize(block, mean[rows], std[rows], out=block)
+        encrypted_genotype_matrix[rows] = hegp_encrypt(block, key).T
     return pd.concat((genotype[["chromosome", "position"]],
-                      pd.DataFrame(encrypted_genotype_matrix.T,
-                                   columns=sample_names)),
+                      pd.DataFrame(encrypted_genotype_matrix,
+                                   columns=sample_names,
+                                   copy=False)),
                      axis="columns")
 
+def encrypt_genotype_chunks(chunks, key, summary, only_center, index=None):
+    # Each SNP is encrypted independently of the others. So, we can
+    # encrypt one chunk of SNPs at a time, and never hold more than
+    # one chunk in memory. index is the summary_index of summary, if
+    # the caller has already built it.
+    if index is None:
+        index = summary_index(summary)
+    for chunk in chunks:
+        with stage("drop uncommon SNPs"):
+            common_chunk, common_summary = select_common_snps(chunk, summary,
+                                                              index)
+        with stage("encrypt genotype"):
+            encrypted_chunk = encrypt_genotype(common_chunk,
+                                               key,
+                                               common_summary,
+                                               only_center)
+        yield encrypted_chunk
+
 def encrypt_phenotype(phenotype, key):
     phenotype_matrix = phenotype.drop(columns=["sample-id"])
     sample_names = list(phenotype_matrix.columns)
@@ -158,6 +412,57 @@ def encrypt_phenotype(phenotype, key):
                           columns=["intercept"] + sample_names)),
                      axis="columns")
 
+def decrypt_genotype(genotype, key, summary=None, only_center=False):
+    # Undo encrypt_genotype. The transpose of the key is block
+    # diagonal too, and is applied block by block. Without a summary,
+    # the decrypted genotype remains standardized (or centered).
+    sample_names = drop_metadata_columns(genotype).columns
+    genotype_matrix = hegp_decrypt(
+        genotype[sample_names].to_numpy(dtype="float64").T,
+        key)
+    if summary is not None:
+        if only_center:
+            uncenter(genotype_matrix,
+                     summary.data["mean"].to_numpy(),
+                     out=genotype_matrix)
+        else:
+            unstandardize(genotype_matrix,
+                          summary.data["mean"].to_numpy(),
+                          summary.data["std"].to_numpy(),
+                          out=genotype_matrix)
+    return pd.concat((genotype[["chromosome", "position"]],
+                      pd.DataFrame(genotype_matrix.T,
+                                   columns=sample_names)),
+                     axis="columns")
+
+def decrypt_genotype_chunks(chunks, key, summary=None, only_center=False):
+    # Like encryption, decryption works on one chunk of SNPs at a
+    # time. Encryption only keeps SNPs in the summary. So, with a
+    # summary, SNPs not in it cannot have come from encryption, and
+    # are dropped.
+    if summary is not None:
+        index = summary_index(summary)
+    for chunk in chunks:
+        if summary is not None:
+            with stage("drop uncommon SNPs"):
+                chunk, chunk_summary = select_common_snps(chunk, summary, index)
+        else:
+            chunk_summary = None
+        with stage("decrypt genotype"):
+            decrypted_chunk = decrypt_genotype(chunk, key, chunk_summary,
+                                               only_center)
+        yield decrypted_chunk
+
+def decrypt_phenotype(phenotype, key):
+    # Undo encrypt_phenotype, and drop the intercept it added.
+    phenotype_matrix = phenotype.drop(columns=["sample-id", "intercept"],
+                                      errors="ignore")
+    return pd.concat((phenotype["sample-id"],
+                      pd.DataFrame(hegp_decrypt(phenotype_matrix.to_numpy(),
+                                                key),
+                                   columns=phenotype_matrix.columns)),
+                     axis="columns")
+
 def cat_genotype(genotypes):
     def cat2(df1, df2):
         return pd.merge(df1, df2,
@@ -173,6 +478,23 @@ def cat_genotype(genotypes):
         case _:
             return reduce(cat2, genotypes)
 
+def cat_genotype_chunks(inputs):
+    # Concatenate genotypes, each an iterator over chunks sorted by
+    # chromosome and position, and yield chunks of the result. Like
+    # cat_genotype, keep only SNPs present in all genotypes.
+    inputs = [iter(chunks) for chunks in inputs]
+    first_chunks = [next(chunks) for chunks in inputs]
+    metadata_columns = list(filter(is_genotype_metadata_column,
+                                   first_chunks[0].columns))
+    for frames in merge_join_chunks([chain([first_chunk], chunks)
+                                     for first_chunk, chunks
+                                     in zip(first_chunks, inputs)],
+                                    metadata_columns):
+        yield pd.concat([frames[0]]
+                        + [frame.drop(columns=metadata_columns)
+                           for frame in frames[1:]],
+                        axis="columns")
+
 def cat_phenotype(phenotypes):
     match phenotypes:
         # If there are no input data frames, return an empty data
@@ -185,123 +507,802 @@ def cat_phenotype(phenotypes):
 
 @click.group()
 @click.version_option()
-def main():
-    pass
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=1,
+              show_default=True,
+              help="Number of parallel workers")
+@click.option("--profile", is_flag=True,
+              help=("Print wall time, CPU time, bytes read and written, and"
+                    " peak memory of each stage to standard error"))
+@click.option("--metrics", "metrics_file", type=click.File("w"),
+              help="Write metrics of each stage to this file as JSON")
+@click.option("--progress", is_flag=True,
+              help="Show a live progress line on standard error")
+@click.pass_context
+def main(ctx, jobs, profile, metrics_file, progress):
+    ctx.with_resource(parallelism(jobs))
+    # Resources are released in reverse order. So, register report
+    # before the profile so that it runs after the profile is
+    # complete.
+    def report():
+        if recorded_profile is None:
+            return
+        command_metrics = metrics(recorded_profile, ctx.invoked_subcommand)
+        if profile:
+            print(format_metrics(command_metrics), file=sys.stderr)
+        if metrics_file:
+            json.dump(command_metrics, metrics_file, indent=2)
+            metrics_file.write("\n")
+    ctx.call_on_close(report)
+    recorded_profile = ctx.with_resource(
+        profiling(profile or metrics_file is not None, progress))
+
+def region_option(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_region(value)
+    except ValueError as error:
+        raise click.BadParameter(str(error))
+
+REGION_HELP = ("Only use SNPs in this region, written as CHROMOSOME or"
+               " CHROMOSOME:START-END. Only the needed blocks of indexed"
+               " compressed genotype files are read.")
 
 @main.command("summary")
-@click.argument("genotype-file", type=click.File("r"))
+@click.argument("genotype-file", type=click.File("rb"))
 @click.option("--output", "-o", "summary_file",
               type=click.File("wb"),
               default="-",
               help="output file")
-def summary_command(genotype_file, summary_file):
-    write_summary(summary_file,
-                  genotype_summary(read_genotype(genotype_file)))
+@click.option("--chunk-size", type=click.IntRange(min=1),
+              help=("Read and summarize the genotype this many SNPs at a time"
+                    " instead of all at once"))
+@click.option("--format", "summary_format",
+              type=click.Choice(["tsv", "binary"]),
+              default="tsv",
+              show_default=True,
+              help=("Summary file format. Binary summaries are read much"
+                    " faster, but only by newer versions of pyhegp."))
+@click.option("--region", callback=region_option, help=REGION_HELP)
+def summary_command(genotype_file, summary_file, chunk_size, summary_format,
+                    region):
+    if chunk_size:
+        # Write chunk summaries as they come so that memory does not
+        # grow with the number of SNPs.
+        summaries = genotype_summary_chunks(genotype_file, chunk_size, region)
+        with stage("summarize"):
+            first_summary = next(summaries)
+        with stage("write summary"):
+            write_summary_chunks(summary_file,
+                                 first_summary.n,
+                                 staged("summarize",
+                                        (summary.data
+                                         for summary in chain([first_summary],
+                                                              summaries)),
+                                        count=True),
+                                 summary_format)
+    else:
+        with stage("read genotype"):
+            genotype = read_region_genotype(genotype_file, region, compact=True)
+        with stage("summarize"):
+            summary = genotype_summary(genotype)
+        with stage("write summary"):
+            write_summary(summary_file, summary, summary_format)
 
 @main.command("pool")
 @click.option("--output", "-o", "pooled_summary_file",
               type=click.File("wb"),
               default="-",
               help="output file")
+@click.option("--chunk-size", type=click.IntRange(min=1),
+              help=("Read and pool summaries this many SNPs at a time instead"
+                    " of all at once. Summaries must be sorted by chromosome,"
+                    " in the same chromosome order, and then position."))
+@click.option("--format", "summary_format",
+              type=click.Choice(["tsv", "binary"]),
+              default="tsv",
+              show_default=True,
+              help=("Summary file format. Binary summaries are read much"
+                    " faster, but only by newer versions of pyhegp."))
 @click.argument("summary-files", type=click.File("rb"), nargs=-1)
-def pool_command(pooled_summary_file, summary_files):
-    summaries = [read_summary(file) for file in summary_files]
-    pooled_summary = pool_summaries(summaries)
-    max_snps = max(len(summary.data) for summary in summaries)
-    if len(pooled_summary.data) < max_snps:
-        dropped_snps = max_snps - len(pooled_summary.data)
+def pool_command(pooled_summary_file, chunk_size, summary_format,
+                 summary_files):
+    if chunk_size:
+        # Count SNPs as they are read.
+        snp_counts = [0] * len(summary_files)
+        def counted_chunks(i, chunks):
+            for chunk in chunks:
+                snp_counts[i] += len(chunk)
+                yield chunk
+        summaries = [summary._replace(data=counted_chunks(
+                         i, staged("read summaries", summary.data)))
+                     for i, summary
+                     in enumerate(read_summary_chunks(file, chunk_size)
+                                  for file in summary_files)]
+        number_of_pooled_snps = 0
+        def counted_pooled_chunks():
+            nonlocal number_of_pooled_snps
+            for chunk in staged("pool", pool_summary_chunks(summaries),
+                                count=True):
+                number_of_pooled_snps += len(chunk)
+                yield chunk
+        try:
+            with stage("write summary"):
+                write_summary_chunks(pooled_summary_file,
+                                     sum(summary.n for summary in summaries),
+                                     counted_pooled_chunks(),
+                                     summary_format)
+        except ValueError as error:
+            print(f"Cannot pool summaries: {error}")
+            sys.exit(1)
+        # Pooling stops at the end of the shortest summary. Read the
+        # rest of the others to count their SNPs.
+        with stage("read summaries"):
+            for summary in summaries:
+                for _ in summary.data:
+                    pass
+        max_snps = max(snp_counts)
+    else:
+        with stage("read summaries"):
+            summaries = [read_summary(file) for file in summary_files]
+        with stage("pool"):
+            pooled_summary = pool_summaries(summaries)
+        with stage("write summary"):
+            write_summary(pooled_summary_file, pooled_summary, summary_format)
+        number_of_pooled_snps = len(pooled_summary.data)
+        max_snps = max(len(summary.data) for summary in summaries)
+    if number_of_pooled_snps < max_snps:
+        dropped_snps = max_snps - number_of_pooled_snps
         print(f"Dropped {dropped_snps} SNP(s) that were not present in all datasets")
-    write_summary(pooled_summary_file, pooled_summary)
+
+def write_output_file(path, writer, force):
+    if path.exists() and not force:
+        print(f"Output file {path} exists, cannot overwrite.")
+        sys.exit(1)
+    with path.open("wb") as file:
+        writer(file)
+
+def read_counted_genotype_chunks(file, chunk_size, snps, region):
+    # Like read_selected_genotype_chunks, but if chunk_size is None,
+    # read the whole genotype a block at a time into compact storage.
+    if chunk_size:
+        return read_selected_genotype_chunks(file, chunk_size, snps, region)
+    number_of_snps = 0
+    def chunks():
+        nonlocal number_of_snps
+        for snps_read, chunk in read_selected_genotype_chunks(
+                file,
+                dosage_block_size(len(genotype_sample_names(file))),
+                snps,
+                region):
+            number_of_snps += snps_read
+            yield chunk
+    genotype = compact_genotype(chunks())
+    return iter([(number_of_snps, genotype)])
+
+def genotype_file_chunks(file, chunk_size):
+    # Read a genotype file chunk_size SNPs at a time, or all at once
+    # if chunk_size is None.
+    return (read_genotype_chunks(file, chunk_size)
+            if chunk_size
+            else iter([read_genotype(file)]))
+
+def encrypt_counted_chunks(counted_chunks, key, summary, only_center,
+                           index=None):
+    # Encrypt chunks of (number of SNPs read, chunk) pairs, and keep
+    # each encrypted chunk paired with its number of SNPs read. See
+    # encrypt_genotype_chunks for index.
+    if index is None:
+        index = summary_index(summary)
+    for snps, chunk in counted_chunks:
+        yield snps, next(encrypt_genotype_chunks([chunk],
+                                                 key,
+                                                 summary,
+                                                 only_center,
+                                                 index))
+
+DEFAULT_QUEUE_DEPTH = 2
+
+def pipelined_encrypt_counted_chunks(counted_chunks, key, summary,
+                                     only_center, index, queue_depth):
+    # Like encrypt_counted_chunks, but read chunks in one thread and
+    # encrypt them in another, leaving this thread free to write
+    # them. Reading, encrypting and writing then overlap. Up to
+    # queue_depth chunks wait between reading and encrypting, and as
+    # many between encrypting and writing.
+    if queue_depth is None:
+        # On a single core, stages cannot overlap; they only contend
+        # for it.
+        queue_depth = DEFAULT_QUEUE_DEPTH if (os.cpu_count() or 1) > 1 else 0
+    if recording_stages():
+        # Time each stage on its own.
+        queue_depth = 0
+    return prefetch(encrypt_counted_chunks(prefetch(counted_chunks,
+                                                    queue_depth),
+                                           key,
+                                           summary,
+                                           only_center,
+                                           index),
+                    queue_depth)
+
+def write_encrypted_genotype_file(path, counted_chunks, genotype_format,
+                                  force, identity=None, checkpoint=None):
+    # Write encrypted chunks from (number of SNPs, encrypted chunk)
+    # pairs to path.hegp. counted_chunks is a function that returns
+    # these pairs, skipping the given number of chunks at the start.
+    # Return the number of SNPs read and the number of SNPs written.
+    # If identity is given, record progress in a journal next to
+    # path.hegp, and continue from checkpoint if it is given.
+    ciphertext_path = Path(str(path) + ".hegp")
+    if identity:
+        mode = "r+b" if checkpoint else "wb"
+        # Create the journal before the ciphertext, so that there is
+        # never a ciphertext that is incomplete but has no journal.
+        with (journal_path(ciphertext_path).open(mode) as journal,
+              ciphertext_path.open(mode) as file):
+            counts = write_journaled_genotype_chunks(
+                file,
+                journal,
+                counted_chunks(checkpoint.chunks if checkpoint else 0),
+                genotype_format,
+                identity,
+                checkpoint)
+        return counts
+
+    # A journal left behind by an earlier encryption does not describe
+    # this ciphertext.
+    journal_path(ciphertext_path).unlink(missing_ok=True)
+
+    number_of_snps = 0
+    def chunks():
+        nonlocal number_of_snps
+        for snps, chunk in counted_chunks(0):
+            number_of_snps += snps
+            yield chunk
+
+    number_of_common_snps = 0
+    def write_encrypted_genotype(file):
+        nonlocal number_of_common_snps
+        number_of_common_snps = write_genotype_chunks(file, chunks(),
+                                                      genotype_format)
+
+    write_output_file(ciphertext_path, write_encrypted_genotype, force)
+    return number_of_snps, number_of_common_snps
+
+def ciphertext_format(path, genotype_format):
+    # Genotype ciphertexts are in the same format as their plaintext
+    # unless genotype_format says otherwise. PLINK files hold only
+    # genotype calls, not the real-valued dosages of a ciphertext. So,
+    # ciphertexts of PLINK genotypes are binary genotypes.
+    if genotype_format:
+        return genotype_format
+    with open(path, "rb") as file:
+        format = genotype_content_format(file)
+    return "binary" if format == "plink" else format
+
+# State of an encrypt worker process, set up once by
+# start_encrypt_worker
+_encrypt_worker = {}
+
+def start_encrypt_worker(shared_key, summary, only_center, chunk_size,
+                         region, genotype_format, number_of_workers):
+    # Attach to the key in shared memory instead of receiving a copy
+    # of it with every task.
+    shared_memory, blocks = attach_arrays(shared_key)
+    _encrypt_worker.update(shared_memory=shared_memory,
+                           key=BlockDiagonalMatrix(blocks),
+                           summary=summary,
+                           index=summary_index(summary),
+                           snps=summary_snps(summary),
+                           only_center=only_center,
+                           chunk_size=chunk_size,
+                           region=region,
+                           genotype_format=genotype_format,
+                           number_of_workers=number_of_workers)
+
+@contextmanager
+def encrypt_worker_context():
+    # Tasks already run in parallel. So, run each task serially, and
+    # share cores with the other workers.
+    with (unprofiled(),
+          parallelism(1),
+          blas_threads(_encrypt_worker["number_of_workers"])):
+        yield
+
+def encrypt_genotype_file_in_worker(task):
+    # This runs in a worker process. task is a (path, identity,
+    # checkpoint) triple, as for write_encrypted_genotype_file.
+    path, identity, checkpoint = task
+    with encrypt_worker_context(), open(path, "rb") as file:
+        return write_encrypted_genotype_file(
+            path,
+            lambda skip: encrypt_counted_chunks(
+                islice(read_counted_genotype_chunks(
+                           file,
+                           _encrypt_worker["chunk_size"],
+                           _encrypt_worker["snps"],
+                           _encrypt_worker["region"]),
+                       skip, None),
+                _encrypt_worker["key"],
+                _encrypt_worker["summary"],
+                _encrypt_worker["only_center"],
+                _encrypt_worker["index"]),
+            ciphertext_format(path, _encrypt_worker["genotype_format"]),
+            True,
+            identity,
+            checkpoint)
+
+def encrypt_genotype_slice(slice):
+    # Like genotype_slice_summary, this reads its slice in the worker
+    # process.
+    with encrypt_worker_context():
+        return next(encrypt_counted_chunks([read_selected_genotype_slice(
+                                                slice, _encrypt_worker["snps"])],
+                                           _encrypt_worker["key"],
+                                           _encrypt_worker["summary"],
+                                           _encrypt_worker["only_center"],
+                                           _encrypt_worker["index"]))
 
 @main.command("encrypt")
-@click.argument("genotype-file", type=click.File("r"))
-@click.argument("phenotype-file", type=click.File("r"), required=False)
+@click.argument("files", metavar="GENOTYPE-FILE... [PHENOTYPE-FILE]",
+                nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option("--manifest", "manifest_file", type=click.File("r"),
+              help="File listing genotype files to encrypt, one per line")
 @click.option("--summary", "-s", "summary_file", type=click.File("rb"),
               help="Summary statistics file")
 @click.option("--key-blocks", "-b",
               type=click.INT,
               help=("Number of blocks to use in the block diagonal key matrix"
                     "  [default: ceil(number_of_samples/1500)]"))
+@click.option("--key-sampler",
+              type=click.Choice(list(rotation_samplers)),
+              default="scipy",
+              show_default=True,
+              help="Method to sample the random rotations in the key")
 @click.option("--key-in", "key_input_file", type=click.File("rb"),
               help="Input key")
-@click.option("--key-out", "-k", "key_output_file", type=click.File("w"),
+@click.option("--key-out", "-k", "key_output_file", type=click.File("wb"),
               help="Output key")
+@click.option("--key-format",
+              type=click.Choice(["matrix", "seed"]),
+              default="matrix",
+              show_default=True,
+              help=("Write output key as the complete matrix, or only as"
+                    " the secret seed to regenerate it from"))
 @click.option("--only-center", is_flag=True,
               help=("Do not divide genotype dosages by standard deviation;"
                     " only center by subtracting mean"))
+@click.option("--chunk-size", type=click.IntRange(min=1),
+              help=("Read and encrypt the genotype this many SNPs at a time"
+                    " instead of all at once"))
+@click.option("--region", callback=region_option, help=REGION_HELP)
+@click.option("--format", "genotype_format",
+              type=click.Choice(["tsv", "binary", "bgzf"]),
+              help="Genotype ciphertext file format  [default: same as input]")
 @click.option("--force", "-f", is_flag=True,
               help="Overwrite output files even if they exist")
-def encrypt_command(genotype_file, phenotype_file, summary_file,
-                    key_blocks, key_input_file, key_output_file,
-                    only_center, force):
-    def write_ciphertext(plaintext_path, writer):
-        ciphertext_path = Path(plaintext_path + ".hegp")
-        if ciphertext_path.exists() and not force:
-            print(f"Output file {ciphertext_path} exists, cannot overwrite.")
+@click.option("--queue-depth", type=click.IntRange(min=0),
+              help=("Number of chunks that may wait to be encrypted, and to"
+                    " be written, while reading, encrypting and writing"
+                    " overlap; 0 to not overlap them"
+                    "  [default: 2, or 0 on a single core]"))
+@click.option("--resume", is_flag=True,
+              help=("Resume an interrupted encryption from the journals"
+                    " next to its genotype ciphertexts; genotype ciphertexts"
+                    " that are complete are skipped;"
+                    " needs --chunk-size, and a tsv or binary ciphertext"
+                    " format"))
+def encrypt_command(files, manifest_file, summary_file,
+                    key_blocks, key_sampler, key_input_file, key_output_file,
+                    key_format, only_center, chunk_size, region,
+                    genotype_format, force, queue_depth, resume):
+    # Genotype files are listed on the command line, in the manifest
+    # or both. They must all be of the same samples—for example, one
+    # file per chromosome. They are all encrypted with the same key
+    # and summary. The phenotype file, if any, is told apart from
+    # genotype files by its sample-id column.
+    genotype_paths = []
+    phenotype_paths = []
+    for path in chain(files,
+                      (line.strip()
+                       for line in (manifest_file or [])
+                       if line.strip())):
+        with open(path, "rb") as file:
+            (phenotype_paths if is_phenotype_file(file) else genotype_paths).append(path)
+    if not genotype_paths:
+        print("No genotype files to encrypt.")
+        sys.exit(1)
+    if len(phenotype_paths) > 1:
+        print("Cannot encrypt more than one phenotype file.")
+        sys.exit(1)
+    phenotype_path = phenotype_paths[0] if phenotype_paths else None
+
+    # Check all output files up front, so that we do not fail after
+    # encrypting some of the files.
+    for path in genotype_paths + phenotype_paths:
+        if (output_path := Path(path + ".hegp")).exists() and not (force or resume):
+            print(f"Output file {output_path} exists, cannot overwrite.")
+            if journal_path(output_path).exists():
+                with journal_path(output_path).open("rb") as file:
+                    _, _, complete = read_journal(file)
+                if not complete:
+                    print("Pass --resume to resume its interrupted encryption.")
             sys.exit(1)
-        with ciphertext_path.open("w") as ciphertext_file:
-            writer(ciphertext_file)
+    if resume and not key_input_file:
+        print("Cannot resume without the key of the interrupted encryption."
+              " Pass it with --key-in.")
+        sys.exit(1)
+    # Only chunked encryptions to resumable formats are journaled. An
+    # interrupted encryption of any other kind leaves behind a
+    # ciphertext that cannot be told apart from a complete one.
+    if resume and not chunk_size:
+        print("Cannot resume an encryption without --chunk-size.")
+        sys.exit(1)
+    if resume:
+        for path in genotype_paths:
+            if (format := ciphertext_format(path, genotype_format)) not in RESUMABLE_FORMATS:
+                print(f"Cannot resume an encryption to {format} genotype"
+                      f" ciphertext {path}.hegp.")
+                sys.exit(1)
 
-    genotype = read_genotype(genotype_file)
+    with stage("read genotype"):
+        sample_names = []
+        for path in genotype_paths:
+            with open(path, "rb") as file:
+                sample_names.append(genotype_sample_names(file))
+    if any(names != sample_names[0] for names in sample_names[1:]):
+        print("Cannot encrypt genotype files of different samples.")
+        sys.exit(1)
+    number_of_samples = len(sample_names[0])
+
+    genotype = None
     if summary_file:
-        summary = read_summary(summary_file)
-    else:
-        summary = genotype_summary(genotype)
-    if key_input_file:
-        key = read_key(key_input_file)
+        with stage("summary"):
+            summary = read_summary(summary_file)
     else:
-        number_of_samples = len(drop_metadata_columns(genotype).columns)
-        # We aim for this block size. But, to maximize the strength of
-        # the encryption, we must be careful to ensure that all blocks
-        # are of a similar size. If one block is too small, that block
-        # could be cracked easily.
-        target_block_size = 1500
-        key = random_key(np.random.default_rng(),
-                         number_of_samples,
-                         key_blocks or math.ceil(number_of_samples/target_block_size))
-    if key_output_file:
-        write_key(key_output_file, key)
+        if len(genotype_paths) == 1 and not chunk_size:
+            # Read a single genotype only once, and keep it for both
+            # the summary and encryption.
+            with stage("read genotype"), open(genotype_paths[0], "rb") as file:
+                genotype = read_region_genotype(file, region, compact=True)
+
+        def summaries(path):
+            if genotype is not None:
+                yield genotype_summary(genotype)
+                return
+            with open(path, "rb") as file:
+                if chunk_size:
+                    yield from genotype_summary_chunks(file, chunk_size, region)
+                else:
+                    with stage("read genotype"):
+                        region_genotype = read_region_genotype(file, region,
+                                                               compact=True)
+                    yield genotype_summary(region_genotype)
+
+        with stage("summary"):
+            try:
+                summary = concat_summaries(chain.from_iterable(
+                    map(summaries, genotype_paths)))
+            except ValueError as error:
+                print(f"Cannot summarize genotypes: {error}")
+                sys.exit(1)
+    with stage("key"):
+        if key_input_file:
+            key = read_key(key_input_file)
+        else:
+            # We aim for this block size. But, to maximize the strength
+            # of the encryption, we must be careful to ensure that all
+            # blocks are of a similar size. If one block is too small,
+            # that block could be cracked easily.
+            target_block_size = 1500
+            key = random_key_seed(number_of_samples,
+                                  key_blocks or math.ceil(number_of_samples/target_block_size),
+                                  sampler=key_sampler)
+        key_seed = key if isinstance(key, KeySeed) else None
+        if key_output_file and key_format == "seed" and not key_seed:
+            print("Input key is not a seed, cannot output key as seed.")
+            sys.exit(1)
+        key = materialize_key(key)
+        if key_output_file:
+            write_key(key_output_file, key_seed if key_format == "seed" else key)
+
+    # Only SNPs in region are encrypted. So, drop the others from the
+    # summary first, lest they be counted as dropped below.
+    summary = region_summary(summary, region)
 
     # Drop SNPs that have a zero standard deviation. Such SNPs
     # have no discriminatory power in the analysis and mess with
     # our standardization by causing a division by zero. This is
     # not a problem if we are only centering.
-    summary_subset = summary if only_center else drop_zero_stddev_snps(summary)
+    with stage("drop zero stddev SNPs"):
+        summary_subset = summary if only_center else drop_zero_stddev_snps(summary)
     if (dropped_zero_stddev_snps := len(summary.data) - len(summary_subset.data)) > 0:
         print(f"Dropped {dropped_zero_stddev_snps} SNP(s) with zero standard deviation")
 
     # Drop any SNPs that are not in both genotype and summary. Some
     # SNPs may have been dropped from the summary because they had a
     # zero standard deviation. Others may have been dropped because
-    # they were not present in all datasets.
-    common_genotype = drop_uncommon_snps(genotype, summary_subset)
-    if (dropped_uncommon_snps := len(genotype) - len(common_genotype) - dropped_zero_stddev_snps) > 0:
+    # they were not present in all datasets. Skip such SNPs while
+    # parsing the genotype, rather than parse them only to drop them
+    # later. Readers still report every SNP they read, so that the
+    # number of dropped SNPs is exact.
+    snps = summary_snps(summary_subset)
+    try:
+        index = summary_index(summary_subset)
+    except ValueError as error:
+        print(f"Cannot encrypt genotypes: {error}")
+        sys.exit(1)
+    def counted_genotype_chunks(file):
+        if genotype is not None:
+            return iter([(len(genotype), genotype)])
+        return staged("read genotype",
+                      read_counted_genotype_chunks(file, chunk_size, snps,
+                                                   region),
+                      count=lambda counted_chunk: counted_chunk[0])
+
+    def counted(counted_chunks):
+        for snps, chunk in counted_chunks:
+            advance(snps)
+            yield snps, chunk
+
+    def is_shardable(path):
+        with open(path, "rb") as file:
+            return region is None and is_sliceable(file)
+
+    sharded = bool(workers() > 1
+                   and len(genotype_paths) == 1
+                   and chunk_size
+                   and is_shardable(genotype_paths[0]))
+
+    # Journal the progress of encrypting a chunk at a time, so that an
+    # interrupted encryption may be resumed. Only a single chunk would
+    # be written without chunk_size; there is nothing to journal.
+    identities = {}
+    if chunk_size:
+        with stage("journal"):
+            identity = encryption_identity(key, summary_subset, only_center,
+                                           chunk_size, sharded)
+            for path in genotype_paths:
+                if (format := ciphertext_format(path, genotype_format)) in RESUMABLE_FORMATS:
+                    identities[path] = genotype_identity(identity, path, format)
+
+    # When resuming, continue ciphertexts from the checkpoints in
+    # their journals, and skip ciphertexts that are complete. Every
+    # existing ciphertext must have been encrypted like this one, lest
+    # we leave behind ciphertexts of different keys or summaries.
+    checkpoints = {}
+    pending_paths = []
+    for path in genotype_paths:
+        output_path = Path(path + ".hegp")
+        if resume and output_path.exists():
+            if not journal_path(output_path).exists():
+                print(f"Cannot resume {output_path}. It has no journal to"
+                      " tell what it was encrypted with.")
+                sys.exit(1)
+            with journal_path(output_path).open("rb") as file:
+                journal_identity, checkpoint, complete = read_journal(file)
+            if journal_identity != identities.get(path):
+                print(f"Cannot resume {output_path}. It was encrypted with a"
+                      " different key, summary, genotype or options.")
+                sys.exit(1)
+            if complete:
+                continue
+            checkpoints[path] = checkpoint
+        pending_paths.append(path)
+
+    with stage("write genotype"):
+        if workers() > 1 and (len(genotype_paths) > 1 or sharded):
+            # Encrypt in parallel worker processes, either many files
+            # at a time, or many shards—slices of about chunk_size
+            # SNPs—of a single file at a time. Compressed files cannot
+            # be split into shards, and regions are read from the
+            # index instead. The key is the largest input; put it in
+            # shared memory once rather than send a copy to every
+            # worker.
+            number_of_workers = (min(workers(), len(genotype_paths))
+                                 if len(genotype_paths) > 1
+                                 else workers())
+            with shared_arrays(key.blocks) as shared_key:
+                worker_arguments = {"number_of_workers": number_of_workers,
+                                    "initializer": start_encrypt_worker,
+                                    "initargs": (shared_key,
+                                                 summary_subset,
+                                                 only_center,
+                                                 chunk_size,
+                                                 region,
+                                                 genotype_format,
+                                                 number_of_workers)}
+                if len(genotype_paths) > 1:
+                    counts = list(parallel_map(encrypt_genotype_file_in_worker,
+                                               [(path,
+                                                 identities.get(path),
+                                                 checkpoints.get(path))
+                                                for path in pending_paths],
+                                               **worker_arguments))
+                    for snps, _ in counts:
+                        advance(snps)
+                else:
+                    # Shards are encrypted out of order, but
+                    # parallel_map yields them in order. So, the
+                    # ciphertext is the same as when encrypting
+                    # serially.
+                    counts = []
+                    for path in pending_paths:
+                        with open(path, "rb") as file:
+                            counts.append(write_encrypted_genotype_file(
+                                path,
+                                lambda skip: counted(parallel_map(
+                                    encrypt_genotype_slice,
+                                    genotype_slices(file, chunk_size)[skip:],
+                                    **worker_arguments)),
+                                ciphertext_format(path, genotype_format),
+                                True,
+                                identities.get(path),
+                                checkpoints.get(path)))
+        else:
+            counts = []
+            for path in pending_paths:
+                with open(path, "rb") as file:
+                    counts.append(write_encrypted_genotype_file(
+                        path,
+                        lambda skip: pipelined_encrypt_counted_chunks(
+                            islice(counted_genotype_chunks(file), skip, None),
+                            key,
+                            summary_subset,
+                            only_center,
+                            index,
+                            queue_depth),
+                        ciphertext_format(path, genotype_format),
+                        True,
+                        identities.get(path),
+                        checkpoints.get(path)))
+    number_of_snps = sum(snps for snps, _ in counts)
+    number_of_common_snps = sum(common_snps for _, common_snps in counts)
+    # SNPs of skipped ciphertexts are not counted. So, we cannot tell
+    # how many SNPs were dropped from them.
+    if (len(pending_paths) == len(genotype_paths)
+        and (dropped_uncommon_snps := number_of_snps - number_of_common_snps - dropped_zero_stddev_snps) > 0):
         print(f"Dropped {dropped_uncommon_snps} SNP(s) that were not present in all datasets")
 
-    encrypted_genotype = encrypt_genotype(common_genotype,
-                                          key,
-                                          summary_subset,
-                                          only_center)
-    write_ciphertext(genotype_file.name,
-                     lambda file: write_genotype(file, encrypted_genotype))
+    if phenotype_path:
+        with stage("encrypt phenotype"), open(phenotype_path) as phenotype_file:
+            write_output_file(Path(phenotype_path + ".hegp"),
+                              lambda file:
+                              write_phenotype(file, encrypt_phenotype(
+                                  read_phenotype(phenotype_file),
+                                  key)),
+                              True)
 
+@main.command("decrypt")
+@click.argument("genotype-file", type=click.File("rb"))
+@click.argument("phenotype-file", type=click.File("rb"), required=False)
+@click.option("--key-in", "key_input_file", type=click.File("rb"),
+              required=True,
+              help="Key (or key seed) the ciphertexts were encrypted with")
+@click.option("--summary", "-s", "summary_file", type=click.File("rb"),
+              help=("Summary statistics file the genotype was standardized"
+                    " with. Without it, the decrypted genotype remains"
+                    " standardized."))
+@click.option("--only-center", is_flag=True,
+              help="Genotype dosages were only centered, not standardized")
+@click.option("--chunk-size", type=click.IntRange(min=1),
+              help=("Read and decrypt the genotype this many SNPs at a time"
+                    " instead of all at once"))
+@click.option("--format", "genotype_format",
+              type=click.Choice(["tsv", "binary", "bgzf"]),
+              help="Decrypted genotype file format  [default: same as input]")
+@click.option("--output", "-o", "output_path",
+              type=click.Path(dir_okay=False),
+              help=("Decrypted genotype file  [default: genotype ciphertext"
+                    " file name with its .hegp extension replaced by"
+                    " .decrypted]"))
+@click.option("--phenotype-output", "phenotype_output_path",
+              type=click.Path(dir_okay=False),
+              help=("Decrypted phenotype file  [default: phenotype ciphertext"
+                    " file name with its .hegp extension replaced by"
+                    " .decrypted]"))
+@click.option("--force", "-f", is_flag=True,
+              help="Overwrite output files even if they exist")
+def decrypt_command(genotype_file, phenotype_file, key_input_file,
+                    summary_file, only_center, chunk_size, genotype_format,
+                    output_path, phenotype_output_path, force):
+    def write_plaintext(ciphertext_path, output_path, writer):
+        # Stripping the .hegp extension added by encryption would name
+        # the output after the original plaintext, which is often
+        # right next to the ciphertext. Worse, the plaintext of a PLINK
+        # genotype is a .bed file that is part of a fileset, and the
+        # output is not a PLINK genotype. So, never default to that
+        # name.
+        ciphertext_path = Path(ciphertext_path)
+        path = (Path(output_path)
+                if output_path
+                else ciphertext_path.with_name(
+                        (ciphertext_path.stem
+                         if ciphertext_path.suffix == ".hegp"
+                         else ciphertext_path.name)
+                        + ".decrypted"))
+        if (path.exists()
+            and ciphertext_path.exists()
+            and path.samefile(ciphertext_path)):
+            print(f"Output file {path} is the ciphertext, cannot overwrite.")
+            sys.exit(1)
+        write_output_file(path, writer, force)
+
+    genotype_format = genotype_format or genotype_content_format(genotype_file)
+    with stage("key"):
+        key = materialize_key(read_key(key_input_file))
+    with stage("summary"):
+        summary = read_summary(summary_file) if summary_file else None
+    with stage("write genotype"):
+        write_plaintext(
+            genotype_file.name,
+            output_path,
+            lambda file: write_genotype_chunks(
+                file,
+                decrypt_genotype_chunks(
+                    staged("read genotype",
+                           genotype_file_chunks(genotype_file, chunk_size),
+                           count=True),
+                    key,
+                    summary,
+                    only_center),
+                genotype_format))
     if phenotype_file:
-        write_ciphertext(phenotype_file.name,
-                         lambda file:
-                         write_phenotype(file, encrypt_phenotype(
-                             read_phenotype(phenotype_file),
-                             key)))
+        with stage("decrypt phenotype"):
+            write_plaintext(phenotype_file.name,
+                            phenotype_output_path,
+                            lambda file:
+                            write_phenotype(file, decrypt_phenotype(
+                                read_phenotype(phenotype_file),
+                                key)))
 
 @main.command("cat-genotype")
 @click.option("--output", "-o", "output_file",
               type=click.File("wb"),
               default="-",
               help="output file")
+@click.option("--format", "genotype_format",
+              type=click.Choice(["tsv", "binary", "bgzf"]),
+              help=("Output file format"
+                    "  [default: binary if output file name has a"
+                    f" {BINARY_GENOTYPE_EXTENSION} extension, bgzf if it has a"
+                    f" {COMPRESSED_GENOTYPE_EXTENSION} extension, else tsv]"))
+@click.option("--chunk-size", type=click.IntRange(min=1),
+              help=("Read and concatenate ciphertexts this many SNPs at a time"
+                    " instead of all at once. Ciphertexts must be sorted by"
+                    " chromosome, in the same chromosome order, and then"
+                    " position."))
+@click.option("--region", callback=region_option, help=REGION_HELP)
 @click.argument("ciphertext-files", type=click.File("rb"), nargs=-1)
-def cat_genotype_command(output_file, ciphertext_files):
-    write_genotype(output_file,
-                   cat_genotype([read_genotype(file)
-                                 for file in ciphertext_files]))
+def cat_genotype_command(output_file, genotype_format, chunk_size, region,
+                         ciphertext_files):
+    genotype_format = genotype_format or genotype_file_format(output_file.name)
+    if chunk_size and ciphertext_files:
+        try:
+            with stage("write genotype"):
+                write_genotype_chunks(output_file,
+                                      staged("join",
+                                             cat_genotype_chunks(
+                                                 [staged("read genotype",
+                                                         (chunk
+                                                          for _, chunk
+                                                          in read_selected_genotype_chunks(
+                                                              file, chunk_size,
+                                                              region=region)))
+                                                  for file in ciphertext_files]),
+                                             count=True),
+                                      genotype_format)
+        except ValueError as error:
+            print(f"Cannot concatenate genotypes: {error}")
+            sys.exit(1)
+    else:
+        with stage("read genotype"):
+            genotypes = [read_region_genotype(file, region)
+                         for file in ciphertext_files]
+        with stage("join"):
+            genotype = cat_genotype(genotypes)
+        with stage("write genotype"):
+            write_genotype(output_file, genotype, genotype_format)
 
 @main.command("cat-phenotype")
 @click.option("--output", "-o", "output_file",
@@ -310,9 +1311,21 @@ def cat_genotype_command(output_file, ciphertext_files):
               help="output file")
 @click.argument("ciphertext-files", type=click.File("rb"), nargs=-1)
 def cat_phenotype_command(output_file, ciphertext_files):
-    write_phenotype(output_file,
-                    cat_phenotype([read_phenotype(file)
-                                   for file in ciphertext_files]))
+    headers = [read_tsv_header(file) for file in ciphertext_files]
+    if ciphertext_files and all(header == headers[0] for header in headers):
+        # All ciphertexts have the same columns in the same order. So,
+        # rows may be copied as they are. This is much faster than
+        # parsing and formatting them, and loses no precision.
+        with stage("copy phenotype"):
+            cat_tsv_data(output_file, headers[0], ciphertext_files)
+    else:
+        # Columns must be reordered. Parse the ciphertexts, putting
+        # back the header lines we have already read.
+        with stage("read phenotype"):
+            phenotypes = [read_phenotype(io.BytesIO(header + b"\n" + file.read()))
+                          for header, file in zip(headers, ciphertext_files)]
+        with stage("write phenotype"):
+            write_phenotype(output_file, cat_phenotype(phenotypes))
 
 if __name__ == "__main__":
     main()
@@ -17,56 +17,359 @@
 ### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
 
 from collections import namedtuple
+from functools import lru_cache
 import csv
-from itertools import takewhile
+import gzip
+import io
+from itertools import chain, compress, islice, pairwise, takewhile
+import math
+from pathlib import Path
 
-import numpy as np
-import pandas as pd
+from pyhegp.bgzf import BLOCK_DATA_SIZE, GZIP_MAGIC, read_lines, virtual_offset, write_bgzf
+from pyhegp.linalg import BlockDiagonalMatrix, to_block_diagonal_matrix
+from pyhegp.plink import BED_HEADER_SIZE, BED_MAGIC, SNP_MAJOR_MODE, PackedDosages, bytes_per_snp, read_bim, read_fam
+from pyhegp.utils import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 SUMMARY_HEADER = b"# pyhegp summary file version 1\n"
+BINARY_SUMMARY_HEADER = b"# pyhegp summary file version 2\n"
+GENOTYPE_HEADER = b"# pyhegp genotype file version 2\n"
+KEY_HEADER = b"# pyhegp key file version 2\n"
+KEY_SEED_HEADER = b"# pyhegp key seed file version 1\n"
+GENOTYPE_INDEX_HEADER = b"# pyhegp genotype index file version 1\n"
+
+# Binary genotype files are written when the output file name has
+# this extension.
+BINARY_GENOTYPE_EXTENSION = ".hgb"
+
+# Compressed (BGZF) genotype files are written when the output file
+# name has this extension.
+COMPRESSED_GENOTYPE_EXTENSION = ".gz"
+
+# The index of a compressed genotype file is written next to it, with
+# this extension appended to its name.
+GENOTYPE_INDEX_EXTENSION = ".hgi"
+
+# Arrays in binary files start at offsets that are multiples of this
+# alignment so that they may be memory-mapped efficiently.
+ALIGNMENT = 64
 
 Summary = namedtuple("Summary", "n data")
 
+# A key seed is a compact description of a random key. The key is
+# regenerated by seeding bit_generator with entropy, and sampling
+# rotations of the given block sizes with sampler.
+KeySeed = namedtuple("KeySeed", "bit_generator sampler entropy block_sizes")
+
 def peek(file):
+    # Use the read buffer when there is one so that this works on
+    # pipes too.
+    if hasattr(file, "peek"):
+        return file.peek(1)[:1]
     c = file.read(1)
     file.seek(-1, 1)
     return c
 
+def starts_with(file, prefix):
+    # Check if the unread part of file starts with prefix without
+    # consuming it. Use the read buffer when there is one so that this
+    # works on pipes too.
+    if hasattr(file, "peek"):
+        return file.peek(len(prefix))[:len(prefix)] == prefix
+    position = file.tell()
+    result = file.read(len(prefix)) == prefix
+    file.seek(position)
+    return result
+
 def header_lines(file):
     while peek(file) == b"#":
         yield file.readline()
 
-def read_summary_headers(file):
-    assert (file.readline().decode("ascii").lstrip("#").lstrip()
-            == SUMMARY_HEADER.decode("ascii").lstrip("#").lstrip())
-    return dict(line.decode("ascii").rstrip("\n").lstrip("#").lstrip().split(" ", maxsplit=1)
+def header_line_text(line):
+    return line.decode("ascii").lstrip("#").lstrip()
+
+def read_properties(file):
+    return dict(header_line_text(line).rstrip("\n").split(" ", maxsplit=1)
                 for line in header_lines(file))
 
+def read_headers(file, header):
+    assert header_line_text(file.readline()) == header_line_text(header)
+    return read_properties(file)
+
+def read_summary_headers(file):
+    return read_headers(file, SUMMARY_HEADER)
+
+def write_headers(file, header, properties):
+    # Return the number of bytes written.
+    return (file.write(header)
+            + sum(file.write(f"# {key} {value}\n".encode("ascii"))
+                  for key, value in properties.items()))
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def write_padding(file, offset):
+    # Pad file with NUL bytes up to the next aligned offset. offset is
+    # the number of bytes already written to file. We count bytes
+    # ourselves rather than use file.tell() so that we can write to
+    # pipes.
+    return offset + file.write(bytes(aligned(offset) - offset))
+
+def write_array(file, array):
+    # Write array as raw little-endian data, and return the number of
+    # bytes written.
+    array = np.ascontiguousarray(array,
+                                 dtype=array.dtype.newbyteorder("<"))
+    file.write(array)
+    return array.nbytes
+
+def write_arrays(file, offset, arrays):
+    # Write arrays one after the other, each starting at an aligned
+    # offset.
+    for array in arrays:
+        offset = write_padding(file, offset)
+        offset += write_array(file, array)
+    return offset
+
+def write_via_memory(file, writer):
+    # Binary files fill in their header after everything else, which
+    # means rewinding file. Files that cannot be rewound, such as
+    # pipes, are written to memory first, and then copied to file.
+    # Return what writer returns.
+    buffer = io.BytesIO()
+    result = writer(buffer)
+    file.write(buffer.getbuffer())
+    return result
+
+def read_into_memory(file):
+    # Binary files are read at random. Read files that cannot be
+    # seeked, such as pipes, into memory.
+    return file if file.seekable() else io.BytesIO(file.read())
+
+def read_array(file, offset, dtype, shape):
+    # Memory-map the array if file supports it. Else, fall back to
+    # reading it into memory.
+    dtype = np.dtype(dtype).newbyteorder("<")
+    if math.prod(shape) == 0:
+        return np.empty(shape, dtype=dtype)
+    try:
+        return np.memmap(file, dtype=dtype, mode="r",
+                         offset=offset, shape=shape)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        file.seek(offset)
+        return (np.frombuffer(file.read(math.prod(shape) * dtype.itemsize),
+                              dtype=dtype)
+                .reshape(shape))
+
+def read_arrays(file, offset, specs):
+    # Read arrays written by write_arrays starting at offset, and
+    # return them as a list. specs is a list of (dtype, shape) pairs,
+    # one for each array.
+    arrays = []
+    for dtype, shape in specs:
+        offset = aligned(offset)
+        arrays.append(read_array(file, offset, dtype, shape))
+        offset += math.prod(shape) * np.dtype(dtype).itemsize
+    return arrays
+
+# Lists of strings are stored in binary files as UTF-8 text, with
+# each string terminated by a newline.
+
+def text_array(strings):
+    return np.frombuffer("".join(f"{string}\n" for string in strings)
+                         .encode("utf-8"),
+                         dtype="u1")
+
+def from_text_array(array):
+    return array.tobytes().decode("utf-8").split("\n")[:-1]
+
+def read_summary_data(file, chunksize=None):
+    data = pd.read_csv(file,
+                       sep="\t",
+                       header=0,
+                       dtype={"chromosome": "str",
+                              "position": "int",
+                              "reference": "str",
+                              "mean": "float",
+                              "standard-deviation": "float"},
+                       na_filter=False,
+                       chunksize=chunksize)
+    def rename(df):
+        return df.rename(columns={"standard-deviation": "std"})
+    return rename(data) if chunksize is None else map(rename, data)
+
+def is_binary_summary(file):
+    return starts_with(file, BINARY_SUMMARY_HEADER)
+
+# A binary (version 2) summary file opened for reading. Arrays are
+# memory-mapped. statistics is a number of SNPs × 2 matrix of means
+# and standard deviations. Chromosomes and reference alleles repeat a
+# lot. So, they are stored as tables of distinct strings, and each
+# SNP has an index into these tables.
+BinarySummary = namedtuple("BinarySummary",
+                           ("n statistics positions"
+                            " chromosome_indices chromosome_table"
+                            " reference_indices reference_table"))
+
+def open_binary_summary(file):
+    file = read_into_memory(file)
+    properties = read_headers(file, BINARY_SUMMARY_HEADER)
+    number_of_snps = int(properties["number-of-snps"])
+    reference_present = "reference-table-bytes" in properties
+    (statistics, positions, chromosome_indices, chromosome_table,
+     *references) = read_arrays(
+         file,
+         file.tell(),
+         [("float64", (number_of_snps, 2)),
+          ("int64", (number_of_snps,)),
+          ("int32", (number_of_snps,)),
+          ("u1", (int(properties["chromosome-table-bytes"]),))]
+         + ([("int32", (number_of_snps,)),
+             ("u1", (int(properties["reference-table-bytes"]),))]
+            if reference_present
+            else []))
+    reference_indices, reference_table = (references
+                                          if reference_present
+                                          else (None, None))
+    def table(array):
+        return np.array(from_text_array(array), dtype=object)
+    return BinarySummary(int(properties["number-of-samples"]),
+                         statistics,
+                         positions,
+                         chromosome_indices,
+                         table(chromosome_table),
+                         reference_indices,
+                         table(reference_table) if reference_present else None)
+
+def binary_summary_rows(summary, start, stop):
+    # Return SNPs start to stop of summary as a data frame.
+    return pd.DataFrame({"chromosome": pd.Series(
+                             summary.chromosome_table[
+                                 summary.chromosome_indices[start:stop]],
+                             dtype="str"),
+                         "position": summary.positions[start:stop]}
+                        | ({"reference": pd.Series(
+                                summary.reference_table[
+                                    summary.reference_indices[start:stop]],
+                                dtype="str")}
+                           if summary.reference_table is not None
+                           else {})
+                        | {"mean": summary.statistics[start:stop, 0],
+                           "std": summary.statistics[start:stop, 1]})
+
 def read_summary(file):
+    # Summary files of both versions are read. Version 2 files are
+    # binary, and need no parsing.
+    if is_binary_summary(file):
+        summary = open_binary_summary(file)
+        return Summary(summary.n,
+                       binary_summary_rows(summary, 0, len(summary.positions)))
     headers = read_summary_headers(file)
     return Summary(int(headers["number-of-samples"]),
-                   pd.read_csv(file,
-                               sep="\t",
-                               header=0,
-                               dtype={"chromosome": "str",
-                                      "position": "int",
-                                      "reference": "str",
-                                      "mean": "float",
-                                      "standard-deviation": "float"},
-                               na_filter=False)
-                   .rename(columns={"standard-deviation": "std"}))
-
-def write_summary(file, summary):
+                   read_summary_data(file))
+
+def read_summary_chunks(file, chunk_size):
+    # Return a summary whose data is an iterator over data frames of
+    # at most chunk_size SNPs each.
+    if is_binary_summary(file):
+        summary = open_binary_summary(file)
+        return Summary(summary.n,
+                       (binary_summary_rows(summary, start, start+chunk_size)
+                        for start in range(0,
+                                           max(len(summary.positions), 1),
+                                           chunk_size)))
+    headers = read_summary_headers(file)
+    return Summary(int(headers["number-of-samples"]),
+                   (chunk.reset_index(drop=True)
+                    for chunk in read_summary_data(file, chunk_size)))
+
+def write_tsv_summary_chunks(file, n, chunks):
+    # Write summary data one chunk at a time. Only the first chunk is
+    # written with column labels.
     file.write(SUMMARY_HEADER)
-    file.write(f"# number-of-samples {summary.n}\n".encode("ascii"))
-    (summary.data
-     .rename(columns={"std": "standard-deviation"})
-     .to_csv(file,
-             sep="\t",
-             float_format="%.8g",
-             index=False))
-
-def read_tsv(file, dtype):
+    file.write(f"# number-of-samples {n}\n".encode("ascii"))
+    for i, data in enumerate(chunks):
+        (data
+         .rename(columns={"std": "standard-deviation"})
+         .to_csv(file,
+                 sep="\t",
+                 float_format="%.8g",
+                 header=(i == 0),
+                 index=False))
+
+def table_indices(table, strings):
+    # Add strings not already in table, a dictionary mapping strings to
+    # their indices, and return the index of each of strings.
+    for string in pd.unique(strings):
+        table.setdefault(string, len(table))
+    return strings.map(table).to_numpy(dtype="int32")
+
+def write_binary_summary_chunks(file, n, chunks):
+    # This follows write_binary_genotype_chunks, with the matrix of
+    # means and standard deviations in place of dosages.
+    if not file.seekable():
+        return write_via_memory(
+            file, lambda buffer: write_binary_summary_chunks(buffer, n, chunks))
+    chunks = iter(chunks)
+    first_chunk = next(chunks)
+    reference_present = "reference" in first_chunk.columns
+
+    def headers(number_of_snps, chromosome_table_bytes, reference_table_bytes):
+        return ({"number-of-snps": f"{number_of_snps:20d}",
+                 "number-of-samples": n,
+                 "chromosome-table-bytes": f"{chromosome_table_bytes:20d}"}
+                | ({"reference-table-bytes": f"{reference_table_bytes:20d}"}
+                   if reference_present
+                   else {}))
+
+    offset = write_padding(file, write_headers(file, BINARY_SUMMARY_HEADER,
+                                               headers(0, 0, 0)))
+    positions = []
+    chromosome_table = {}
+    chromosome_indices = []
+    reference_table = {}
+    reference_indices = []
+    for chunk in chain([first_chunk], chunks):
+        offset += write_array(file,
+                              chunk[["mean", "std"]].to_numpy(dtype="float64"))
+        positions.append(chunk.position.to_numpy(dtype="int64"))
+        chromosome_indices.append(table_indices(chromosome_table,
+                                                chunk.chromosome))
+        if reference_present:
+            reference_indices.append(table_indices(reference_table,
+                                                   chunk.reference))
+    positions = np.concatenate(positions)
+    chromosome_table = text_array(chromosome_table)
+    reference_table = text_array(reference_table)
+    write_arrays(file, offset,
+                 [positions,
+                  np.concatenate(chromosome_indices),
+                  chromosome_table]
+                 + ([np.concatenate(reference_indices), reference_table]
+                    if reference_present
+                    else []))
+    file.seek(0)
+    write_headers(file, BINARY_SUMMARY_HEADER,
+                  headers(len(positions),
+                          len(chromosome_table),
+                          len(reference_table)))
+    file.seek(0, io.SEEK_END)
+
+def write_summary_chunks(file, n, chunks, format="tsv"):
+    match format:
+        case "tsv":
+            write_tsv_summary_chunks(file, n, chunks)
+        case "binary":
+            write_binary_summary_chunks(file, n, chunks)
+        case _:
+            raise ValueError(f"Unknown summary file format {format}")
+
+def write_summary(file, summary, format="tsv"):
+    write_summary_chunks(file, summary.n, [summary.data], format)
+
+def read_tsv(file, dtype, chunksize=None):
     return pd.read_csv(file,
                        dtype=dtype,
                        quoting=csv.QUOTE_NONE,
@@ -76,15 +379,17 @@ def read_tsv(file, dtype):
                        # frame with only spaces separated by tabs.
                        # This is valid TSV, even though it is a weird
                        # data file.
-                       skip_blank_lines=False)
+                       skip_blank_lines=False,
+                       chunksize=chunksize)
 
 def is_genotype_metadata_column(name):
     return name.lower() in {"chromosome", "position", "reference"}
 
-def read_genotype(file):
-    df = read_tsv(file, {"chromosome": "str",
-                         "position": "int",
-                         "reference": "str"})
+GENOTYPE_DTYPES = {"chromosome": "str",
+                   "position": "int",
+                   "reference": "str"}
+
+def genotype_frame(df):
     sample_columns = [column
                       for column in df.columns
                       if not is_genotype_metadata_column(column)]
@@ -95,6 +400,477 @@ def read_genotype(file):
     df[sample_columns] = df[sample_columns].astype("float")
     return df
 
+def is_binary_genotype(file):
+    return starts_with(file, GENOTYPE_HEADER)
+
+def is_plink_genotype(file):
+    return starts_with(file, BED_MAGIC)
+
+def is_memory_mapped_genotype(file):
+    # Genotypes whose SNPs may be read at random, without parsing
+    return is_binary_genotype(file) or is_plink_genotype(file)
+
+def genotype_file_format(path):
+    suffixes = Path(path).suffixes
+    if BINARY_GENOTYPE_EXTENSION in suffixes:
+        return "binary"
+    elif COMPRESSED_GENOTYPE_EXTENSION in suffixes:
+        return "bgzf"
+    else:
+        return "tsv"
+
+def is_gzip(file):
+    return starts_with(file, GZIP_MAGIC)
+
+def genotype_content_format(file):
+    # Like genotype_file_format, but tell the format from the content
+    # of file rather than its name.
+    if is_binary_genotype(file):
+        return "binary"
+    elif is_plink_genotype(file):
+        return "plink"
+    elif is_gzip(file):
+        return "bgzf"
+    else:
+        return "tsv"
+
+def text_genotype_file(file):
+    # Decompress TSV genotype files on the fly. BGZF files are gzip
+    # files too.
+    return gzip.GzipFile(fileobj=file, mode="rb") if is_gzip(file) else file
+
+def is_sliceable(file):
+    # Can genotype_slices split file? Compressed files cannot be
+    # split at arbitrary byte offsets.
+    return is_regular_file(file) and not is_gzip(file)
+
+# A region of a chromosome. start and end are inclusive positions,
+# or None if the region is unbounded on that side.
+Region = namedtuple("Region", "chromosome start end")
+
+def parse_region(text):
+    # Parse a region written as chromosome, chromosome:start-end or
+    # chromosome:start-. Commas in numbers are ignored.
+    chromosome, colon, interval = text.rpartition(":")
+    if not colon:
+        return Region(text, None, None)
+    start, hyphen, end = interval.replace(",", "").partition("-")
+    if not (chromosome and hyphen and start.isdigit()
+            and (end.isdigit() or end == "")):
+        raise ValueError(f"Invalid region {text}")
+    return Region(chromosome, int(start), int(end) if end else None)
+
+def in_region(region, key):
+    chromosome, position = key
+    return (chromosome == region.chromosome
+            and (region.start is None or position >= region.start)
+            and (region.end is None or position <= region.end))
+
+def select_snps(keys, snps=None, region=None):
+    # Return the number of (chromosome, position) keys in region, and
+    # a boolean array of whether each key is both in region and in
+    # snps. snps and region may be None to select everything.
+    number_in_region = 0
+    selected = []
+    for key in keys:
+        if region is None or in_region(region, key):
+            number_in_region += 1
+            selected.append(snps is None or key in snps)
+        else:
+            selected.append(False)
+    return number_in_region, np.array(selected, dtype=bool)
+
+# A binary genotype file opened for reading. Arrays are
+# memory-mapped. chromosome_ends and reference_ends are the offsets
+# at which each string in the chromosome and reference text arrays
+# ends. They let us read the metadata of a range of SNPs without
+# decoding all of it.
+BinaryGenotype = namedtuple("BinaryGenotype",
+                            ("sample_names dosages positions"
+                             " chromosomes chromosome_ends"
+                             " references reference_ends"))
+
+def text_array_ends(array):
+    return np.flatnonzero(array == ord("\n")) + 1
+
+def text_array_slice(array, ends, start, stop):
+    return from_text_array(array[(ends[start-1] if start > 0 else 0)
+                                 :(ends[stop-1] if stop > 0 else 0)])
+
+def open_binary_genotype(file):
+    file = read_into_memory(file)
+    properties = read_headers(file, GENOTYPE_HEADER)
+    number_of_snps = int(properties["number-of-snps"])
+    number_of_samples = int(properties["number-of-samples"])
+    reference_present = "reference-bytes" in properties
+    sample_names, dosages, positions, chromosomes, *references = read_arrays(
+        file,
+        file.tell(),
+        [("u1", (int(properties["sample-ids-bytes"]),)),
+         ("float64", (number_of_snps, number_of_samples)),
+         ("int64", (number_of_snps,)),
+         ("u1", (int(properties["chromosome-bytes"]),))]
+        + ([("u1", (int(properties["reference-bytes"]),))]
+           if reference_present
+           else []))
+    references = references[0] if reference_present else None
+    return BinaryGenotype(from_text_array(sample_names),
+                          dosages,
+                          positions,
+                          chromosomes,
+                          text_array_ends(chromosomes),
+                          references,
+                          text_array_ends(references) if reference_present else None)
+
+@lru_cache(maxsize=4)
+def plink_metadata(path, size, mtime):
+    # Read the .bim and .fam files of the .bed file at path into a
+    # binary genotype without dosages. Parsing a large .bim file is
+    # slow, and workers open the same .bed file once for every slice
+    # they read. So, remember the last few. size and mtime of the .bed
+    # file are only there to forget files that have changed.
+    snps = read_bim(path.with_suffix(".bim"))
+    sample_names = read_fam(path.with_suffix(".fam"))
+    if size != BED_HEADER_SIZE + len(snps) * bytes_per_snp(len(sample_names)):
+        raise ValueError(f"Size of {path} does not match its .bim and .fam files")
+    chromosomes = text_array(snps.chromosome)
+    references = text_array(snps.allele2)
+    return BinaryGenotype(sample_names,
+                          None,
+                          snps.position.to_numpy(),
+                          chromosomes,
+                          text_array_ends(chromosomes),
+                          references,
+                          text_array_ends(references))
+
+def open_plink_genotype(file):
+    # Open a PLINK .bed file as a binary genotype whose dosages are
+    # decoded as they are read. Its .bim and .fam files are found by
+    # name. Dosages count the first allele of the .bim file, and so
+    # its second allele is the reference.
+    if not is_regular_file(file):
+        raise ValueError("PLINK genotypes must be read from a .bed file"
+                         " with .bim and .fam files next to it")
+    path = Path(file.name)
+    file.seek(0)
+    header = file.read(BED_HEADER_SIZE)
+    if header[len(BED_MAGIC):] != bytes([SNP_MAJOR_MODE]):
+        raise ValueError(f"{path} is not a SNP-major PLINK .bed file")
+    stat = path.stat()
+    genotype = plink_metadata(path, stat.st_size, stat.st_mtime_ns)
+    return genotype._replace(
+        dosages=PackedDosages(read_array(file, BED_HEADER_SIZE, "u1",
+                                         (len(genotype.positions),
+                                          bytes_per_snp(len(genotype.sample_names)))),
+                              len(genotype.sample_names)))
+
+def open_memory_mapped_genotype(file):
+    return (open_plink_genotype(file)
+            if is_plink_genotype(file)
+            else open_binary_genotype(file))
+
+def binary_genotype_keys(genotype, start, stop):
+    # Return the (chromosome, position) keys of SNPs start to stop.
+    start = min(start, len(genotype.positions))
+    stop = min(stop, len(genotype.positions))
+    return list(zip(text_array_slice(genotype.chromosomes,
+                                     genotype.chromosome_ends,
+                                     start, stop),
+                    genotype.positions[start:stop].tolist()))
+
+def binary_genotype_rows(genotype, start, stop, selected=None):
+    # Return SNPs start to stop of genotype as a data frame. The
+    # dosage matrix is memory-mapped, not read or copied. If selected,
+    # a boolean array, is given, return only the selected SNPs. Only
+    # their dosages are then read, and copied.
+    start = min(start, len(genotype.positions))
+    stop = min(stop, len(genotype.positions))
+    chromosomes = text_array_slice(genotype.chromosomes,
+                                   genotype.chromosome_ends,
+                                   start, stop)
+    positions = genotype.positions[start:stop]
+    references = (text_array_slice(genotype.references,
+                                   genotype.reference_ends,
+                                   start, stop)
+                  if genotype.references is not None
+                  else None)
+    if selected is None:
+        dosages = genotype.dosages[start:stop]
+    else:
+        chromosomes = list(compress(chromosomes, selected))
+        positions = positions[selected]
+        if references is not None:
+            references = list(compress(references, selected))
+        dosages = genotype.dosages[start + np.flatnonzero(selected)]
+    return pd.concat((pd.DataFrame({"chromosome": pd.Series(chromosomes,
+                                                            dtype="str"),
+                                    "position": positions}
+                                   | ({"reference": pd.Series(references,
+                                                              dtype="str")}
+                                      if references is not None
+                                      else {})),
+                      pd.DataFrame(dosages,
+                                   columns=genotype.sample_names,
+                                   copy=False)),
+                     axis="columns")
+
+def selected_binary_genotype_rows(genotype, start, stop, snps, region):
+    # Return the number of SNPs start to stop in region, and those of
+    # them that are in snps.
+    number_in_region, selected = select_snps(
+        binary_genotype_keys(genotype, start, stop), snps, region)
+    return number_in_region, binary_genotype_rows(genotype, start, stop,
+                                                  selected)
+
+def read_binary_genotype(file):
+    genotype = open_memory_mapped_genotype(file)
+    return binary_genotype_rows(genotype, 0, len(genotype.positions))
+
+# Dosages are converted between storage and float64 this many bytes
+# of float64 at a time.
+DOSAGE_BLOCK_BYTES = 2**24
+
+# Compact dosage types, narrowest first
+COMPACT_DOSAGE_DTYPES = ["int8", "float16"]
+
+def dosage_block_size(number_of_samples):
+    # Number of SNPs in a block of DOSAGE_BLOCK_BYTES
+    return max(DOSAGE_BLOCK_BYTES // (8 * max(number_of_samples, 1)), 1)
+
+def compact_dosage_dtype(dosages):
+    # Return the narrowest type that holds all dosages exactly. Hard
+    # calls fit in int8. Dosages quantized to a binary fraction fit in
+    # float16. Narrowing is never lossy; it must not change
+    # ciphertexts.
+    with np.errstate(invalid="ignore", over="ignore"):
+        for dtype in COMPACT_DOSAGE_DTYPES:
+            if np.array_equal(dosages.astype(dtype), dosages):
+                return np.dtype(dtype)
+    return dosages.dtype
+
+def compact_genotype(chunks):
+    # Concatenate genotype chunks into one genotype, and store its
+    # dosages in the narrowest type that holds them exactly. Each
+    # chunk is narrowed as it comes. So, when chunks are read lazily,
+    # dosages are never all float64 at once.
+    metadata = []
+    dosages = []
+    for chunk in chunks:
+        sample_names = [column
+                        for column in chunk.columns
+                        if not is_genotype_metadata_column(column)]
+        metadata.append(chunk.drop(columns=sample_names))
+        block = chunk[sample_names].to_numpy()
+        dosages.append(block.astype(compact_dosage_dtype(block)))
+    return pd.concat((pd.concat(metadata, ignore_index=True),
+                      pd.DataFrame(np.concatenate(dosages,
+                                                  dtype=np.result_type(
+                                                      *(block.dtype
+                                                        for block in dosages))),
+                                   columns=sample_names,
+                                   copy=False)),
+                     axis="columns")
+
+def read_genotype(file, compact=False):
+    # If compact, store dosages of a text or PLINK genotype in the
+    # narrowest type that holds them exactly rather than in float64.
+    # Dosages of binary genotypes are memory-mapped rather than
+    # copied, and so are left as they are. Reading a block at a time
+    # needs the number of samples up front, and so a file that can be
+    # rewound; others, such as pipes, are read all at once and then
+    # narrowed.
+    if compact and not is_binary_genotype(file):
+        if not file.seekable():
+            return compact_genotype([read_genotype(file)])
+        return compact_genotype(read_genotype_chunks(
+            file, dosage_block_size(len(genotype_sample_names(file)))))
+    elif is_memory_mapped_genotype(file):
+        return read_binary_genotype(file)
+    else:
+        return genotype_frame(read_tsv(text_genotype_file(file),
+                                       GENOTYPE_DTYPES))
+
+def read_genotype_chunks(file, chunk_size):
+    # Yield data frames of at most chunk_size SNPs each. At least one
+    # data frame, possibly empty, is always yielded so that callers
+    # can see the columns.
+    if is_memory_mapped_genotype(file):
+        # Chunks are slices of the memory-mapped dosage matrix.
+        genotype = open_memory_mapped_genotype(file)
+        for start in range(0, max(len(genotype.positions), 1), chunk_size):
+            yield binary_genotype_rows(genotype, start, start+chunk_size)
+    else:
+        with read_tsv(text_genotype_file(file), GENOTYPE_DTYPES,
+                      chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield genotype_frame(chunk.reset_index(drop=True))
+
+def snp_key_reader(header):
+    # Return a function that reads the (chromosome, position) key of
+    # a line of a genotype TSV file with the given header. It returns
+    # None if the line has no such key.
+    columns = header.rstrip(b"\r\n").split(b"\t")
+    chromosome_index = columns.index(b"chromosome")
+    position_index = columns.index(b"position")
+    maxsplit = max(chromosome_index, position_index) + 1
+    def snp_key(line):
+        fields = line.split(b"\t", maxsplit)
+        try:
+            return (fields[chromosome_index].decode(),
+                    int(fields[position_index]))
+        except (IndexError, ValueError):
+            return None
+    return snp_key
+
+def read_selected_tsv_genotype(header, lines, snps=None, region=None):
+    # Parse only those of lines in region whose SNP key is in
+    # snps. Other lines are never converted to numbers, or
+    # stored. Lines without a key are passed on to the parser so that
+    # it may report them. Return the number of lines in region, and
+    # the parsed genotype.
+    snp_key = snp_key_reader(header)
+    keys = [snp_key(line) for line in lines]
+    number_in_region, selected = select_snps(
+        (key for key in keys if key is not None), snps, region)
+    selected = iter(selected)
+    return (number_in_region + keys.count(None),
+            genotype_frame(read_tsv(
+                io.BytesIO(header
+                           + b"".join(line
+                                      for line, key in zip(lines, keys)
+                                      if key is None or next(selected))),
+                GENOTYPE_DTYPES)))
+
+def batches(iterable, size):
+    # Yield lists of size items of iterable, and then a last list of
+    # the rest. At least one, possibly empty, list is always yielded.
+    iterator = iter(iterable)
+    while len(batch := list(islice(iterator, size))) == size:
+        yield batch
+    yield batch
+
+def read_selected_genotype_chunks(file, chunk_size, snps=None, region=None):
+    # Like read_genotype_chunks, but keep only the SNPs in region
+    # whose (chromosome, position) key is in snps, and yield (number
+    # of SNPs read, chunk) pairs. The number of SNPs read includes
+    # SNPs that were skipped because they were not in snps, but not
+    # those outside region. snps and region may be None to not
+    # restrict SNPs by them. If chunk_size is None, read the whole
+    # file as one chunk. If the file is compressed and indexed, only
+    # the blocks that hold SNPs in region are read.
+    if is_memory_mapped_genotype(file):
+        genotype = open_memory_mapped_genotype(file)
+        number_of_snps = len(genotype.positions)
+        chunk_size = chunk_size or max(number_of_snps, 1)
+        for start in range(0, max(number_of_snps, 1), chunk_size):
+            yield selected_binary_genotype_rows(genotype, start,
+                                                start+chunk_size,
+                                                snps, region)
+        return
+    if region is not None and (index := read_genotype_index_of(file)) is not None:
+        header = text_genotype_file(file).readline()
+        lines = chain.from_iterable(
+            islice(read_lines(file, offset), number_of_snps)
+            for offset, number_of_snps
+            in index_entries(index, region)[["offset", "snps"]].itertuples(
+                index=False))
+    else:
+        file = text_genotype_file(file)
+        header = file.readline()
+        lines = file
+    for batch in (batches(lines, chunk_size) if chunk_size else [list(lines)]):
+        yield read_selected_tsv_genotype(header, batch, snps, region)
+
+# A slice of a genotype file that may be read independently of the
+# rest of the file, for example in another process. For TSV files,
+# start and stop are byte offsets of line boundaries, and header is
+# the line of column labels. For binary files, start and stop are SNP
+# indices, and header is None.
+GenotypeSlice = namedtuple("GenotypeSlice", "path start stop header")
+
+def is_regular_file(file):
+    # Is file a regular file that may be opened again by name?
+    # Anonymous temporary files are named by their file descriptor.
+    return (file.seekable()
+            and isinstance(getattr(file, "name", None), str)
+            and Path(file.name).is_file())
+
+def genotype_slices(file, chunk_size):
+    # Split the genotype file into slices of about chunk_size SNPs
+    # each. At least one slice, possibly empty, is always returned.
+    file.seek(0)
+    if is_memory_mapped_genotype(file):
+        number_of_snps = len(open_memory_mapped_genotype(file).positions)
+        return [GenotypeSlice(file.name, start, start+chunk_size, None)
+                for start in range(0, max(number_of_snps, 1), chunk_size)]
+    # Finding line boundaries exactly would mean reading the whole
+    # file. Instead, estimate the length of chunk_size lines from the
+    # first line, seek ahead that far, and skip to the end of the line
+    # we land in. Slices are then only approximately chunk_size SNPs
+    # long, but finding them costs only one seek per slice.
+    header = file.readline()
+    step = max(len(file.readline()), 1) * chunk_size
+    size = file.seek(0, io.SEEK_END)
+    boundaries = [len(header)]
+    while boundaries[-1] < size:
+        file.seek(min(boundaries[-1] + step, size))
+        file.readline()
+        boundaries.append(file.tell())
+    return ([GenotypeSlice(file.name, start, stop, header)
+             for start, stop in pairwise(boundaries)]
+            or [GenotypeSlice(file.name, size, size, header)])
+
+def read_genotype_slice(slice):
+    with open(slice.path, "rb") as file:
+        if slice.header is None:
+            return binary_genotype_rows(open_memory_mapped_genotype(file),
+                                        slice.start,
+                                        slice.stop)
+        file.seek(slice.start)
+        return genotype_frame(
+            read_tsv(io.BytesIO(slice.header
+                                + file.read(slice.stop - slice.start)),
+                     GENOTYPE_DTYPES))
+
+def read_selected_genotype_slice(slice, snps=None, region=None):
+    # Like read_genotype_slice, but select SNPs and return a (number
+    # of SNPs read, slice) pair as read_selected_genotype_chunks does.
+    with open(slice.path, "rb") as file:
+        if slice.header is None:
+            return selected_binary_genotype_rows(open_memory_mapped_genotype(file),
+                                                 slice.start, slice.stop,
+                                                 snps, region)
+        file.seek(slice.start)
+        return read_selected_tsv_genotype(
+            slice.header,
+            io.BytesIO(file.read(slice.stop - slice.start)).readlines(),
+            snps,
+            region)
+
+def genotype_sample_names(file):
+    # Read only the sample names of a genotype file. Rewind file
+    # afterwards.
+    position = file.tell()
+    if is_memory_mapped_genotype(file):
+        sample_names = open_memory_mapped_genotype(file).sample_names
+    else:
+        sample_names = [column
+                        for column in (read_tsv_header(text_genotype_file(file))
+                                       .decode().split("\t"))
+                        if not is_genotype_metadata_column(column)]
+    file.seek(position)
+    return sample_names
+
+def is_phenotype_file(file):
+    # Phenotype files, unlike genotype files, have a sample-id
+    # column. Rewind file afterwards.
+    if is_memory_mapped_genotype(file) or is_gzip(file):
+        return False
+    position = file.tell()
+    header = read_tsv_header(file).decode().split("\t")
+    file.seek(position)
+    return "sample-id" in header
+
 def is_phenotype_metadata_column(name):
     return name.lower() in ["sample-id", "intercept"]
 
@@ -107,20 +883,277 @@ def read_phenotype(file):
     df[phenotype_columns] = df[phenotype_columns].astype("float")
     return df
 
-def write_tsv(file, df):
+def write_tsv(file, df, header=True):
     if df.isna().any(axis=None):
         raise ValueError("Data frame has NA values")
     df.to_csv(file,
               quoting=csv.QUOTE_NONE,
               sep="\t",
               float_format="%.8g",
+              header=header,
               index=False)
 
-write_genotype = write_tsv
 write_phenotype = write_tsv
 
+# Size of the blocks in which files are copied
+COPY_BUFFER_SIZE = 1024 * 1024
+
+def read_tsv_header(file):
+    # Read the line of column labels, without its line terminator.
+    return file.readline().rstrip(b"\r\n")
+
+def cat_tsv_data(output, header, files):
+    # Write header, and then copy the rest of files, byte for byte,
+    # without parsing them. The header lines of files must already
+    # have been read.
+    output.write(header + b"\n")
+    for file in files:
+        last_byte = b"\n"
+        while block := file.read(COPY_BUFFER_SIZE):
+            output.write(block)
+            last_byte = block[-1:]
+        # Terminate the last line if it is not, so that it does not
+        # run into the first line of the next file.
+        if last_byte != b"\n":
+            output.write(b"\n")
+
+def binary_genotype_headers(sample_names, reference_present,
+                            number_of_snps, chromosome_bytes,
+                            reference_bytes):
+    # Pad numbers that are not known until the end to a fixed width
+    # so that the header may be rewritten in place.
+    return ({"number-of-snps": f"{number_of_snps:20d}",
+             "number-of-samples": len(sample_names),
+             "sample-ids-bytes": len(text_array(sample_names)),
+             "chromosome-bytes": f"{chromosome_bytes:20d}"}
+            | ({"reference-bytes": f"{reference_bytes:20d}"}
+               if reference_present
+               else {}))
+
+def start_binary_genotype(file, sample_names, reference_present):
+    # Write everything that comes before the dosages, and return the
+    # offset at which dosages start.
+    offset = write_headers(file, GENOTYPE_HEADER,
+                           binary_genotype_headers(sample_names,
+                                                   reference_present,
+                                                   0, 0, 0))
+    return write_padding(file, write_arrays(file, offset,
+                                            [text_array(sample_names)]))
+
+def write_binary_genotype_dosages(file, chunk, sample_names):
+    # Write the dosages of chunk, and return the number of bytes
+    # written.
+    dosages = chunk[sample_names].to_numpy(dtype="float64")
+    if np.isnan(dosages).any():
+        raise ValueError("Data frame has NA values")
+    return write_array(file, dosages)
+
+def finish_binary_genotype(file, offset, sample_names, positions,
+                           chromosomes, references):
+    # Write SNP metadata after the dosages, which end at offset, and
+    # fill in the header. chromosomes and references are text arrays.
+    write_arrays(file, offset,
+                 [positions, chromosomes]
+                 + ([references] if references is not None else []))
+    file.seek(0)
+    write_headers(file, GENOTYPE_HEADER,
+                  binary_genotype_headers(sample_names,
+                                          references is not None,
+                                          len(positions),
+                                          len(chromosomes),
+                                          len(references)
+                                          if references is not None
+                                          else 0))
+    file.seek(0, io.SEEK_END)
+
+def write_binary_genotype_chunks(file, chunks):
+    if not file.seekable():
+        # We cannot go back and fill in the header after writing the
+        # chunks.
+        return write_via_memory(
+            file, lambda buffer: write_binary_genotype_chunks(buffer, chunks))
+    chunks = iter(chunks)
+    # A binary genotype cannot be written without the columns of at
+    # least one, possibly empty, chunk.
+    if (first_chunk := next(chunks, None)) is None:
+        raise ValueError("No genotype chunks to write")
+    sample_names = [column
+                    for column in first_chunk.columns
+                    if not is_genotype_metadata_column(column)]
+    reference_present = "reference" in first_chunk.columns
+    offset = start_binary_genotype(file, sample_names, reference_present)
+    # Write dosages as they come, but hold on to SNP metadata until
+    # the end.
+    positions = []
+    chromosomes = []
+    references = []
+    for chunk in chain([first_chunk], chunks):
+        offset += write_binary_genotype_dosages(file, chunk, sample_names)
+        positions.append(chunk.position.to_numpy(dtype="int64"))
+        chromosomes.append(text_array(chunk.chromosome))
+        if reference_present:
+            references.append(text_array(chunk.reference))
+    positions = np.concatenate(positions)
+    finish_binary_genotype(file, offset, sample_names,
+                           positions,
+                           np.concatenate(chromosomes),
+                           np.concatenate(references) if reference_present else None)
+    return len(positions)
+
+def genotype_index(lines, block_offsets):
+    # lines is a data frame of the chromosome, position and offset in
+    # the uncompressed data of every SNP line. Lines of the same
+    # chromosome that start in the same block share an index entry,
+    # with the range of their positions, the virtual offset of the
+    # first of them, and their number.
+    block = lines.start // BLOCK_DATA_SIZE
+    entry = ((block != block.shift())
+             | (lines.chromosome != lines.chromosome.shift())).cumsum()
+    entries = lines.groupby(entry, sort=False)
+    return pd.DataFrame({"chromosome": entries.chromosome.first(),
+                         "start": entries.position.min(),
+                         "end": entries.position.max(),
+                         "offset": [virtual_offset(block_offsets, start)
+                                    for start in entries.start.first()],
+                         "snps": entries.size()}).reset_index(drop=True)
+
+def write_genotype_index(file, index, genotype_bytes):
+    # genotype_bytes, the size of the compressed genotype file, lets
+    # readers detect an index that is stale.
+    write_headers(file, GENOTYPE_INDEX_HEADER,
+                  {"genotype-bytes": genotype_bytes})
+    index.to_csv(file, sep="\t", index=False)
+
+def read_genotype_index(file):
+    properties = read_headers(file, GENOTYPE_INDEX_HEADER)
+    return (int(properties["genotype-bytes"]),
+            pd.read_csv(file, sep="\t", dtype={"chromosome": "str"},
+                        na_filter=False))
+
+def genotype_index_path(path):
+    return Path(str(path) + GENOTYPE_INDEX_EXTENSION)
+
+def read_genotype_index_of(file):
+    # Return the index of compressed genotype file, or None if it has
+    # no index or if its index is stale.
+    if not (is_gzip(file) and is_regular_file(file)):
+        return None
+    index_path = genotype_index_path(file.name)
+    if not index_path.exists():
+        return None
+    with index_path.open("rb") as index_file:
+        genotype_bytes, index = read_genotype_index(index_file)
+    return index if genotype_bytes == Path(file.name).stat().st_size else None
+
+def index_entries(index, region):
+    # Return the index entries that may hold SNPs in region.
+    return index[(index.chromosome == region.chromosome)
+                 & ((index.end >= region.start)
+                    if region.start is not None
+                    else True)
+                 & ((index.start <= region.end)
+                    if region.end is not None
+                    else True)]
+
+def write_bgzf_genotype_chunks(file, chunks):
+    # Write a compressed TSV genotype, and index it if file is a
+    # regular file that the index can be written next to.
+    number_of_snps = 0
+    uncompressed_bytes = 0
+    lines = []
+    def data_chunks():
+        nonlocal number_of_snps, uncompressed_bytes
+        for i, chunk in enumerate(chunks):
+            buffer = io.BytesIO()
+            write_tsv(buffer, chunk, header=(i == 0))
+            data = buffer.getvalue()
+            # Lines start after every newline, except the last. Skip
+            # the header line.
+            starts = (uncompressed_bytes
+                      + np.concatenate(([0],
+                                        np.flatnonzero(np.frombuffer(data, dtype="u1")
+                                                       == ord("\n"))[:-1] + 1)))
+            lines.append(pd.DataFrame({"chromosome": chunk.chromosome.to_numpy(),
+                                       "position": chunk.position.to_numpy(),
+                                       "start": starts[len(starts) - len(chunk):]}))
+            number_of_snps += len(chunk)
+            uncompressed_bytes += len(data)
+            yield data
+
+    block_offsets = write_bgzf(file, data_chunks())
+    if is_regular_file(file):
+        file.flush()
+        with genotype_index_path(file.name).open("wb") as index_file:
+            write_genotype_index(index_file,
+                                 genotype_index(pd.concat(lines,
+                                                          ignore_index=True),
+                                                block_offsets),
+                                 Path(file.name).stat().st_size)
+    return number_of_snps
+
+def write_genotype_chunks(file, chunks, format="tsv"):
+    # Return the total number of SNPs written.
+    match format:
+        case "tsv":
+            # Only the first chunk is written with a header.
+            number_of_snps = 0
+            for i, chunk in enumerate(chunks):
+                write_tsv(file, chunk, header=(i == 0))
+                number_of_snps += len(chunk)
+            return number_of_snps
+        case "binary":
+            return write_binary_genotype_chunks(file, chunks)
+        case "bgzf":
+            return write_bgzf_genotype_chunks(file, chunks)
+        case _:
+            raise ValueError(f"Unknown genotype file format {format}")
+
+def write_genotype(file, genotype, format="tsv"):
+    write_genotype_chunks(file, [genotype], format)
+
 def read_key(file):
-    return np.loadtxt(file, delimiter="\t", ndmin=2)
+    # Version 1 key files are dense TSV matrices without any header.
+    # Recover their block diagonal structure.
+    if peek(file) != b"#":
+        return to_block_diagonal_matrix(
+            np.loadtxt(file, delimiter="\t", ndmin=2))
+    # Version 2 key files and key seed files begin with a header.
+    header = header_line_text(file.readline())
+    properties = read_properties(file)
+    block_sizes = [int(size) for size in properties["block-sizes"].split()]
+    if header == header_line_text(KEY_HEADER):
+        return BlockDiagonalMatrix(
+            read_arrays(file, file.tell(),
+                        [("float64", (size, size)) for size in block_sizes]))
+    elif header == header_line_text(KEY_SEED_HEADER):
+        return KeySeed(properties["bit-generator"],
+                       properties["sampler"],
+                       int(properties["entropy"]),
+                       block_sizes)
+    else:
+        raise ValueError(f"Unknown key file header: {header}")
 
-def write_key(file, key):
-    return np.savetxt(file, key, delimiter="\t", fmt="%.8g")
+def write_key(file, key, version=2):
+    if isinstance(key, KeySeed):
+        write_headers(file,
+                      KEY_SEED_HEADER,
+                      {"bit-generator": key.bit_generator,
+                       "sampler": key.sampler,
+                       "entropy": key.entropy,
+                       "block-sizes": " ".join(str(size)
+                                               for size in key.block_sizes)})
+        return
+    if not isinstance(key, BlockDiagonalMatrix):
+        key = to_block_diagonal_matrix(key)
+    match version:
+        case 1:
+            np.savetxt(file, key.__array__(), delimiter="\t", fmt="%.8g")
+        case 2:
+            write_arrays(file,
+                         write_headers(file,
+                                       KEY_HEADER,
+                                       {"block-sizes": " ".join(str(len(block))
+                                                                for block in key.blocks)}),
+                         key.blocks)
+        case _:
+            raise ValueError(f"Unknown key file version {version}")
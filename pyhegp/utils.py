@@ -16,5 +16,23 @@
 ### You should have received a copy of the GNU General Public License
 ### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
 
+import importlib.util
+import sys
+
+def lazy_import(name):
+    # Return module name, but only load it when one of its attributes
+    # is first used. Loading numpy, pandas and scipy takes a good part
+    # of a second, and not every command needs them. Modules that are
+    # already loaded are returned as they are.
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
 def negate(predicate):
     return lambda *args, **kwargs: not predicate(*args, **kwargs)
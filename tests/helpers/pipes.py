@@ -0,0 +1,46 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+import os
+import subprocess
+import sys
+import threading
+
+@contextmanager
+def pipe_reader(data):
+    # Yield a binary file that reads data from a pipe, and so cannot
+    # be seeked, unlike temporary files and BytesIO.
+    read_fd, write_fd = os.pipe()
+    def write():
+        with os.fdopen(write_fd, "wb") as file:
+            file.write(data)
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        with os.fdopen(read_fd, "rb") as file:
+            yield file
+    finally:
+        writer.join()
+
+def run_pyhegp(*args, input=b""):
+    # Run pyhegp in a fresh interpreter with input piped to its
+    # standard input, and its standard output piped back. Unlike
+    # CliRunner, both are real pipes. Return the CompletedProcess.
+    return subprocess.run([sys.executable, "-m", "pyhegp.pyhegp", *map(str, args)],
+                          input=input, capture_output=True)
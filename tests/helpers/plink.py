@@ -0,0 +1,60 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+
+from pathlib import Path
+
+import numpy as np
+
+from pyhegp.plink import BED_MAGIC, SNP_MAJOR_MODE
+
+# 2-bit codes of each count of the first allele, and of missing (-1)
+CODES = {2: 0, -1: 1, 1: 2, 0: 3}
+
+def write_plink(prefix, chromosomes, positions, alleles1, alleles2,
+                sample_names, calls):
+    # Write a PLINK .bed/.bim/.fam fileset from a SNPs × samples
+    # matrix of calls, one bit pair at a time. This is deliberately
+    # unlike the reader.
+    prefix = Path(prefix)
+    with prefix.with_suffix(".bed").open("wb") as file:
+        file.write(BED_MAGIC + bytes([SNP_MAJOR_MODE]))
+        for snp_calls in calls:
+            codes = [CODES[call] for call in snp_calls]
+            codes += [0] * (-len(codes) % 4)
+            file.write(bytes(sum(code << 2*i
+                                 for i, code in enumerate(codes[start:start+4]))
+                             for start in range(0, len(codes), 4)))
+    with prefix.with_suffix(".bim").open("w") as file:
+        for chromosome, position, allele1, allele2 in zip(chromosomes, positions,
+                                                          alleles1, alleles2):
+            file.write(f"{chromosome}\t{chromosome}:{position}\t0\t{position}"
+                       f"\t{allele1}\t{allele2}\n")
+    with prefix.with_suffix(".fam").open("w") as file:
+        for sample_name in sample_names:
+            file.write(f"family {sample_name} 0 0 0 -9\n")
+    return prefix.with_suffix(".bed")
+
+def imputed_dosages(calls):
+    # Dosages of calls with missing calls replaced by the mean of the
+    # other calls of the same SNP
+    dosages = np.array(calls, dtype="float64")
+    for row in dosages:
+        called = row[row >= 0]
+        row[row < 0] = called.mean() if len(called) > 0 else 0
+    return dosages
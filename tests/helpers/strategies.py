@@ -22,6 +22,7 @@ import pandas as pd
 from scipy.stats import special_ortho_group
 from typing import assert_never
 
+from pyhegp.linalg import BlockDiagonalMatrix
 from pyhegp.serialization import Summary, is_genotype_metadata_column, is_phenotype_metadata_column
 from pyhegp.utils import negate
 
@@ -135,3 +136,8 @@ def keys(draw, size):
                                 seed=draw(st.integers(min_value=0,
                                                       max_value=2**32-1)))
             .rvs())
+
+@st.composite
+def block_diagonal_keys(draw, block_sizes):
+    return BlockDiagonalMatrix([draw(keys(st.just(size)))
+                                for size in draw(block_sizes)])
@@ -0,0 +1,64 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+
+import gzip
+import io
+
+from hypothesis import given, strategies as st
+
+from pyhegp.bgzf import BLOCK_DATA_SIZE, EOF_BLOCK, read_lines, virtual_offset, write_bgzf
+
+# Data chunks large enough to span several blocks
+data_chunks = st.lists(st.tuples(st.binary(max_size=1000),
+                                 st.integers(min_value=1, max_value=300))
+                       .map(lambda data_and_repeats:
+                            data_and_repeats[0] * data_and_repeats[1]),
+                       max_size=5)
+
+@given(data_chunks, st.integers(min_value=1, max_value=4))
+def test_write_bgzf_is_gzip(data_chunks, number_of_workers):
+    file = io.BytesIO()
+    block_offsets = write_bgzf(file, data_chunks, number_of_workers)
+    data = b"".join(data_chunks)
+    assert gzip.decompress(file.getvalue()) == data
+    assert file.getvalue().endswith(EOF_BLOCK)
+    assert len(block_offsets) == -(-len(data) // BLOCK_DATA_SIZE)
+
+@given(data_chunks)
+def test_write_bgzf_does_not_depend_on_number_of_workers(data_chunks):
+    def bgzf(number_of_workers):
+        file = io.BytesIO()
+        write_bgzf(file, data_chunks, number_of_workers)
+        return file.getvalue()
+    assert bgzf(1) == bgzf(3)
+
+@given(st.lists(st.binary(max_size=200).map(lambda line: line.replace(b"\n", b"")),
+                max_size=1000),
+       st.data())
+def test_read_lines_from_virtual_offset(lines, data):
+    lines = [line + b"\n" for line in lines]
+    file = io.BytesIO()
+    block_offsets = write_bgzf(file, lines, 2)
+    start = data.draw(st.integers(min_value=0, max_value=len(lines)))
+    assert (list(read_lines(file,
+                            virtual_offset(block_offsets,
+                                           sum(map(len, lines[:start]))))
+                 if start < len(lines)
+                 else [])
+            == lines[start:])
@@ -0,0 +1,107 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from hypothesis import given, strategies as st
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyhegp.encryptor import Encryptor
+from pyhegp.pyhegp import drop_metadata_columns, drop_uncommon_snps, drop_zero_stddev_snps, encrypt_genotype_chunks, genotype_summary, random_key
+from pyhegp.serialization import read_genotype
+
+from helpers.strategies import genotype_frames, keys
+
+def assert_ciphertexts_close(actual, expected):
+    # Encryptors multiply by the inverse of the standard deviation
+    # rather than divide by it. So, ciphertexts may differ in the last
+    # few bits.
+    pd.testing.assert_frame_equal(actual[["chromosome", "position"]],
+                                  expected[["chromosome", "position"]])
+    actual = drop_metadata_columns(actual).to_numpy()
+    expected = drop_metadata_columns(expected).to_numpy()
+    np.testing.assert_allclose(actual, expected, rtol=1e-9,
+                               atol=1e-9 * max(1, np.abs(expected).max(initial=0)))
+
+@given(genotype_frames(st.shared(st.integers(min_value=2, max_value=10),
+                                 key="number-of-samples")),
+       keys(st.shared(st.integers(min_value=2, max_value=10),
+                      key="number-of-samples")),
+       st.booleans())
+def test_encrypt_frame(genotype, key, only_center):
+    # Encryptors encrypt like the encrypt command does.
+    summary = genotype_summary(genotype)
+    summary_subset = summary if only_center else drop_zero_stddev_snps(summary)
+    assert_ciphertexts_close(
+        Encryptor(key, summary, only_center).encrypt_frame(genotype),
+        next(encrypt_genotype_chunks([genotype], key, summary_subset,
+                                     only_center)))
+
+@pytest.mark.parametrize("batch_size", [1, 7, 1000])
+def test_encrypt_chunk_in_batches(batch_size):
+    with Path("test-data/genotype.tsv").open("rb") as file:
+        genotype = read_genotype(file)
+    summary = genotype_summary(genotype.iloc[::2])
+    dosages = drop_metadata_columns(genotype).to_numpy()
+    key = random_key(np.random.default_rng(0), dosages.shape[1], 3)
+    encryptor = Encryptor(key, summary)
+    batches = [encryptor.encrypt_chunk(
+                   dosages[start:start+batch_size],
+                   zip(genotype.chromosome[start:start+batch_size],
+                       genotype.position[start:start+batch_size]))
+               for start in range(0, len(genotype), batch_size)]
+    selected = np.concatenate([batch.selected for batch in batches])
+    # SNPs not in the summary are dropped.
+    np.testing.assert_array_equal(
+        selected,
+        encryptor.snp_indices(genotype) >= 0)
+    common_genotype = drop_uncommon_snps(genotype,
+                                         drop_zero_stddev_snps(summary))
+    assert selected.sum() == len(common_genotype)
+    np.testing.assert_allclose(
+        np.concatenate([batch.dosages for batch in batches]),
+        drop_metadata_columns(encryptor.encrypt_frame(genotype)).to_numpy())
+    # Dosages passed in are left as they are.
+    np.testing.assert_array_equal(dosages,
+                                  drop_metadata_columns(genotype).to_numpy())
+
+def test_encrypt_chunk_rejects_mismatched_dosages():
+    with Path("test-data/genotype.tsv").open("rb") as file:
+        genotype = read_genotype(file)
+    dosages = drop_metadata_columns(genotype).to_numpy()
+    encryptor = Encryptor(random_key(np.random.default_rng(0),
+                                     dosages.shape[1]),
+                          genotype_summary(genotype))
+    with pytest.raises(ValueError):
+        encryptor.encrypt_chunk(dosages[:, 1:], genotype)
+    with pytest.raises(ValueError):
+        encryptor.encrypt_chunk(dosages[1:], genotype)
+
+def test_encryptor_splits_dense_keys_into_blocks():
+    with Path("test-data/genotype.tsv").open("rb") as file:
+        genotype = read_genotype(file)
+    summary = genotype_summary(genotype)
+    key = random_key(np.random.default_rng(0),
+                     len(drop_metadata_columns(genotype).columns), 3)
+    encryptor = Encryptor(key.__array__(), summary)
+    assert ([len(block) for block in encryptor.key.blocks]
+            == [len(block) for block in key.blocks])
+    assert_ciphertexts_close(encryptor.encrypt_frame(genotype),
+                             Encryptor(key, summary).encrypt_frame(genotype))
@@ -0,0 +1,141 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+from functools import reduce
+
+from hypothesis import given, settings, strategies as st
+import pandas as pd
+import pytest
+
+from pyhegp.join import inner_join, merge_join_chunks
+
+KEYS = ["chromosome", "position", "reference"]
+
+CHROMOSOMES = ["chr1", "chr2", "chr10", "chrX"]
+
+snp_keys = st.tuples(st.sampled_from(CHROMOSOMES),
+                     st.integers(min_value=0, max_value=20),
+                     st.sampled_from(["A", "C", "G", "T"]))
+
+@st.composite
+def sorted_frames(draw, number_of_frames):
+    # All frames list chromosomes in the same order, but any order
+    # will do.
+    order = draw(st.permutations(CHROMOSOMES))
+    def frame(i, keys):
+        keys = sorted(keys, key=lambda key: (order.index(key[0]),) + key[1:])
+        return pd.DataFrame({"chromosome": pd.Series([key[0] for key in keys],
+                                                     dtype="str"),
+                             "position": pd.Series([key[1] for key in keys],
+                                                   dtype="int"),
+                             "reference": pd.Series([key[2] for key in keys],
+                                                    dtype="str"),
+                             f"value{i}": pd.Series(range(len(keys)),
+                                                    dtype="float")})
+    return [frame(i, draw(st.lists(snp_keys, unique=True)))
+            for i in range(draw(number_of_frames))]
+
+def merge(frames):
+    return reduce(lambda df1, df2: pd.merge(df1, df2, how="inner", on=KEYS),
+                  frames)
+
+# These properties build and merge several data frames per example,
+# which may take longer than the default deadline on a loaded machine.
+@settings(deadline=None)
+@given(sorted_frames(st.integers(min_value=1, max_value=5)))
+def test_inner_join_matches_merge(frames):
+    joined = inner_join(frames, KEYS)
+    pd.testing.assert_frame_equal(
+        merge(frames),
+        pd.concat([joined[0]] + [frame.drop(columns=KEYS)
+                                 for frame in joined[1:]],
+                  axis="columns"))
+
+@settings(deadline=None)
+@given(sorted_frames(st.integers(min_value=1, max_value=5)),
+       st.lists(st.integers(min_value=1, max_value=5), min_size=5, max_size=5))
+def test_merge_join_chunks_matches_inner_join(frames, chunk_sizes):
+    def chunks(frame, chunk_size):
+        return (frame.iloc[start:start+chunk_size].reset_index(drop=True)
+                for start in range(0, max(len(frame), 1), chunk_size))
+    joined_chunks = list(merge_join_chunks([chunks(frame, chunk_size)
+                                            for frame, chunk_size
+                                            in zip(frames, chunk_sizes)],
+                                           KEYS))
+    expected_frames = inner_join(frames, KEYS)
+    # Every input has a chunk. So, at least one list of chunks, with
+    # the columns of every input, is yielded even if the join is
+    # empty.
+    assert joined_chunks
+    for chunks in joined_chunks:
+        assert ([list(chunk.columns) for chunk in chunks]
+                == [list(frame.columns) for frame in frames])
+    for expected, chunks in zip(expected_frames, zip(*joined_chunks)):
+        pd.testing.assert_frame_equal(
+            expected,
+            pd.concat(chunks, ignore_index=True),
+            check_index_type=False,
+            check_dtype=False)
+
+def snp_frame(chromosomes, positions):
+    return pd.DataFrame({"chromosome": chromosomes,
+                         "position": positions,
+                         "reference": ["A"] * len(chromosomes)})
+
+def test_merge_join_chunks_rejects_unsorted_input():
+    frame = snp_frame(["chr1", "chr1"], [2, 1])
+    with pytest.raises(ValueError):
+        list(merge_join_chunks([iter([frame]), iter([frame])], KEYS))
+
+def test_merge_join_chunks_accepts_natural_chromosome_order():
+    frame = snp_frame(["chr1", "chr2", "chr10"], [1, 1, 1])
+    joined_chunks = list(merge_join_chunks([(frame.iloc[[i]] for i in range(3)),
+                                            iter([frame])],
+                                           KEYS))
+    pd.testing.assert_frame_equal(
+        pd.concat([chunks[1] for chunks in joined_chunks], ignore_index=True),
+        frame)
+
+def test_merge_join_chunks_rejects_reappearing_chromosome():
+    frame = snp_frame(["chr1", "chr2", "chr1"], [1, 1, 2])
+    with pytest.raises(ValueError):
+        list(merge_join_chunks([(frame.iloc[[i]] for i in range(3)),
+                                iter([frame])],
+                               KEYS))
+
+def test_merge_join_chunks_rejects_different_chromosome_orders():
+    with pytest.raises(ValueError):
+        list(merge_join_chunks([iter([snp_frame(["chr2", "chr10"], [1, 1])]),
+                                iter([snp_frame(["chr10", "chr2"], [1, 1])])],
+                               KEYS))
+
+def test_merge_join_chunks_with_empty_first_input():
+    frames = [pd.DataFrame({"chromosome": pd.Series([], dtype="str"),
+                            "position": pd.Series([], dtype="int"),
+                            "reference": pd.Series([], dtype="str"),
+                            "value0": pd.Series([], dtype="float")}),
+              pd.DataFrame({"chromosome": ["chr1", "chr1"],
+                            "position": [1, 2],
+                            "reference": ["A", "C"],
+                            "value1": [1.0, 2.0]})]
+    joined_chunks = list(merge_join_chunks([iter([frame]) for frame in frames],
+                                           KEYS))
+    assert len(joined_chunks) == 1
+    assert ([list(chunk.columns) for chunk in joined_chunks[0]]
+            == [list(frame.columns) for frame in frames])
+    assert all(len(chunk) == 0 for chunk in joined_chunks[0])
@@ -63,3 +63,13 @@ def test_block_diagonal_matrix_product(multiplicands):
     block_diagonal_matrix, multiplier = multiplicands
     assert ((block_diagonal_matrix @ multiplier)
             == approx(block_diagonal_matrix.__array__() @ multiplier))
+
+@given(block_diagonal_matrix_product_multiplicands(),
+       st.integers(min_value=1, max_value=4))
+def test_block_diagonal_matrix_parallel_product(multiplicands, number_of_workers):
+    block_diagonal_matrix, multiplier = multiplicands
+    out = np.empty_like(multiplier)
+    assert (block_diagonal_matrix.matmul(multiplier, out=out,
+                                         number_of_workers=number_of_workers)
+            is out)
+    assert out == approx(block_diagonal_matrix.__array__() @ multiplier)
@@ -0,0 +1,64 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+from itertools import islice
+import threading
+
+from hypothesis import given, strategies as st
+import pytest
+
+from pyhegp.parallel import parallelism, prefetch, workers
+
+@given(st.lists(st.integers()),
+       st.integers(min_value=0, max_value=3))
+def test_prefetch(items, depth):
+    assert list(prefetch(items, depth)) == items
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_prefetch_raises_in_consumer(depth):
+    def items():
+        yield 1
+        raise ValueError("Producer failed")
+    consumer = prefetch(items(), depth)
+    assert next(consumer) == 1
+    with pytest.raises(ValueError, match="Producer failed"):
+        next(consumer)
+
+def test_prefetch_stops_when_consumer_stops():
+    closed = threading.Event()
+    def items():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.set()
+    number_of_threads = threading.active_count()
+    consumer = prefetch(items(), 2)
+    assert list(islice(consumer, 5)) == [0, 1, 2, 3, 4]
+    consumer.close()
+    assert closed.is_set()
+    assert threading.active_count() == number_of_threads
+
+def test_prefetch_runs_in_context():
+    def items():
+        yield workers()
+    with parallelism(3):
+        consumer = prefetch(items(), 1)
+        assert list(consumer) == [3]
@@ -0,0 +1,124 @@
+### pyhegp --- Homomorphic encryption of genotypes and phenotypes
+### Copyright © 2026 Arun Isaac <arunisaac@systemreboot.net>
+###
+### This file is part of pyhegp.
+###
+### pyhegp is free software: you can redistribute it and/or modify it
+### under the terms of the GNU General Public License as published by
+### the Free Software Foundation, either version 3 of the License, or
+### (at your option) any later version.
+###
+### pyhegp is distributed in the hope that it will be useful, but
+### WITHOUT ANY WARRANTY; without even the implied warranty of
+### MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+### General Public License for more details.
+###
+### You should have received a copy of the GNU General Public License
+### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
+
+
+from pathlib import Path
+import tempfile
+
+from hypothesis import given, strategies as st
+from hypothesis.extra.numpy import arrays
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyhegp.plink import decode_dosages, dosage_table
+from pyhegp.serialization import Region, genotype_sample_names, genotype_slices, read_genotype, read_genotype_chunks, read_genotype_slice, read_selected_genotype_chunks
+
+from helpers.plink import imputed_dosages, write_plink
+
+def test_dosage_table_decodes_every_byte():
+    for byte in range(256):
+        np.testing.assert_array_equal(dosage_table()[byte],
+                                      [[2, np.nan, 1, 0][(byte >> 2*i) & 3]
+                                       for i in range(4)])
+
+@st.composite
+def plink_genotypes(draw):
+    number_of_samples = draw(st.integers(min_value=1, max_value=10))
+    number_of_snps = draw(st.integers(min_value=0, max_value=20))
+    calls = draw(arrays("int64", (number_of_snps, number_of_samples),
+                        elements=st.integers(min_value=-1, max_value=2)))
+    chromosomes = draw(st.lists(st.sampled_from(["1", "2", "X"]),
+                                min_size=number_of_snps,
+                                max_size=number_of_snps))
+    return (chromosomes,
+            list(range(1, number_of_snps + 1)),
+            [f"sample{i}" for i in range(number_of_samples)],
+            calls)
+
+def expected_genotype(chromosomes, positions, sample_names, calls):
+    return pd.concat([pd.DataFrame({"chromosome": pd.Series(chromosomes,
+                                                            dtype="str"),
+                                    "position": pd.Series(positions,
+                                                          dtype="int64"),
+                                    "reference": pd.Series(["G"]*len(positions),
+                                                           dtype="str")}),
+                      pd.DataFrame(imputed_dosages(calls),
+                                   columns=sample_names)],
+                     axis="columns")
+
+@given(plink_genotypes(), st.integers(min_value=1, max_value=7))
+def test_read_plink_genotype(plink_genotype, chunk_size):
+    chromosomes, positions, sample_names, calls = plink_genotype
+    expected = expected_genotype(*plink_genotype)
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_plink(Path(directory) / "genotype",
+                           chromosomes, positions,
+                           ["A"]*len(positions), ["G"]*len(positions),
+                           sample_names, calls)
+        with path.open("rb") as file:
+            assert genotype_sample_names(file) == sample_names
+            pd.testing.assert_frame_equal(expected, read_genotype(file),
+                                          check_column_type=False)
+            file.seek(0)
+            pd.testing.assert_frame_equal(
+                expected,
+                pd.concat(read_genotype_chunks(file, chunk_size),
+                          ignore_index=True),
+                check_column_type=False)
+            file.seek(0)
+            pd.testing.assert_frame_equal(
+                expected,
+                pd.concat([read_genotype_slice(slice)
+                           for slice in genotype_slices(file, chunk_size)],
+                          ignore_index=True),
+                check_column_type=False)
+            file.seek(0)
+            region = Region("X", 2, None)
+            counted_chunks = list(read_selected_genotype_chunks(file, chunk_size,
+                                                                region=region))
+            in_region = ((expected.chromosome == "X")
+                         & (expected.position >= 2)).to_numpy(dtype=bool)
+            assert (sum(snps for snps, _ in counted_chunks)
+                    == np.count_nonzero(in_region))
+            pd.testing.assert_frame_equal(
+                expected[in_region].reset_index(drop=True),
+                pd.concat([chunk for _, chunk in counted_chunks],
+                          ignore_index=True),
+                check_column_type=False,
+                check_index_type=False)
+
+@given(arrays("uint8", st.tuples(st.integers(min_value=0, max_value=5),
+                                 st.integers(min_value=1, max_value=5))),
+       st.data())
+def test_decode_dosages_has_no_missing_values(packed, data):
+    number_of_samples = data.draw(st.integers(min_value=4*packed.shape[1] - 3,
+                                              max_value=4*packed.shape[1]))
+    dosages = decode_dosages(packed, number_of_samples)
+    assert dosages.shape == (len(packed), number_of_samples)
+    assert not np.isnan(dosages).any()
+
+def test_read_plink_genotype_rejects_mismatched_files(tmp_path):
+    path = write_plink(tmp_path / "genotype", ["1"], [1], ["A"], ["G"],
+                       ["sample1", "sample2"], [[0, 1]])
+    with (tmp_path / "genotype.fam").open("a") as file:
+        file.write("family sample3 0 0 0 -9\n")
+        file.write("family sample4 0 0 0 -9\n")
+        file.write("family sample5 0 0 0 -9\n")
+    with path.open("rb") as file, pytest.raises(ValueError):
+        read_genotype(file)
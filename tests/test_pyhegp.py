@@ -16,10 +16,14 @@
 ### You should have received a copy of the GNU General Public License
 ### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
 
-from itertools import pairwise, product
+import gzip
+from itertools import islice, pairwise, product
+import json
 import math
 from pathlib import Path
 import shutil
+import subprocess
+import sys
 
 from click.testing import CliRunner
 from hypothesis import given, strategies as st
@@ -29,12 +33,21 @@ import pandas as pd
 import pytest
 from pytest import approx
 
-from pyhegp.pyhegp import Stats, main, hegp_encrypt, hegp_decrypt, random_key, pool_stats, center, uncenter, standardize, unstandardize, genotype_summary, drop_zero_stddev_snps, drop_uncommon_snps, encrypt_genotype, encrypt_phenotype, cat_genotype, cat_phenotype
-from pyhegp.serialization import Summary, read_summary, read_genotype, is_genotype_metadata_column
+from pyhegp.pyhegp import Stats, main, hegp_encrypt, hegp_decrypt, random_key, qr_rotation, pool_stats, pool_summaries, center, uncenter, standardize, unstandardize, genotype_summary, drop_zero_stddev_snps, drop_uncommon_snps, align_summary, select_common_snps, summary_index, encrypt_genotype, encrypt_genotype_chunks, encrypt_phenotype, cat_genotype, cat_phenotype
+from pyhegp.journal import read_journal, write_journaled_genotype_chunks
+from pyhegp.serialization import Summary, read_summary, write_summary, read_genotype, read_phenotype, write_genotype, write_phenotype, write_key, is_genotype_metadata_column
 from pyhegp.utils import negate
 
+from helpers.pipes import run_pyhegp
+from helpers.plink import write_plink
 from helpers.strategies import genotype_frames, phenotype_frames, keys
 
+@given(genotype_frames())
+def test_genotype_summary_counts_samples(genotype):
+    assert (genotype_summary(genotype).n
+            == len(list(filter(negate(is_genotype_metadata_column),
+                               genotype.columns))))
+
 @given(st.lists(st.lists(arrays("float64",
                                 st.shared(array_shapes(min_dims=1, max_dims=1),
                                           key="pool-vector-length"),
@@ -61,12 +74,16 @@ def test_pool_stats(pools):
                                       (Path("test-data/encrypt-test-genotype-without-reference.tsv"),
                                        Path("test-data/encrypt-test-summary-without-reference"))],
                                      [True, False])])
-def test_encrypt_command(tmp_path, genotype_file, summary_file, only_center):
+@pytest.mark.parametrize("chunk_size", [None, 1])
+def test_encrypt_command(tmp_path, genotype_file, summary_file, only_center,
+                         chunk_size):
     shutil.copy(genotype_file, tmp_path)
     ciphertext = tmp_path / f"{genotype_file.name}.hegp"
     result = CliRunner().invoke(main, ["encrypt",
                                        "-s", summary_file,
                                        *(("--only-center",) if only_center else ()),
+                                       *(("--chunk-size", str(chunk_size))
+                                         if chunk_size else ()),
                                        str(tmp_path / genotype_file.name)])
     assert result.exit_code == 0
     assert ciphertext.exists()
@@ -77,6 +94,35 @@ def test_encrypt_command(tmp_path, genotype_file, summary_file, only_center):
     # expected output once it is possible to specify the key.
     assert len(encrypted_genotype) == 3
 
+@pytest.mark.parametrize("genotype_file,summary_file,only_center",
+                         [(genotype_file, summary_file, only_center)
+                          for (genotype_file, summary_file), only_center
+                          in product([(Path("test-data/genotype.tsv"), None),
+                                      (Path("test-data/encrypt-test-genotype.tsv"),
+                                       Path("test-data/encrypt-test-summary"))],
+                                     [True, False])])
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_chunked_encrypt_command(tmp_path, genotype_file, summary_file,
+                                 only_center, chunk_size):
+    runner = CliRunner()
+    plaintext = tmp_path / genotype_file.name
+    shutil.copy(genotype_file, plaintext)
+    ciphertext = tmp_path / f"{genotype_file.name}.hegp"
+    key = tmp_path / "key"
+    def encrypt(*args):
+        result = runner.invoke(main, ["encrypt",
+                                      *(("-s", summary_file) if summary_file else ()),
+                                      *(("--only-center",) if only_center else ()),
+                                      "--force",
+                                      *args,
+                                      str(plaintext)])
+        assert result.exit_code == 0
+        with ciphertext.open("rb") as file:
+            return read_genotype(file)
+    pd.testing.assert_frame_equal(encrypt("--key-out", key),
+                                  encrypt("--key-in", key,
+                                          "--chunk-size", str(chunk_size)))
+
 def no_column_zero_standard_deviation(matrix):
     return not np.any(np.isclose(np.std(matrix, axis=0), 0))
 
@@ -105,6 +151,22 @@ def test_hegp_encryption_decryption_are_inverses(plaintext_and_number_of_key_blo
     key = random_key(rng, len(plaintext), number_of_key_blocks)
     assert hegp_decrypt(hegp_encrypt(plaintext, key), key) == approx(plaintext)
 
+@given(st.integers(min_value=2, max_value=50),
+       st.integers(min_value=0, max_value=2**32-1))
+def test_qr_rotation_is_rotation(n, seed):
+    rotation = qr_rotation(np.random.default_rng(seed), n)
+    assert rotation @ rotation.T == approx(np.identity(n), abs=1e-9)
+    assert np.linalg.det(rotation) == approx(1)
+
+@pytest.mark.parametrize("sampler", ["scipy", "qr"])
+def test_random_key_does_not_depend_on_number_of_workers(sampler):
+    def key(number_of_workers):
+        return random_key(np.random.default_rng(42), 20, 4,
+                          sampler=sampler,
+                          number_of_workers=number_of_workers)
+    assert all(np.array_equal(block1, block2)
+               for block1, block2 in zip(key(1).blocks, key(3).blocks))
+
 @given(arrays("float64",
               array_shapes(min_dims=2, max_dims=2),
               elements=st.floats(min_value=0, max_value=100)))
@@ -124,6 +186,18 @@ def test_standardize_unstandardize_are_inverses(matrix):
     assert unstandardize(standardize(matrix, mean, standard_deviation),
                          mean, standard_deviation) == approx(matrix)
 
+@given(arrays("float64",
+              array_shapes(min_dims=2, max_dims=2),
+              elements=st.floats(min_value=0, max_value=100))
+       .filter(no_column_zero_standard_deviation))
+def test_standardize_in_place(matrix):
+    mean = np.mean(matrix, axis=0)
+    standard_deviation = np.std(matrix, axis=0)
+    expected = (matrix - mean) / standard_deviation
+    result = standardize(matrix, mean, standard_deviation, out=matrix)
+    assert result is matrix
+    assert matrix == approx(expected)
+
 def square_matrices(order, elements=None):
     def generate(draw):
         n = draw(order)
@@ -171,6 +245,27 @@ def test_encrypt_genotype_does_not_produce_na(genotype, key, only_center):
     assert not (encrypt_genotype(common_genotype, key, summary, only_center)
                 .isna().any(axis=None))
 
+def test_select_common_snps_matches_merge():
+    with Path("test-data/genotype.tsv").open("rb") as file:
+        genotype = read_genotype(file)
+    # Summaries need not be in the order of the genotype.
+    summary = genotype_summary(genotype)
+    summary = summary._replace(data=summary.data.iloc[::-2])
+    index = summary_index(summary)
+    for start in range(0, len(genotype), 3):
+        chunk = genotype.iloc[start:start+3].reset_index(drop=True)
+        common_chunk, common_summary = select_common_snps(chunk, summary, index)
+        expected_chunk = drop_uncommon_snps(chunk, summary)
+        pd.testing.assert_frame_equal(common_chunk, expected_chunk)
+        pd.testing.assert_frame_equal(common_summary.data,
+                                      align_summary(summary, expected_chunk).data)
+
+def test_summary_index_rejects_duplicate_snps():
+    with Path("test-data/genotype.tsv").open("rb") as file:
+        summary = genotype_summary(read_genotype(file))
+    with pytest.raises(ValueError):
+        summary_index(summary._replace(data=pd.concat([summary.data]*2)))
+
 @given(phenotype_frames(st.shared(st.integers(min_value=2, max_value=10),
                                   key="number-of-samples")),
        keys(st.shared(st.integers(min_value=2, max_value=10),
@@ -178,6 +273,27 @@ def test_encrypt_genotype_does_not_produce_na(genotype, key, only_center):
 def test_encrypt_phenotype_does_not_produce_na(phenotype, key):
     assert not encrypt_phenotype(phenotype, key).isna().any(axis=None)
 
+@pytest.mark.parametrize("dosage_block_bytes", [64, 2**24])
+@pytest.mark.parametrize("only_center", [True, False])
+def test_encrypt_compact_genotype(monkeypatch, dosage_block_bytes, only_center):
+    # Compact dosages are widened a block at a time, but their summary
+    # and ciphertext are the same as of float64 dosages.
+    monkeypatch.setattr("pyhegp.serialization.DOSAGE_BLOCK_BYTES",
+                        dosage_block_bytes)
+    with Path("test-data/genotype.tsv").open("rb") as file:
+        genotype = read_genotype(file)
+    sample_names = list(filter(negate(is_genotype_metadata_column),
+                               genotype.columns))
+    genotype[sample_names] = (genotype[sample_names] * 10).round() % 3
+    compact_genotype = genotype.astype({name: "int8" for name in sample_names})
+    summary = genotype_summary(genotype)
+    pd.testing.assert_frame_equal(summary.data,
+                                  genotype_summary(compact_genotype).data)
+    key = random_key(np.random.default_rng(0), len(sample_names))
+    pd.testing.assert_frame_equal(
+        encrypt_genotype(genotype, key, summary, only_center),
+        encrypt_genotype(compact_genotype, key, summary, only_center))
+
 def test_encrypt_with_only_center_does_not_drop_snps(tmp_path):
     genotype_file = Path("test-data/genotype-with-zero-stddev-snp.tsv")
     shutil.copy(genotype_file, tmp_path)
@@ -196,10 +312,24 @@ def test_encrypt_with_only_center_does_not_drop_snps(tmp_path):
                            Path("test-data/pool-test-summary2")],
                           [Path("test-data/pool-test-summary1-without-reference"),
                            Path("test-data/pool-test-summary2-without-reference")]])
-def test_pool_command(tmp_path, summary_files):
+@pytest.mark.parametrize("chunk_size", [None, 1, 2, 1000])
+@pytest.mark.parametrize("summary_format", ["tsv", "binary"])
+def test_pool_command(tmp_path, summary_files, chunk_size, summary_format):
     columns = ["chromosome", "position", "reference", "mean", "std"]
     complete_summary = tmp_path / "complete-summary"
+    if summary_format == "binary":
+        binary_summary_files = []
+        for summary_file in summary_files:
+            with summary_file.open("rb") as file:
+                summary = read_summary(file)
+            binary_summary_files.append(tmp_path / summary_file.name)
+            with binary_summary_files[-1].open("wb") as file:
+                write_summary(file, summary, "binary")
+        summary_files = binary_summary_files
     result = CliRunner().invoke(main, ["pool",
+                                       *(("--chunk-size", str(chunk_size))
+                                         if chunk_size else ()),
+                                       "--format", summary_format,
                                        "-o", complete_summary,
                                        *(str(summary_file) for summary_file in summary_files)],
                                 catch_exceptions=True)
@@ -214,6 +344,89 @@ def test_pool_command(tmp_path, summary_files):
                                   expected_pooled_summary.data)
     assert pooled_summary.n == expected_pooled_summary.n
 
+@pytest.mark.parametrize("compress", [False, True])
+def test_summary_command_reads_genotype_from_stdin(tmp_path, compress):
+    genotype_file = Path("test-data/genotype.tsv")
+    expected_summary = tmp_path / "expected-summary"
+    assert run_pyhegp("summary", "-o", expected_summary,
+                      genotype_file).returncode == 0
+    summary = tmp_path / "summary"
+    genotype = genotype_file.read_bytes()
+    process = run_pyhegp("summary", "-o", summary, "-",
+                         input=gzip.compress(genotype) if compress else genotype)
+    assert process.returncode == 0, process.stderr
+    assert summary.read_bytes() == expected_summary.read_bytes()
+
+@pytest.mark.parametrize("summary_format", ["tsv", "binary"])
+@pytest.mark.parametrize("chunk_size", [None, 1])
+def test_summary_through_pipes(tmp_path, summary_format, chunk_size):
+    # Summaries are written to, and read from, pipes, which cannot be
+    # rewound.
+    genotype_file = Path("test-data/genotype.tsv")
+    process = run_pyhegp("summary", "--format", summary_format, genotype_file)
+    assert process.returncode == 0, process.stderr
+    expected_summary = tmp_path / "expected-summary"
+    assert run_pyhegp("summary", "--format", summary_format,
+                      "-o", expected_summary, genotype_file).returncode == 0
+    assert process.stdout == expected_summary.read_bytes()
+    summary = process.stdout
+    def pool(*args, input=b""):
+        return run_pyhegp("pool",
+                          *(("--chunk-size", chunk_size) if chunk_size else ()),
+                          "--format", summary_format,
+                          *args,
+                          input=input)
+    expected_pooled_summary = tmp_path / "expected-pooled-summary"
+    assert pool("-o", expected_pooled_summary,
+                expected_summary).returncode == 0
+    pooled_summary = tmp_path / "pooled-summary"
+    process = pool("-o", pooled_summary, "-", input=summary)
+    assert process.returncode == 0, process.stderr
+    assert pooled_summary.read_bytes() == expected_pooled_summary.read_bytes()
+    process = run_pyhegp("encrypt", "-s", "-",
+                         *(("--chunk-size", chunk_size) if chunk_size else ()),
+                         "--key-out", tmp_path / "key",
+                         tmp_path / shutil.copy(genotype_file, tmp_path),
+                         input=summary)
+    assert process.returncode == 0, process.stderr
+    assert (tmp_path / f"{genotype_file.name}.hegp").exists()
+
+@pytest.mark.parametrize("summary_format", ["tsv", "binary"])
+def test_chunked_pool_command_with_empty_summary(tmp_path, summary_format):
+    with open("test-data/pool-test-summary1", "rb") as file:
+        summary = read_summary(file)
+    empty_summary = tmp_path / "empty-summary"
+    with empty_summary.open("wb") as file:
+        write_summary(file, Summary(summary.n, summary.data.iloc[:0]),
+                      summary_format)
+    pooled_summary = tmp_path / "pooled-summary"
+    result = CliRunner().invoke(main, ["pool", "--chunk-size", "2",
+                                       "--format", summary_format,
+                                       "-o", pooled_summary,
+                                       str(empty_summary),
+                                       "test-data/pool-test-summary2"])
+    assert result.exit_code == 0
+    with pooled_summary.open("rb") as file:
+        pooled = read_summary(file)
+    assert len(pooled.data) == 0
+    assert {"chromosome", "position", "mean", "std"} <= set(pooled.data.columns)
+
+def test_pool_summaries_uses_standard_deviation_of_each_summary():
+    def summary(n, mean, std):
+        return Summary(n, pd.DataFrame({"chromosome": ["chr1"],
+                                        "position": [1],
+                                        "mean": [mean],
+                                        "std": [std]}))
+    pooled_summary = pool_summaries([summary(10, 1.0, 2.0),
+                                     summary(20, 3.0, 0.5),
+                                     summary(5, -1.0, 4.0)])
+    expected_stats = pool_stats([Stats(10, np.array([1.0]), np.array([2.0])),
+                                 Stats(20, np.array([3.0]), np.array([0.5])),
+                                 Stats(5, np.array([-1.0]), np.array([4.0]))])
+    assert pooled_summary.n == 35
+    assert pooled_summary.data["mean"].to_numpy() == approx(expected_stats.mean)
+    assert pooled_summary.data["std"].to_numpy() == approx(expected_stats.std)
+
 def split_data_frame(draw, df, axis="index"):
     if axis not in ["index", "columns"]:
         raise ValueError(f"Unrecognized axis argument {axis}")
@@ -244,6 +457,89 @@ def test_cat_genotype(genotypes):
     pd.testing.assert_frame_equal(complete_genotype,
                                   cat_genotype(split_genotypes))
 
+@pytest.mark.parametrize("chunk_size", [None, 1])
+def test_binary_genotype_through_pipes(tmp_path, chunk_size):
+    # Binary genotypes are written to, and read from, pipes, which
+    # cannot be rewound.
+    genotype_file = Path("test-data/genotype.tsv")
+    chunk_size_args = ("--chunk-size", chunk_size) if chunk_size else ()
+    process = run_pyhegp("cat-genotype", "--format", "binary",
+                         *chunk_size_args, genotype_file)
+    assert process.returncode == 0, process.stderr
+    binary_genotype = tmp_path / "genotype.hgb"
+    assert run_pyhegp("cat-genotype", "-o", binary_genotype,
+                      genotype_file).returncode == 0
+    assert process.stdout == binary_genotype.read_bytes()
+    expected_summary = tmp_path / "expected-summary"
+    assert run_pyhegp("summary", "-o", expected_summary,
+                      genotype_file).returncode == 0
+    summary = tmp_path / "summary"
+    process = run_pyhegp("summary", *chunk_size_args, "-o", summary, "-",
+                         input=process.stdout)
+    assert process.returncode == 0, process.stderr
+    assert summary.read_bytes() == expected_summary.read_bytes()
+
+@pytest.mark.parametrize("format", ["tsv", "binary"])
+@pytest.mark.parametrize("chunk_size", [None, 2])
+def test_cat_genotype_command_with_empty_genotype(tmp_path, format, chunk_size):
+    # Concatenating with a genotype of no SNPs yields a genotype of no
+    # SNPs, but with the samples of every genotype.
+    genotype_files = [tmp_path / "genotype0.tsv", tmp_path / "genotype1.tsv"]
+    genotypes = []
+    for genotype_file, source, rows in zip(genotype_files,
+                                           [Path("test-data/genotype0.tsv"),
+                                            Path("test-data/genotype1.tsv")],
+                                           [slice(0, 0), slice(None)]):
+        with source.open("rb") as file:
+            genotypes.append(read_genotype(file).iloc[rows])
+        with genotype_file.open("wb") as file:
+            write_genotype(file, genotypes[-1], format)
+    output = tmp_path / "complete-genotype"
+    result = CliRunner().invoke(main, ["cat-genotype",
+                                       *(("--chunk-size", str(chunk_size))
+                                         if chunk_size
+                                         else ()),
+                                       "--format", format,
+                                       "-o", output,
+                                       *map(str, genotype_files)])
+    assert result.exit_code == 0
+    with output.open("rb") as file:
+        complete_genotype = read_genotype(file)
+    assert len(complete_genotype) == 0
+    assert list(complete_genotype.columns) == list(cat_genotype(genotypes).columns)
+
+@pytest.mark.parametrize("format", ["tsv", "binary"])
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_chunked_cat_genotype_command(tmp_path, format, chunk_size):
+    # Drop different SNPs from each genotype so that the join has
+    # something to do.
+    genotype_files = []
+    for i, genotype_file in enumerate([Path("test-data/genotype0.tsv"),
+                                       Path("test-data/genotype1.tsv"),
+                                       Path("test-data/genotype2.tsv"),
+                                       Path("test-data/genotype3.tsv")]):
+        with genotype_file.open("rb") as file:
+            genotype = read_genotype(file)
+        genotype_files.append(tmp_path / genotype_file.name)
+        with genotype_files[-1].open("wb") as file:
+            write_genotype(file,
+                           genotype[genotype.index % 5 != i],
+                           format=format)
+    def cat(output_file, *args):
+        result = CliRunner().invoke(main, ["cat-genotype",
+                                           "--format", format,
+                                           "-o", output_file,
+                                           *args,
+                                           *map(str, genotype_files)])
+        assert result.exit_code == 0
+        with output_file.open("rb") as file:
+            return read_genotype(file)
+    expected_genotype = cat(tmp_path / "expected")
+    assert len(expected_genotype) == 20
+    pd.testing.assert_frame_equal(expected_genotype,
+                                  cat(tmp_path / "chunked",
+                                      "--chunk-size", str(chunk_size)))
+
 @st.composite
 def catenable_phenotype_frames(draw):
     phenotype = draw(phenotype_frames())
@@ -255,6 +551,38 @@ def test_cat_phenotype(phenotypes):
     pd.testing.assert_frame_equal(complete_phenotype,
                                   cat_phenotype(split_phenotypes))
 
+@pytest.mark.parametrize("reorder_columns", [False, True])
+def test_cat_phenotype_command(tmp_path, reorder_columns):
+    ciphertexts = [tmp_path / "phenotype1.tsv.hegp",
+                   tmp_path / "phenotype2.tsv.hegp"]
+    ciphertexts[0].write_text("sample-id\tintercept\tweight\n"
+                              "a\t0.123456789012345\t-1.5\n")
+    # The last line is not terminated.
+    ciphertexts[1].write_text("sample-id\tweight\tintercept\n"
+                              "b\t2.25\t3\n"
+                              "c\t1e-10\t0.5"
+                              if reorder_columns
+                              else "sample-id\tintercept\tweight\n"
+                              "b\t3\t2.25\n"
+                              "c\t0.5\t1e-10")
+    output = tmp_path / "complete-phenotype.tsv.hegp"
+    result = CliRunner().invoke(main, ["cat-phenotype", "-o", output,
+                                       *map(str, ciphertexts)])
+    assert result.exit_code == 0
+    with output.open("rb") as file:
+        pd.testing.assert_frame_equal(
+            read_phenotype(file),
+            pd.DataFrame({"sample-id": pd.Series(["a", "b", "c"], dtype="str"),
+                          "intercept": [0.123456789012345, 3, 0.5],
+                          "weight": [-1.5, 2.25, 1e-10]}),
+            rtol=1e-6)
+    if not reorder_columns:
+        # Rows are copied byte for byte.
+        assert output.read_text() == ("sample-id\tintercept\tweight\n"
+                                      "a\t0.123456789012345\t-1.5\n"
+                                      "b\t3\t2.25\n"
+                                      "c\t0.5\t1e-10\n")
+
 @pytest.mark.parametrize("genotype_file,only_center",
                          product([Path("test-data/genotype.tsv"),
                                   Path("test-data/genotype-without-reference.tsv")],
@@ -269,6 +597,518 @@ def test_simple_workflow(tmp_path, genotype_file, only_center):
     assert result.exit_code == 0
     assert ciphertext.exists()
 
+@pytest.mark.parametrize("sampler", ["scipy", "qr"])
+def test_encrypt_command_with_key_seed(tmp_path, sampler):
+    genotype_file = Path("test-data/genotype.tsv")
+    shutil.copy(genotype_file, tmp_path)
+    key_seed = tmp_path / "key-seed"
+    ciphertext = tmp_path / f"{genotype_file.name}.hegp"
+    def encrypt(*args):
+        result = CliRunner().invoke(main, ["encrypt",
+                                           "--force",
+                                           "--key-blocks", "3",
+                                           *args,
+                                           str(tmp_path / genotype_file.name)])
+        assert result.exit_code == 0
+        with ciphertext.open("rb") as file:
+            return read_genotype(file)
+    pd.testing.assert_frame_equal(encrypt("--key-sampler", sampler,
+                                          "--key-format", "seed",
+                                          "--key-out", key_seed),
+                                  encrypt("--key-in", key_seed))
+    assert key_seed.stat().st_size < 1000
+
+def test_binary_genotype_workflow(tmp_path):
+    runner = CliRunner()
+    key = tmp_path / "key"
+    ciphertexts = []
+    for genotype_file in [Path("test-data/genotype0.tsv"),
+                          Path("test-data/genotype1.tsv")]:
+        shutil.copy(genotype_file, tmp_path)
+        binary_genotype_file = tmp_path / f"{genotype_file.stem}.hgb"
+        with genotype_file.open("rb") as file:
+            genotype = read_genotype(file)
+        with binary_genotype_file.open("wb") as file:
+            write_genotype(file, genotype, format="binary")
+        result = runner.invoke(main, ["encrypt", "--key-out", key,
+                                      str(tmp_path / genotype_file.name)])
+        assert result.exit_code == 0
+        result = runner.invoke(main, ["encrypt", "--key-in", key,
+                                      str(binary_genotype_file)])
+        assert result.exit_code == 0
+        with (tmp_path / f"{genotype_file.name}.hegp").open("rb") as file:
+            expected_ciphertext = read_genotype(file)
+        with (tmp_path / f"{binary_genotype_file.name}.hegp").open("rb") as file:
+            pd.testing.assert_frame_equal(expected_ciphertext,
+                                          read_genotype(file),
+                                          rtol=1e-6)
+        ciphertexts.append(tmp_path / f"{binary_genotype_file.name}.hegp")
+    complete_ciphertext = tmp_path / "complete-genotype.hgb.hegp"
+    result = runner.invoke(main, ["cat-genotype", "-o", complete_ciphertext,
+                                  *map(str, ciphertexts)])
+    assert result.exit_code == 0
+    with complete_ciphertext.open("rb") as file:
+        assert len(read_genotype(file).columns) == 2 + 2*5
+
+@pytest.mark.parametrize("genotype_file",
+                         [Path("test-data/genotype.tsv"),
+                          Path("test-data/genotype-without-reference.tsv")])
+@pytest.mark.parametrize("format", ["tsv", "binary", "bgzf"])
+@pytest.mark.parametrize("chunk_size,jobs", [(1, 1), (3, 2), (1000, 2)])
+@pytest.mark.parametrize("summary_format", ["tsv", "binary"])
+def test_chunked_summary_command(tmp_path, genotype_file, format,
+                                 chunk_size, jobs, summary_format):
+    plaintext = tmp_path / genotype_file.name
+    with genotype_file.open("rb") as file:
+        genotype = read_genotype(file)
+    with plaintext.open("wb") as file:
+        write_genotype(file, genotype, format=format)
+    summary = tmp_path / "summary"
+    result = CliRunner().invoke(main, ["--jobs", str(jobs),
+                                       "summary",
+                                       "--chunk-size", str(chunk_size),
+                                       "--format", summary_format,
+                                       "-o", summary,
+                                       str(plaintext)])
+    assert result.exit_code == 0
+    with summary.open("rb") as file:
+        chunked_summary = read_summary(file)
+    expected_summary = genotype_summary(genotype)
+    assert chunked_summary.n == expected_summary.n
+    pd.testing.assert_frame_equal(chunked_summary.data,
+                                  expected_summary.data,
+                                  rtol=1e-6)
+
+@pytest.mark.parametrize("chunk_size", [None, 7])
+@pytest.mark.parametrize("genotype_format", ["tsv", "binary", "bgzf"])
+def test_encrypt_command_with_parallel_jobs(tmp_path, chunk_size,
+                                            genotype_format):
+    genotype_file = Path("test-data/genotype.tsv")
+    with genotype_file.open("rb") as file:
+        genotype = read_genotype(file)
+    with (tmp_path / genotype_file.name).open("wb") as file:
+        write_genotype(file, genotype, genotype_format)
+    key = tmp_path / "key"
+    ciphertext = tmp_path / f"{genotype_file.name}.hegp"
+    def encrypt(jobs, *args):
+        result = CliRunner().invoke(main, ["--jobs", str(jobs),
+                                           "encrypt",
+                                           "--force",
+                                           "--key-blocks", "4",
+                                           *(["--chunk-size", str(chunk_size)]
+                                             if chunk_size
+                                             else []),
+                                           *args,
+                                           str(tmp_path / genotype_file.name)])
+        assert result.exit_code == 0
+        with ciphertext.open("rb") as file:
+            return read_genotype(file)
+    pd.testing.assert_frame_equal(encrypt(1, "--key-out", key),
+                                  encrypt(4, "--key-in", key))
+
+@pytest.mark.parametrize("queue_depth", [1, 3])
+def test_encrypt_command_with_queue_depth(tmp_path, queue_depth):
+    genotype_file = Path("test-data/genotype.tsv")
+    shutil.copy(genotype_file, tmp_path)
+    key = tmp_path / "key"
+    ciphertext = tmp_path / f"{genotype_file.name}.hegp"
+    def encrypt(queue_depth, *args):
+        result = CliRunner().invoke(main, ["encrypt",
+                                           "--force",
+                                           "--chunk-size", "7",
+                                           "--queue-depth", str(queue_depth),
+                                           *args,
+                                           str(tmp_path / genotype_file.name)])
+        assert result.exit_code == 0
+        with ciphertext.open("rb") as file:
+            return read_genotype(file)
+    pd.testing.assert_frame_equal(encrypt(0, "--key-out", key),
+                                  encrypt(queue_depth, "--key-in", key))
+
+@pytest.mark.parametrize("format", ["tsv", "binary", "bgzf"])
+@pytest.mark.parametrize("chunk_size", [None, 3])
+def test_region_option(tmp_path, format, chunk_size):
+    genotype_file = Path("test-data/genotype.tsv")
+    with genotype_file.open("rb") as file:
+        genotype = read_genotype(file)
+    plaintext = tmp_path / genotype_file.name
+    with plaintext.open("wb") as file:
+        write_genotype(file, genotype, format)
+    region_genotype = genotype[genotype.position.between(3300000, 3500000)].reset_index(drop=True)
+    runner = CliRunner()
+    chunk_size_args = ["--chunk-size", str(chunk_size)] if chunk_size else []
+    summary = tmp_path / "summary"
+    result = runner.invoke(main, ["summary", *chunk_size_args,
+                                  "--region", "chr11:3,300,000-3,500,000",
+                                  "-o", summary, str(plaintext)])
+    assert result.exit_code == 0
+    with summary.open("rb") as file:
+        pd.testing.assert_frame_equal(read_summary(file).data,
+                                      genotype_summary(region_genotype).data,
+                                      rtol=1e-6)
+    result = runner.invoke(main, ["encrypt", *chunk_size_args,
+                                  "--region", "chr11:3300000-3500000",
+                                  "-s", summary, str(plaintext)])
+    assert result.exit_code == 0
+    assert "Dropped" not in result.output
+    with (tmp_path / f"{plaintext.name}.hegp").open("rb") as file:
+        assert (read_genotype(file).position.tolist()
+                == region_genotype.position.tolist())
+    result = runner.invoke(main, ["summary", "--region", "chr11:x-y",
+                                  str(plaintext)])
+    assert result.exit_code != 0
+
+@pytest.mark.parametrize("chunk_size,jobs", [(None, 1), (3, 1), (3, 2)])
+def test_plink_genotype_commands(tmp_path, chunk_size, jobs):
+    rng = np.random.default_rng(0)
+    calls = rng.integers(-1, 3, (20, 9))
+    plaintext = write_plink(tmp_path / "genotype",
+                            ["1"]*20, list(range(100, 120)),
+                            ["A"]*20, ["G"]*20,
+                            [f"sample{i}" for i in range(9)],
+                            calls)
+    with plaintext.open("rb") as file:
+        genotype = read_genotype(file)
+    runner = CliRunner()
+    chunk_size_args = ["--chunk-size", str(chunk_size)] if chunk_size else []
+    summary = tmp_path / "summary"
+    result = runner.invoke(main, ["--jobs", str(jobs), "summary",
+                                  *chunk_size_args, "-o", summary,
+                                  str(plaintext)])
+    assert result.exit_code == 0
+    with summary.open("rb") as file:
+        pd.testing.assert_frame_equal(read_summary(file).data,
+                                      genotype_summary(genotype).data,
+                                      rtol=1e-6)
+    key = tmp_path / "key"
+    result = runner.invoke(main, ["--jobs", str(jobs), "encrypt",
+                                  *chunk_size_args, "-s", summary,
+                                  "--key-out", key, str(plaintext)])
+    assert result.exit_code == 0
+    # Ciphertexts of PLINK genotypes are binary genotypes. Decrypting
+    # them next to the PLINK genotype must leave it alone.
+    bed = plaintext.read_bytes()
+    result = runner.invoke(main, ["decrypt", "--key-in", key, "-s", summary,
+                                  str(tmp_path / "genotype.bed.hegp")])
+    assert result.exit_code == 0
+    assert plaintext.read_bytes() == bed
+    with (tmp_path / "genotype.bed.decrypted").open("rb") as file:
+        pd.testing.assert_frame_equal(
+            read_genotype(file),
+            drop_uncommon_snps(genotype.drop(columns=["reference"]),
+                               drop_zero_stddev_snps(genotype_summary(genotype))),
+            rtol=1e-6)
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("chunk_size", [None, 1])
+def test_encrypt_command_with_many_genotype_files(tmp_path, jobs, chunk_size):
+    genotype_file = Path("test-data/genotype.tsv")
+    shutil.copy(genotype_file, tmp_path)
+    with genotype_file.open("rb") as file:
+        genotype = read_genotype(file)
+    shards = [tmp_path / f"shard{i}.tsv" for i in range(2)]
+    for shard, rows in zip(shards, [genotype.iloc[:2], genotype.iloc[2:]]):
+        with shard.open("wb") as file:
+            write_genotype(file, rows)
+    manifest = tmp_path / "manifest"
+    manifest.write_text(f"{shards[1]}\n")
+    summary = tmp_path / "summary"
+    key = tmp_path / "key"
+    runner = CliRunner()
+    assert runner.invoke(main, ["summary", "-o", summary,
+                                str(tmp_path / genotype_file.name)]).exit_code == 0
+    assert runner.invoke(main, ["encrypt", "-s", summary, "--key-out", key,
+                                str(tmp_path / genotype_file.name)]).exit_code == 0
+    result = runner.invoke(main, ["--jobs", str(jobs), "encrypt",
+                                  "-s", summary, "--key-in", key,
+                                  "--manifest", manifest,
+                                  *(["--chunk-size", str(chunk_size)]
+                                    if chunk_size
+                                    else []),
+                                  str(shards[0])])
+    assert result.exit_code == 0
+    def read_ciphertext(path):
+        with Path(f"{path}.hegp").open("rb") as file:
+            return read_genotype(file)
+    pd.testing.assert_frame_equal(
+        read_ciphertext(tmp_path / genotype_file.name),
+        pd.concat([read_ciphertext(shard) for shard in shards],
+                  ignore_index=True))
+
+def journal_is_complete(journal):
+    with journal.open("rb") as file:
+        _, _, complete = read_journal(file)
+    return complete
+
+@pytest.mark.parametrize("format", ["tsv", "binary"])
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("completed_chunks", [0, 3, 15])
+def test_encrypt_command_resume(tmp_path, monkeypatch, format, jobs,
+                                completed_chunks):
+    genotype_file = Path("test-data/genotype.tsv")
+    with genotype_file.open("rb") as file:
+        genotype = read_genotype(file)
+    genotype_path = tmp_path / genotype_file.name
+    with genotype_path.open("wb") as file:
+        write_genotype(file, genotype, format)
+    ciphertext = tmp_path / f"{genotype_file.name}.hegp"
+    journal = tmp_path / f"{genotype_file.name}.hegp.journal"
+    summary = tmp_path / "summary"
+    key = tmp_path / "key"
+    runner = CliRunner()
+    assert runner.invoke(main, ["summary", "-o", summary,
+                                str(genotype_path)]).exit_code == 0
+    def encrypt(*args):
+        return runner.invoke(main, ["--jobs", str(jobs), "encrypt",
+                                    "-s", summary,
+                                    "--chunk-size", "7",
+                                    *args,
+                                    str(genotype_path)])
+    assert encrypt("--key-out", key).exit_code == 0
+    assert journal_is_complete(journal)
+    with ciphertext.open("rb") as file:
+        expected_ciphertext = read_genotype(file)
+
+    # Interrupt an encryption after some chunks, and leave some
+    # garbage from an incomplete chunk behind.
+    def interrupted(file, journal, counted_chunks, *args):
+        def chunks():
+            yield from islice(counted_chunks, completed_chunks)
+            file.write(b"garbage")
+            journal.write(b"garbage")
+            raise RuntimeError("Interrupted")
+        return write_journaled_genotype_chunks(file, journal, chunks(), *args)
+    monkeypatch.setattr("pyhegp.pyhegp.write_journaled_genotype_chunks",
+                        interrupted)
+    assert encrypt("--force", "--key-in", key).exit_code != 0
+    assert not journal_is_complete(journal)
+    monkeypatch.undo()
+
+    # Only resume if asked to, and with the same key.
+    assert encrypt("--key-in", key).exit_code == 1
+    assert encrypt("--resume").exit_code == 1
+    other_key = tmp_path / "other-key"
+    with other_key.open("wb") as file:
+        write_key(file, random_key(np.random.default_rng(0), 20))
+    assert encrypt("--resume", "--key-in", other_key).exit_code == 1
+
+    # Only the remaining chunks are encrypted.
+    encrypted_chunks = []
+    def counted_encrypt_genotype_chunks(chunks, *args):
+        for chunk in encrypt_genotype_chunks(chunks, *args):
+            encrypted_chunks.append(chunk)
+            yield chunk
+    monkeypatch.setattr("pyhegp.pyhegp.encrypt_genotype_chunks",
+                        counted_encrypt_genotype_chunks)
+    assert encrypt("--resume", "--key-in", key).exit_code == 0
+    if jobs == 1:
+        assert len(encrypted_chunks) == max(15 - completed_chunks, 0)
+    assert journal_is_complete(journal)
+    with ciphertext.open("rb") as file:
+        pd.testing.assert_frame_equal(read_genotype(file), expected_ciphertext)
+
+    # Complete ciphertexts are skipped.
+    mtime = ciphertext.stat().st_mtime_ns
+    assert encrypt("--resume", "--key-in", key).exit_code == 0
+    assert ciphertext.stat().st_mtime_ns == mtime
+
+def test_encrypt_command_does_not_resume_over_other_encryptions(tmp_path):
+    # Complete ciphertexts encrypted with another key, or without a
+    # journal, are not skipped when resuming.
+    genotype_files = [tmp_path / "genotype1.tsv", tmp_path / "genotype2.tsv"]
+    for genotype_file in genotype_files:
+        shutil.copy("test-data/genotype.tsv", genotype_file)
+    summary = tmp_path / "summary"
+    keys = [tmp_path / "key1", tmp_path / "key2"]
+    runner = CliRunner()
+    assert runner.invoke(main, ["summary", "-o", summary,
+                                "test-data/genotype.tsv"]).exit_code == 0
+    def encrypt(*args):
+        return runner.invoke(main, ["encrypt", "-s", summary,
+                                    "--chunk-size", "7", *args])
+    assert encrypt("--key-out", keys[0], str(genotype_files[0])).exit_code == 0
+    assert encrypt("--key-out", keys[1], str(genotype_files[1])).exit_code == 0
+    result = encrypt("--resume", "--key-in", keys[0], *map(str, genotype_files))
+    assert result.exit_code == 1
+    assert "different key" in result.output
+    # The ciphertexts of the same key are skipped.
+    ciphertext = Path(f"{genotype_files[0]}.hegp")
+    mtime = ciphertext.stat().st_mtime_ns
+    assert encrypt("--resume", "--key-in", keys[0],
+                   str(genotype_files[0])).exit_code == 0
+    assert ciphertext.stat().st_mtime_ns == mtime
+    # Unjournaled encryptions do not leave stale journals behind.
+    assert runner.invoke(main, ["encrypt", "-s", summary, "--force",
+                                "--key-in", keys[1],
+                                str(genotype_files[0])]).exit_code == 0
+    assert not Path(f"{ciphertext}.journal").exists()
+    result = encrypt("--resume", "--key-in", keys[0], str(genotype_files[0]))
+    assert result.exit_code == 1
+    assert "no journal" in result.output
+
+@pytest.mark.parametrize("format, chunk_size",
+                         [("tsv", None), ("binary", None), ("bgzf", 7)])
+def test_encrypt_command_does_not_resume_unjournaled_encryption(tmp_path, format,
+                                                                 chunk_size):
+    # Unjournaled ciphertexts cut short by an interruption must not be
+    # taken to be complete.
+    genotype_file = Path("test-data/genotype.tsv")
+    genotype_path = tmp_path / genotype_file.name
+    shutil.copy(genotype_file, genotype_path)
+    ciphertext = tmp_path / f"{genotype_file.name}.hegp"
+    summary = tmp_path / "summary"
+    key = tmp_path / "key"
+    runner = CliRunner()
+    assert runner.invoke(main, ["summary", "-o", summary,
+                                str(genotype_path)]).exit_code == 0
+    def encrypt(*args):
+        return runner.invoke(main, ["encrypt",
+                                    "-s", summary,
+                                    "--format", format,
+                                    *(("--chunk-size", str(chunk_size))
+                                      if chunk_size
+                                      else ()),
+                                    *args,
+                                    str(genotype_path)])
+    assert encrypt("--key-out", key).exit_code == 0
+    truncated = ciphertext.read_bytes()[:100]
+    ciphertext.write_bytes(truncated)
+    result = encrypt("--resume", "--key-in", key)
+    assert result.exit_code == 1
+    assert "Cannot resume" in result.output
+    assert ciphertext.read_bytes() == truncated
+
+def test_encrypt_command_rejects_genotype_files_of_different_samples(tmp_path):
+    genotype_files = [Path("test-data/genotype0.tsv"),
+                      Path("test-data/genotype1.tsv")]
+    result = CliRunner().invoke(main, ["encrypt",
+                                       *(str(genotype_file)
+                                         for genotype_file in genotype_files)])
+    assert result.exit_code == 1
+    assert not any(Path(f"{genotype_file}.hegp").exists()
+                   for genotype_file in genotype_files)
+
+@pytest.mark.parametrize("chunk_size", [None, 1])
+def test_encrypt_command_rejects_genotype_files_sharing_snps(tmp_path, chunk_size):
+    with Path("test-data/genotype.tsv").open("rb") as file:
+        genotype = read_genotype(file)
+    shards = [tmp_path / f"shard{i}.tsv" for i in range(2)]
+    for shard, rows in zip(shards, [genotype.iloc[:3], genotype.iloc[2:]]):
+        with shard.open("wb") as file:
+            write_genotype(file, rows)
+    result = CliRunner().invoke(main, ["encrypt",
+                                       *(["--chunk-size", str(chunk_size)]
+                                         if chunk_size
+                                         else []),
+                                       *map(str, shards)])
+    assert result.exit_code == 1
+    assert (f"{genotype.chromosome[2]}:{genotype.position[2]}"
+            in result.output)
+    assert not any(Path(f"{shard}.hegp").exists() for shard in shards)
+
+@pytest.mark.parametrize("only_center", [True, False])
+@pytest.mark.parametrize("chunk_size", [None, 7])
+def test_decrypt_command(tmp_path, only_center, chunk_size):
+    genotype_file = Path("test-data/genotype.tsv")
+    plaintext = tmp_path / genotype_file.name
+    shutil.copy(genotype_file, plaintext)
+    phenotype = tmp_path / "phenotype.tsv"
+    summary = tmp_path / "summary"
+    key = tmp_path / "key"
+    runner = CliRunner()
+    assert runner.invoke(main, ["summary", "-o", summary,
+                                str(plaintext)]).exit_code == 0
+    with plaintext.open("rb") as file:
+        genotype = read_genotype(file)
+    # The phenotype must have as many samples as the genotype.
+    number_of_samples = len(list(filter(negate(is_genotype_metadata_column),
+                                        genotype.columns)))
+    with phenotype.open("wb") as file:
+        write_phenotype(file,
+                        pd.DataFrame({"sample-id": [f"sample{i}"
+                                                    for i in range(number_of_samples)],
+                                      "weight": np.arange(number_of_samples,
+                                                          dtype="float")}))
+    with phenotype.open("rb") as file:
+        expected_phenotype = read_phenotype(file)
+    result = runner.invoke(main, ["encrypt", "-s", summary, "-k", key,
+                                  *(("--only-center",) if only_center else ()),
+                                  str(plaintext), str(phenotype)])
+    assert result.exit_code == 0
+    result = runner.invoke(main, ["decrypt", "-s", summary, "--key-in", key,
+                                  *(("--only-center",) if only_center else ()),
+                                  *(("--chunk-size", str(chunk_size))
+                                    if chunk_size else ()),
+                                  str(tmp_path / f"{genotype_file.name}.hegp"),
+                                  str(tmp_path / "phenotype.tsv.hegp")])
+    assert result.exit_code == 0
+    with (tmp_path / f"{genotype_file.name}.decrypted").open("rb") as file:
+        decrypted_genotype = read_genotype(file)
+    with (tmp_path / "phenotype.tsv.decrypted").open("rb") as file:
+        decrypted_phenotype = read_phenotype(file)
+    pd.testing.assert_frame_equal(
+        genotype.drop(columns=["reference"]),
+        decrypted_genotype,
+        rtol=1e-5, atol=1e-5)
+    pd.testing.assert_frame_equal(expected_phenotype, decrypted_phenotype,
+                                  rtol=1e-5, atol=1e-5)
+
+def test_decrypt_command_output(tmp_path):
+    genotype_file = Path("test-data/genotype.tsv")
+    plaintext = tmp_path / genotype_file.name
+    shutil.copy(genotype_file, plaintext)
+    ciphertext = tmp_path / f"{genotype_file.name}.hegp"
+    summary = tmp_path / "summary"
+    key = tmp_path / "key"
+    runner = CliRunner()
+    assert runner.invoke(main, ["summary", "-o", summary,
+                                str(plaintext)]).exit_code == 0
+    assert runner.invoke(main, ["encrypt", "-s", summary, "-k", key,
+                                str(plaintext)]).exit_code == 0
+    def decrypt(*args):
+        return runner.invoke(main, ["decrypt", "-s", summary, "--key-in", key,
+                                    *args, str(ciphertext)])
+    # The ciphertext and the plaintext are never overwritten, not even
+    # with --force.
+    assert decrypt("-o", ciphertext, "--force").exit_code == 1
+    assert decrypt("-o", plaintext).exit_code == 1
+    assert plaintext.read_bytes() == genotype_file.read_bytes()
+    output = tmp_path / "decrypted.tsv"
+    assert decrypt("-o", output).exit_code == 0
+    with plaintext.open("rb") as file:
+        genotype = read_genotype(file)
+    with output.open("rb") as file:
+        pd.testing.assert_frame_equal(read_genotype(file),
+                                      genotype.drop(columns=["reference"]),
+                                      rtol=1e-5, atol=1e-5)
+
+@pytest.mark.parametrize("chunk_size", [None, 10])
+def test_encrypt_command_metrics(tmp_path, chunk_size):
+    genotype_file = Path("test-data/genotype.tsv")
+    shutil.copy(genotype_file, tmp_path)
+    metrics_file = tmp_path / "metrics.json"
+    result = CliRunner().invoke(main, ["--metrics", str(metrics_file),
+                                       "--profile",
+                                       "--progress",
+                                       "encrypt",
+                                       *(("--chunk-size", str(chunk_size))
+                                         if chunk_size else ()),
+                                       str(tmp_path / genotype_file.name)])
+    assert result.exit_code == 0
+    with metrics_file.open() as file:
+        metrics = json.load(file)
+    assert metrics["command"] == "encrypt"
+    stages = {stage["stage"]: stage for stage in metrics["stages"]}
+    assert {"read genotype", "summary", "key", "drop zero stddev SNPs",
+            "drop uncommon SNPs", "encrypt genotype",
+            "write genotype"} <= set(stages)
+    assert all(stage["wall_seconds"] >= 0 and stage["process_peak_rss_bytes"] > 0
+               for stage in stages.values())
+    assert (sum(stage["wall_seconds"] for stage in stages.values())
+            == approx(metrics["wall_seconds"], rel=0.1))
+    if chunk_size:
+        assert stages["read genotype"]["snps"] == 100
+
 @pytest.mark.parametrize("genotype_files,only_center",
                          product([[Path("test-data/genotype0.tsv"),
                                    Path("test-data/genotype1.tsv"),
@@ -314,3 +1154,66 @@ def test_joint_workflow(tmp_path, genotype_files, only_center):
                  for genotype_file in genotype_files)])
     assert result.exit_code == 0
     assert complete_ciphertext.exists()
+
+# Run the pyhegp command with args in a fresh interpreter, and return
+# the modules among numpy, pandas and scipy that it loaded. Lazily
+# imported modules that were never used are not counted.
+LOADED_MODULES_SCRIPT = """
+import json, sys, types
+from pyhegp.pyhegp import main
+try:
+    main(sys.argv[1:])
+except SystemExit as error:
+    assert not error.code, error.code
+print(json.dumps(sorted(name for name in ("numpy", "pandas", "scipy")
+                        if type(sys.modules.get(name)) is types.ModuleType)),
+      file=sys.stderr)
+"""
+
+def loaded_modules(*args):
+    process = subprocess.run([sys.executable, "-c", LOADED_MODULES_SCRIPT, *args],
+                             capture_output=True, text=True, check=True)
+    return json.loads(process.stderr.splitlines()[-1])
+
+# Best time, in seconds, of several imports of module, each in a fresh
+# interpreter
+IMPORT_TIME_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+print(time.perf_counter() - start)
+"""
+
+def import_time(module):
+    return min(float(subprocess.run([sys.executable, "-c", IMPORT_TIME_SCRIPT, module],
+                                    capture_output=True, text=True,
+                                    check=True).stdout)
+               for _ in range(3))
+
+@pytest.mark.parametrize("args", [["--help"],
+                                  ["pool", "--help"],
+                                  ["encrypt", "--help"],
+                                  ["cat-phenotype", "--help"]])
+def test_help_loads_no_heavy_modules(args):
+    assert loaded_modules(*args) == []
+
+def test_cat_phenotype_command_loads_no_heavy_modules(tmp_path):
+    ciphertexts = [tmp_path / "phenotype1.tsv.hegp",
+                   tmp_path / "phenotype2.tsv.hegp"]
+    ciphertexts[0].write_text("sample-id\tweight\na\t1.5\n")
+    ciphertexts[1].write_text("sample-id\tweight\nb\t2.25\n")
+    assert loaded_modules("cat-phenotype",
+                          "-o", str(tmp_path / "complete-phenotype.tsv.hegp"),
+                          *map(str, ciphertexts)) == []
+
+def test_pool_command_does_not_load_scipy(tmp_path):
+    assert "scipy" not in loaded_modules("pool",
+                                         "-o", str(tmp_path / "complete-summary"),
+                                         "test-data/pool-test-summary1",
+                                         "test-data/pool-test-summary2")
+
+def test_entry_point_imports_faster_than_pandas():
+    # The entry point loads pandas, numpy and scipy only when a
+    # command needs them. So, importing it must cost less than
+    # importing pandas alone.
+    assert import_time("pyhegp.pyhegp") < import_time("pandas")
@@ -16,26 +16,49 @@
 ### You should have received a copy of the GNU General Public License
 ### along with pyhegp. If not, see <https://www.gnu.org/licenses/>.
 
+from pathlib import Path
 import tempfile
 
-from hypothesis import given, strategies as st
+from hypothesis import assume, given, strategies as st
+import numpy as np
 import pandas as pd
+import pytest
 from pytest import approx
 
-from pyhegp.serialization import read_summary, write_summary, read_summary_headers, read_genotype, write_genotype, read_phenotype, write_phenotype, read_key, write_key
+from pyhegp.serialization import KeySeed, is_genotype_metadata_column, read_summary, read_summary_chunks, write_summary, read_summary_headers, read_genotype, read_genotype_chunks, genotype_slices, read_genotype_slice, read_selected_genotype_chunks, read_selected_genotype_slice, Region, parse_region, write_genotype, write_genotype_chunks, read_phenotype, write_phenotype, read_key, write_key
 
-from helpers.strategies import summaries, genotype_frames, phenotype_frames, keys
+from pyhegp.utils import negate
 
-@given(summaries())
-def test_read_write_summary_are_inverses(summary):
+from helpers.pipes import pipe_reader
+from helpers.strategies import summaries, genotype_frames, phenotype_frames, keys, block_diagonal_keys
+
+key_block_sizes = st.lists(st.integers(min_value=2, max_value=10),
+                           min_size=1, max_size=5)
+
+@given(summaries(), st.sampled_from(["tsv", "binary"]))
+def test_read_write_summary_are_inverses(summary, format):
     with tempfile.TemporaryFile() as file:
-        write_summary(file, summary)
+        write_summary(file, summary, format)
         file.seek(0)
         recovered_summary = read_summary(file)
         pd.testing.assert_frame_equal(summary.data,
                                       recovered_summary.data)
         assert summary.n == recovered_summary.n
 
+@given(summaries(),
+       st.integers(min_value=1, max_value=10),
+       st.sampled_from(["tsv", "binary"]))
+def test_read_summary_chunks(summary, chunk_size, format):
+    with tempfile.TemporaryFile() as file:
+        write_summary(file, summary, format)
+        file.seek(0)
+        chunked_summary = read_summary_chunks(file, chunk_size)
+        chunks = list(chunked_summary.data)
+    assert chunked_summary.n == summary.n
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+    pd.testing.assert_frame_equal(summary.data,
+                                  pd.concat(chunks, ignore_index=True))
+
 @st.composite
 def properties_and_whitespace(draw):
     n = draw(st.integers(min_value=0, max_value=10))
@@ -65,13 +88,167 @@ def test_read_summary_headers_variable_whitespace(properties_and_whitespace):
         file.seek(0)
         assert properties == read_summary_headers(file)
 
-@given(genotype_frames())
-def test_read_write_genotype_are_inverses(genotype):
+@given(genotype_frames(), st.sampled_from(["tsv", "binary", "bgzf"]))
+def test_read_write_genotype_are_inverses(genotype, format):
     with tempfile.TemporaryFile() as file:
-        write_genotype(file, genotype)
+        write_genotype(file, genotype, format=format)
         file.seek(0)
         pd.testing.assert_frame_equal(genotype, read_genotype(file))
 
+@given(genotype_frames(),
+       st.integers(min_value=1, max_value=10),
+       st.sampled_from(["tsv", "binary", "bgzf"]))
+def test_read_write_genotype_chunks_are_inverses(genotype, chunk_size, format):
+    with tempfile.TemporaryFile() as file:
+        write_genotype_chunks(file,
+                              [genotype.iloc[start:start+chunk_size]
+                               for start in range(0, max(len(genotype), 1), chunk_size)],
+                              format=format)
+        file.seek(0)
+        chunks = list(read_genotype_chunks(file, chunk_size))
+        assert all(len(chunk) <= chunk_size for chunk in chunks)
+        pd.testing.assert_frame_equal(genotype,
+                                      pd.concat(chunks, ignore_index=True))
+
+@given(genotype_frames(),
+       st.integers(min_value=1, max_value=10),
+       st.sampled_from(["tsv", "binary"]))
+def test_genotype_slices_cover_genotype(genotype, chunk_size, format):
+    with tempfile.NamedTemporaryFile() as file:
+        write_genotype(file, genotype, format=format)
+        file.flush()
+        slices = genotype_slices(file, chunk_size)
+        pd.testing.assert_frame_equal(
+            genotype,
+            pd.concat([read_genotype_slice(slice) for slice in slices],
+                      ignore_index=True))
+
+@given(genotype_frames(),
+       st.data(),
+       st.one_of(st.none(), st.integers(min_value=1, max_value=10)),
+       st.sampled_from(["tsv", "binary"]))
+def test_read_selected_genotype_chunks_skips_unselected_snps(genotype, data,
+                                                             chunk_size,
+                                                             format):
+    keys = list(zip(genotype.chromosome, genotype.position.tolist()))
+    snps = set(data.draw(st.lists(st.sampled_from(keys))
+                         if keys
+                         else st.just([])))
+    selected = (genotype[np.array([key in snps for key in keys], dtype=bool)]
+                .reset_index(drop=True))
+    with tempfile.NamedTemporaryFile() as file:
+        write_genotype(file, genotype, format=format)
+        file.flush()
+        file.seek(0)
+        counted_chunks = list(read_selected_genotype_chunks(file, chunk_size, snps))
+        assert sum(snps_read for snps_read, _ in counted_chunks) == len(genotype)
+        pd.testing.assert_frame_equal(
+            selected,
+            pd.concat([chunk for _, chunk in counted_chunks], ignore_index=True),
+            check_index_type=False)
+        counted_slices = [read_selected_genotype_slice(slice, snps)
+                          for slice in genotype_slices(file, chunk_size or 10)]
+        assert sum(snps_read for snps_read, _ in counted_slices) == len(genotype)
+        pd.testing.assert_frame_equal(
+            selected,
+            pd.concat([chunk for _, chunk in counted_slices], ignore_index=True),
+            check_index_type=False)
+
+@given(genotype_frames(), st.booleans())
+def test_read_compact_genotype(genotype, hard_calls):
+    sample_names = list(filter(negate(is_genotype_metadata_column),
+                               genotype.columns))
+    if hard_calls:
+        genotype[sample_names] = genotype[sample_names].round() % 3
+    with tempfile.TemporaryFile() as file:
+        write_genotype(file, genotype)
+        file.seek(0)
+        compact_genotype = read_genotype(file, compact=True)
+    if hard_calls and len(sample_names) > 0:
+        assert (compact_genotype[sample_names].dtypes == "int8").all()
+    pd.testing.assert_frame_equal(genotype,
+                                  compact_genotype.astype(
+                                      {name: "float64" for name in sample_names}))
+
+@pytest.mark.parametrize("genotype_file",
+                         [Path("test-data/genotype.tsv"),
+                          Path("test-data/genotype-without-reference.tsv")])
+def test_read_compact_genotype_from_pipe(genotype_file):
+    with genotype_file.open("rb") as file:
+        expected_genotype = read_genotype(file, compact=True)
+    with pipe_reader(genotype_file.read_bytes()) as file:
+        pd.testing.assert_frame_equal(read_genotype(file, compact=True),
+                                      expected_genotype)
+
+@st.composite
+def genotypes_and_regions(draw):
+    genotype = draw(genotype_frames())
+    chromosome = draw(st.sampled_from(genotype.chromosome.tolist())
+                      if len(genotype) > 0
+                      else st.just("chr1"))
+    positions = st.one_of(st.none(),
+                          (st.sampled_from(genotype.position.tolist())
+                           if len(genotype) > 0
+                           else st.integers(min_value=0)))
+    return genotype, Region(chromosome, draw(positions), draw(positions))
+
+@given(genotypes_and_regions(),
+       st.one_of(st.none(), st.integers(min_value=1, max_value=10)),
+       st.sampled_from(["tsv", "binary", "bgzf"]),
+       st.booleans())
+def test_read_selected_genotype_chunks_in_region(genotype_and_region,
+                                                 chunk_size, format,
+                                                 indexed):
+    genotype, region = genotype_and_region
+    in_region = ((genotype.chromosome == region.chromosome)
+                 & (genotype.position >= (region.start or 0))
+                 & ((genotype.position <= region.end)
+                    if region.end is not None
+                    else True))
+    expected_genotype = genotype[in_region.to_numpy(dtype=bool)].reset_index(drop=True)
+    with tempfile.TemporaryDirectory() as directory:
+        # Only compressed genotypes written to named files are indexed.
+        path = Path(directory) / "genotype"
+        with (path.open("w+b")
+              if indexed
+              else tempfile.TemporaryFile(dir=directory)) as file:
+            write_genotype(file, genotype, format=format)
+            file.seek(0)
+            counted_chunks = list(read_selected_genotype_chunks(file, chunk_size,
+                                                                region=region))
+    assert (sum(snps_read for snps_read, _ in counted_chunks)
+            == len(expected_genotype))
+    pd.testing.assert_frame_equal(
+        expected_genotype,
+        pd.concat([chunk for _, chunk in counted_chunks], ignore_index=True),
+        check_index_type=False)
+
+def test_parse_region():
+    assert parse_region("chr1") == Region("chr1", None, None)
+    assert parse_region("chr1:1,000-2,000") == Region("chr1", 1000, 2000)
+    assert parse_region("chr1:1000-") == Region("chr1", 1000, None)
+    assert parse_region("HLA:1:10-20") == Region("HLA:1", 10, 20)
+    for text in ["chr1:", "chr1:10", "chr1:a-b", ":10-20"]:
+        with pytest.raises(ValueError):
+            parse_region(text)
+
+@given(genotype_frames(number_of_samples=st.integers(min_value=1,
+                                                     max_value=10)))
+def test_read_binary_genotype_memory_maps_dosages(genotype):
+    with tempfile.TemporaryFile() as file:
+        write_genotype(file, genotype, format="binary")
+        file.seek(0)
+        recovered_genotype = read_genotype(file)
+    assume(len(genotype) > 0)
+    sample_names = list(filter(negate(is_genotype_metadata_column),
+                               genotype.columns))
+    def bases(array):
+        while array is not None:
+            yield array
+            array = getattr(array, "base", None)
+    assert any(isinstance(base, np.memmap)
+               for base in bases(recovered_genotype[sample_names].to_numpy()))
+
 @given(phenotype_frames())
 def test_read_write_phenotype_are_inverses(phenotype):
     with tempfile.TemporaryFile() as file:
@@ -79,9 +256,41 @@ def test_read_write_phenotype_are_inverses(phenotype):
         file.seek(0)
         pd.testing.assert_frame_equal(phenotype, read_phenotype(file))
 
-@given(keys(st.integers(min_value=2, max_value=10)))
-def test_read_write_key_are_inverses(key):
+@given(keys(st.integers(min_value=2, max_value=10)),
+       st.sampled_from([1, 2]))
+def test_read_write_key_are_inverses(key, version):
+    with tempfile.TemporaryFile() as file:
+        write_key(file, key, version=version)
+        file.seek(0)
+        assert key == approx(read_key(file).__array__(), nan_ok=True)
+
+@given(block_diagonal_keys(key_block_sizes),
+       st.sampled_from([1, 2]))
+def test_read_key_preserves_blocks(key, version):
+    with tempfile.TemporaryFile() as file:
+        write_key(file, key, version=version)
+        file.seek(0)
+        recovered_key = read_key(file)
+    assert ([len(block) for block in recovered_key.blocks]
+            == [len(block) for block in key.blocks])
+    assert key.__array__() == approx(recovered_key.__array__(),
+                                     rel=1e-6, abs=1e-6)
+
+@given(block_diagonal_keys(key_block_sizes))
+def test_read_key_memory_maps_blocks(key):
     with tempfile.TemporaryFile() as file:
         write_key(file, key)
         file.seek(0)
-        assert key == approx(read_key(file), nan_ok=True)
+        assert all(isinstance(block, np.memmap)
+                   for block in read_key(file).blocks)
+
+@given(st.builds(KeySeed,
+                 st.just("PCG64"),
+                 st.sampled_from(["scipy", "qr"]),
+                 st.integers(min_value=0, max_value=2**128-1),
+                 key_block_sizes))
+def test_read_write_key_seed_are_inverses(key_seed):
+    with tempfile.TemporaryFile() as file:
+        write_key(file, key_seed)
+        file.seek(0)
+        assert key_seed == read_key(file)